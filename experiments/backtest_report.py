@@ -0,0 +1,98 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares one-pass backtests with one forecast per cutoff.
+
+Usage:
+  python -m experiments.backtest_report --checkpoint=/path/model.safetensors
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import timesfm
+
+from . import synthetic
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--checkpoint", default=None)
+  parser.add_argument(
+      "--random_init",
+      action="store_true",
+      help="Use random weights instead of a checkpoint, for smoke tests only.",
+  )
+  parser.add_argument("--num_series", type=int, default=16)
+  parser.add_argument("--context", type=int, default=1024)
+  parser.add_argument("--horizon", type=int, default=64)
+  parser.add_argument("--num_cutoffs", type=int, default=100)
+  parser.add_argument("--batch_size", type=int, default=16)
+  args = parser.parse_args()
+
+  # Every cutoff has the full context before it.
+  length = args.context + 32 * (args.num_cutoffs - 1) + args.horizon
+  series, _ = synthetic.make_suite(args.num_series, length, 0)
+  series = [np.nan_to_num(s, nan=np.nanmean(s)) for s in series]
+  cutoffs = length - args.horizon - 32 * np.arange(args.num_cutoffs)[::-1]
+  config = timesfm.ForecastConfig(
+      max_context=args.context,
+      max_horizon=args.horizon,
+      per_core_batch_size=args.batch_size,
+  )
+  model = synthetic.load_model(args.checkpoint, args.random_init)
+  model.compile(config)
+
+  start = time.perf_counter()
+  results = timesfm.backtest(
+      model.model,
+      series,
+      args.horizon,
+      config,
+      cutoffs=cutoffs,
+  )
+  one_pass_seconds = time.perf_counter() - start
+
+  start = time.perf_counter()
+  forecasts = np.stack(
+      [
+          model.forecast(
+              horizon=args.horizon,
+              inputs=[s[c - args.context : c] for s in series],
+          )[0]
+          for c in cutoffs
+      ],
+      axis=1,
+  )
+  looped_seconds = time.perf_counter() - start
+
+  one_pass = np.stack([r.point_forecast for r in results])
+  targets = np.stack(
+      [[s[c : c + args.horizon] for c in cutoffs] for s in series]
+  )
+  print("| method | MAE | time (s) |")
+  print("|---|---|---|")
+  for name, point, seconds in [
+      ("one forecast per cutoff", forecasts, looped_seconds),
+      ("one-pass backtest", one_pass, one_pass_seconds),
+  ]:
+    print(
+        f"| {name} | {np.mean(np.abs(point - targets)):.4f} |"
+        f" {seconds:.3f} |"
+    )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,86 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reports the accuracy and speed of the int8 model against float32.
+
+Usage:
+  python -m experiments.int8_report --checkpoint=/path/model.safetensors
+"""
+
+import argparse
+
+import numpy as np
+
+import timesfm
+from timesfm.timesfm_2p5 import timesfm_2p5_int8
+
+from . import synthetic
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--checkpoint", default=None)
+  parser.add_argument(
+      "--random_init",
+      action="store_true",
+      help="Use random weights instead of a checkpoint, for smoke tests only.",
+  )
+  parser.add_argument("--num_series", type=int, default=64)
+  parser.add_argument("--context", type=int, default=1024)
+  parser.add_argument("--horizon", type=int, default=128)
+  parser.add_argument("--batch_size", type=int, default=32)
+  args = parser.parse_args()
+
+  contexts, targets = synthetic.make_suite(
+      args.num_series, args.context, args.horizon
+  )
+  config = timesfm.ForecastConfig(
+      max_context=args.context,
+      max_horizon=args.horizon,
+      per_core_batch_size=args.batch_size,
+  )
+  model = synthetic.load_model(args.checkpoint, args.random_init)
+  model.compile(config)
+  results = {
+      "float32": synthetic.timed_forecast(model, args.horizon, contexts)
+      + (synthetic.weight_bytes(model.model),)
+  }
+
+  # Quantize the float model in place, which also folds its weights.
+  quantized = timesfm.TimesFM_2p5_200M_torch_int8()
+  quantized.model = model.model
+  timesfm_2p5_int8.quantize_module(quantized.model)
+  quantized.compile(config)
+  results["int8"] = synthetic.timed_forecast(
+      quantized, args.horizon, contexts
+  ) + (synthetic.weight_bytes(quantized.model),)
+
+  reference = results["float32"][0]
+  scale = np.maximum(np.std(reference, axis=1, keepdims=True), 1e-12)
+  print(
+      "| model | MASE | quantile loss | mean / max |diff| vs float32 "
+      "(in std) | time (s) | weights (MB) |"
+  )
+  print("|---|---|---|---|---|---|")
+  for name, (point, quantiles, seconds, nbytes) in results.items():
+    diff = np.abs(point - reference) / scale
+    print(
+        f"| {name} | {synthetic.mase(point, targets, contexts):.4f} |"
+        f" {synthetic.scaled_quantile_loss(quantiles, targets):.4f} |"
+        f" {np.mean(diff):.2e} / {np.max(diff):.2e} | {seconds:.3f} |"
+        f" {nbytes / 2**20:.0f} |"
+    )
+
+
+if __name__ == "__main__":
+  main()
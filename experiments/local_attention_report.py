@@ -0,0 +1,107 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reports the accuracy and speed of local attention on long contexts.
+
+Usage:
+  python -m experiments.local_attention_report \
+      --checkpoint=/path/model.safetensors
+"""
+
+import argparse
+
+import numpy as np
+
+import timesfm
+
+from . import synthetic
+
+
+def decode_cache_bytes(
+    model: timesfm.TimesFM_2p5_200M_torch,
+    config: timesfm.ForecastConfig,
+    horizon: int,
+) -> int:
+  """Bytes of the keys and values cached for one series during decoding."""
+  module = model.model
+  if config.attention_window > 0:
+    slots = config.num_global_patches + config.attention_window + module.m
+  else:
+    num_steps = (horizon - 1) // module.o
+    slots = config.max_context // module.p + num_steps * module.m
+  return 2 * module.x * slots * module.h * module.hd * 4
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--checkpoint", default=None)
+  parser.add_argument(
+      "--random_init",
+      action="store_true",
+      help="Use random weights instead of a checkpoint, for smoke tests only.",
+  )
+  parser.add_argument("--num_series", type=int, default=16)
+  parser.add_argument("--context", type=int, default=8192)
+  parser.add_argument("--horizon", type=int, default=512)
+  parser.add_argument("--batch_size", type=int, default=16)
+  parser.add_argument(
+      "--windows",
+      default="32:0,32:8,64:0,64:8,128:8",
+      help="Comma separated window:num_global_patches pairs, in patches.",
+  )
+  args = parser.parse_args()
+
+  contexts, targets = synthetic.make_long_seasonal_suite(
+      args.num_series, args.context, args.horizon
+  )
+  model = synthetic.load_model(args.checkpoint, args.random_init)
+  settings = [(0, 0)] + [
+      tuple(int(v) for v in pair.split(":"))
+      for pair in args.windows.split(",")
+  ]
+  results = {}
+  for window, num_global in settings:
+    config = timesfm.ForecastConfig(
+        max_context=args.context,
+        max_horizon=args.horizon,
+        per_core_batch_size=args.batch_size,
+        attention_window=window,
+        num_global_patches=num_global,
+    )
+    model.compile(config)
+    results[(window, num_global)] = synthetic.timed_forecast(
+        model, args.horizon, contexts, num_repeats=1
+    ) + (decode_cache_bytes(model, config, args.horizon),)
+
+  reference = results[(0, 0)][0]
+  scale = np.maximum(np.std(reference, axis=1, keepdims=True), 1e-12)
+  print(
+      "| window | global patches | MASE | quantile loss | mean / max |diff|"
+      " vs full (in std) | time (s) | KV cache per series (MB) |"
+  )
+  print("|---|---|---|---|---|---|---|")
+  for (window, num_global), (point, quantiles, seconds, nbytes) in (
+      results.items()
+  ):
+    diff = np.abs(point - reference) / scale
+    print(
+        f"| {window or 'full'} | {num_global} |"
+        f" {synthetic.mase(point, targets, contexts):.4f} |"
+        f" {synthetic.scaled_quantile_loss(quantiles, targets):.4f} |"
+        f" {np.mean(diff):.2e} / {np.max(diff):.2e} | {seconds:.3f} |"
+        f" {nbytes / 2**20:.2f} |"
+    )
+
+
+if __name__ == "__main__":
+  main()
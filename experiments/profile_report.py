@@ -0,0 +1,72 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Profiles the stages and layers of a batched forecast.
+
+Usage:
+  python -m experiments.profile_report --checkpoint=/path/model.safetensors \
+      --trace=/tmp/trace.json
+"""
+
+import argparse
+
+import timesfm
+
+from . import synthetic
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--checkpoint", default=None)
+  parser.add_argument(
+      "--random_init",
+      action="store_true",
+      help="Use random weights instead of a checkpoint, for smoke tests only.",
+  )
+  parser.add_argument("--num_series", type=int, default=64)
+  parser.add_argument("--context", type=int, default=1024)
+  parser.add_argument("--horizon", type=int, default=256)
+  parser.add_argument("--batch_size", type=int, default=32)
+  parser.add_argument("--record_memory", action="store_true")
+  parser.add_argument("--trace", default=None, help="Chrome trace output.")
+  parser.add_argument("--summary", default=None, help="JSON summary output.")
+  args = parser.parse_args()
+
+  contexts, _ = synthetic.make_suite(
+      args.num_series, args.context, args.horizon
+  )
+  model = synthetic.load_model(args.checkpoint, args.random_init)
+  model.compile(
+      timesfm.ForecastConfig(
+          max_context=args.context,
+          max_horizon=args.horizon,
+          per_core_batch_size=args.batch_size,
+      )
+  )
+  # Warm up outside of the profile.
+  model.forecast(horizon=args.horizon, inputs=contexts)
+  with timesfm.Profiler(
+      modules=model.model.profiled_modules(),
+      record_memory=args.record_memory,
+  ) as profiler:
+    model.forecast(horizon=args.horizon, inputs=contexts)
+
+  print(profiler.summary_table())
+  if args.trace:
+    profiler.save_chrome_trace(args.trace)
+  if args.summary:
+    profiler.save_summary(args.summary)
+
+
+if __name__ == "__main__":
+  main()
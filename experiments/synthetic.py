@@ -0,0 +1,171 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Fixed synthetic suite and helpers shared by the inference reports."""
+
+import time
+
+import numpy as np
+import torch
+
+import timesfm
+
+QUANTILES = np.arange(1, 10) / 10.0
+
+
+def make_suite(
+    num_series: int, context: int, horizon: int, seed: int = 0
+) -> tuple[list[np.ndarray], np.ndarray]:
+  """Returns a deterministic mix of synthetic series.
+
+  The suite cycles through seasonal, trending, random-walk, intermittent and
+  level-shifted series at magnitudes spanning seven orders of magnitude, with
+  a few missing values.
+
+  Args:
+    num_series: Number of series.
+    context: Length of the context of every series.
+    horizon: Length of the held-out target of every series.
+    seed: Random seed.
+
+  Returns:
+    The contexts and the targets, of shape [num_series, horizon].
+  """
+  rng = np.random.default_rng(seed)
+  t = np.arange(context + horizon, dtype=np.float64)
+  contexts, targets = [], []
+  for i in range(num_series):
+    kind = i % 5
+    noise = rng.normal(size=t.shape)
+    if kind == 0:
+      period = rng.choice([7, 12, 24, 52])
+      x = np.sin(2 * np.pi * t / period) + 0.1 * noise
+    elif kind == 1:
+      x = 0.01 * t + np.sin(2 * np.pi * t / 24) + 0.2 * noise
+    elif kind == 2:
+      x = np.cumsum(noise)
+    elif kind == 3:
+      x = rng.poisson(0.3, size=t.shape) * rng.exponential(5.0, size=t.shape)
+    else:
+      x = np.where(t > rng.uniform(0.3, 0.7) * len(t), 3.0, 0.0) + 0.3 * noise
+    x = x * 10.0 ** rng.integers(-3, 5) + rng.normal(scale=5.0)
+    x = x.astype(np.float32)
+    if i % 7 == 0:
+      x[rng.integers(0, context, size=context // 50)] = np.nan
+    contexts.append(x[:context])
+    targets.append(x[context:])
+  return contexts, np.stack(targets)
+
+
+def make_long_seasonal_suite(
+    num_series: int, context: int, horizon: int, seed: int = 0
+) -> tuple[list[np.ndarray], np.ndarray]:
+  """Returns series whose dominant seasonality spans thousands of points.
+
+  Every series sums a long period of 1000 to 3000 points, e.g. a week of
+  5-minute data, a short period of 24 to 288 points and noise, so that a
+  forecast benefits from a context covering several long periods.
+
+  Args:
+    num_series: Number of series.
+    context: Length of the context of every series.
+    horizon: Length of the held-out target of every series.
+    seed: Random seed.
+
+  Returns:
+    The contexts and the targets, of shape [num_series, horizon].
+  """
+  rng = np.random.default_rng(seed)
+  t = np.arange(context + horizon, dtype=np.float64)
+  contexts, targets = [], []
+  for _ in range(num_series):
+    long_period = rng.uniform(1000, 3000)
+    short_period = rng.choice([24, 96, 288])
+    x = (
+        2.0 * np.sin(2 * np.pi * t / long_period + rng.uniform(0, 2 * np.pi))
+        + 0.5 * np.sin(2 * np.pi * t / short_period)
+        + 0.2 * rng.normal(size=t.shape)
+    )
+    x = (x * 10.0 ** rng.integers(-1, 3) + rng.normal(scale=5.0)).astype(
+        np.float32
+    )
+    contexts.append(x[:context])
+    targets.append(x[context:])
+  return contexts, np.stack(targets)
+
+
+def mase(
+    forecasts: np.ndarray, targets: np.ndarray, contexts: list[np.ndarray]
+) -> float:
+  """Mean absolute scaled error against the one-step naive forecast."""
+  scales = np.array(
+      [np.nanmean(np.abs(np.diff(c))) for c in contexts], dtype=np.float64
+  )
+  errors = np.mean(np.abs(forecasts - targets), axis=1)
+  return float(np.mean(errors / np.maximum(scales, 1e-12)))
+
+
+def scaled_quantile_loss(
+    quantile_forecasts: np.ndarray, targets: np.ndarray
+) -> float:
+  """Mean quantile loss over the deciles, relative to the mean |target|."""
+  errors = targets[..., None] - quantile_forecasts[..., 1:]
+  loss = np.maximum(QUANTILES * errors, (QUANTILES - 1) * errors)
+  return float(
+      np.mean(
+          np.mean(loss, axis=(1, 2))
+          / np.maximum(np.mean(np.abs(targets), axis=1), 1e-12)
+      )
+  )
+
+
+def load_model(
+    checkpoint: str | None, random_init: bool
+) -> timesfm.TimesFM_2p5_200M_torch:
+  """Loads a fresh model from a checkpoint or with random weights."""
+  model = timesfm.TimesFM_2p5_200M_torch()
+  if random_init:
+    torch.manual_seed(0)
+    model.model.to_empty(device=model.model.device)
+    with torch.no_grad():
+      for param in model.model.parameters():
+        param.normal_(0.0, 0.05)
+  elif checkpoint:
+    model.load_checkpoint(path=checkpoint)
+  else:
+    model.load_checkpoint()
+  return model
+
+
+def timed_forecast(
+    model: timesfm.TimesFM_2p5_200M_torch,
+    horizon: int,
+    contexts: list[np.ndarray],
+    num_repeats: int = 3,
+) -> tuple[np.ndarray, np.ndarray, float]:
+  """Forecasts after a warm-up call, returning the best wall time."""
+  model.forecast(horizon=horizon, inputs=contexts)
+  best = float("inf")
+  for _ in range(num_repeats):
+    start = time.perf_counter()
+    point, quantiles = model.forecast(horizon=horizon, inputs=contexts)
+    best = min(best, time.perf_counter() - start)
+  return point, quantiles, best
+
+
+def weight_bytes(module: torch.nn.Module) -> int:
+  """Bytes held by the parameters and buffers of a module."""
+  return sum(
+      t.numel() * t.element_size()
+      for t in list(module.parameters()) + list(module.buffers())
+  )
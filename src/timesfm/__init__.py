@@ -14,7 +14,32 @@
 
 """TimesFM API."""
 
+import importlib.util
+
 from .configs import ForecastConfig
-from .timesfm_2p5 import timesfm_2p5_torch
+from .timesfm_2p5 import timesfm_2p5_batching
+from .timesfm_2p5 import timesfm_2p5_cache
+from .timesfm_2p5 import timesfm_2p5_profiling
+
+ForecastBatcher = timesfm_2p5_batching.ForecastBatcher
+ForecastCache = timesfm_2p5_cache.ForecastCache
+Profiler = timesfm_2p5_profiling.Profiler
+
+# The backends are only exported if their framework is installed, so that
+# e.g. the onnxruntime backend can be deployed without torch.
+if importlib.util.find_spec("torch") is not None:
+  from .timesfm_2p5 import timesfm_2p5_backtest
+  from .timesfm_2p5 import timesfm_2p5_int8
+  from .timesfm_2p5 import timesfm_2p5_session
+  from .timesfm_2p5 import timesfm_2p5_torch
+
+  BacktestResult = timesfm_2p5_backtest.BacktestResult
+  ForecastSession = timesfm_2p5_session.ForecastSession
+  TimesFM_2p5_200M_torch = timesfm_2p5_torch.TimesFM_2p5_200M_torch
+  TimesFM_2p5_200M_torch_int8 = timesfm_2p5_int8.TimesFM_2p5_200M_torch_int8
+  backtest = timesfm_2p5_backtest.backtest
+
+if importlib.util.find_spec("onnxruntime") is not None:
+  from .timesfm_2p5 import timesfm_2p5_onnx
 
-TimesFM_2p5_200M_torch = timesfm_2p5_torch.TimesFM_2p5_200M_torch
+  TimesFM_2p5_200M_onnx = timesfm_2p5_onnx.TimesFM_2p5_200M_onnx
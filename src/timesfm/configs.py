@@ -46,6 +46,50 @@ class ForecastConfig:
       input is nonnegative.
     fix_quantile_crossing: Whether to fix quantile crossing.
     return_backcast: Whether to return backcast.
+    bucket_by_length: Whether to group the inputs by their effective length
+      (rounded up to a multiple of the input patch length) and decode each
+      group at its own context length, instead of left-padding every input to
+      max_context. Outputs are returned in the original input order. When
+      return_backcast is also set, backcasts of shorter buckets are left-padded
+      with NaNs to the max_context layout.
+    attention_backend: The attention implementation to use. "eager" computes
+      attention with explicit einsums and a dense mask. "sdpa" routes through
+      the fused scaled dot-product attention kernels of the framework.
+    num_cpu_workers: The number of CPU worker processes to shard every batch
+      across when no accelerator is available. Each worker holds a replica of
+      the model. Weights still memory-mapped from the checkpoint are mapped
+      again by every worker and share the page cache; other weights, e.g.
+      cast to a lower precision, are copied once into shared memory. 0 or 1
+      decodes in the calling process. On hosts with several accelerators,
+      batches are sharded across all of them regardless of this flag.
+    precision: The dtype of the weights, activations and decode caches of the
+      transformer. "bfloat16" and "float16" halve the memory traffic; the
+      input normalization, the running stats, the output renormalization and
+      the attention softmax are still computed in float32. Lowering the
+      precision casts the loaded weights, so going back to "float32" requires
+      reloading the checkpoint.
+    pack_inputs: Whether to pack the unpadded patches of several short series
+      into shared rows of the transformer stack, with a block-diagonal
+      attention mask, instead of running every left-padded series in its own
+      row. This saves the compute of padded patches when many series are
+      shorter than max_context and does not change results. The
+      per_core_batch_size then counts series, not rows. Not supported with
+      return_backcast.
+    attention_window: If positive, every patch only attends to this many most
+      recent patches of its series, itself included, plus the first
+      num_global_patches ones. The attention cost becomes linear in the
+      context and the decode caches have a fixed size, at some accuracy cost
+      for patterns longer than the window. 0 uses full causal attention.
+    num_global_patches: Number of leading patches of every series that all
+      patches attend to with an attention_window, as a summary of the
+      distant past.
+    kv_cache_precision: The storage dtype of the keys and values in the
+      decode caches, which dominate the memory of large-batch decoding.
+      "auto" stores them in `precision`. "float16" and "bfloat16" halve the
+      cache of a float32 model, "int8" stores them with one float32 scale per
+      patch and head, about a quarter of float32. Keys and values are
+      dequantized to `precision` inside attention. Ignored with an
+      attention_window, whose caches are small and fixed.
   """
 
   max_context: int = 0
@@ -58,6 +102,14 @@ class ForecastConfig:
   infer_is_positive: bool = True
   fix_quantile_crossing: bool = False
   return_backcast: bool = False
+  bucket_by_length: bool = False
+  attention_backend: Literal["eager", "sdpa"] = "eager"
+  num_cpu_workers: int = 0
+  precision: Literal["float32", "bfloat16", "float16"] = "float32"
+  pack_inputs: bool = False
+  attention_window: int = 0
+  num_global_patches: int = 0
+  kv_cache_precision: Literal["auto", "float16", "bfloat16", "int8"] = "auto"
 
 
 @dataclasses.dataclass(frozen=True)
@@ -0,0 +1,304 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rolling-origin backtests of TimesFM 2.5 from one prefill per series.
+
+Both the patch normalization and the attention of TimesFM 2.5 are causal, so
+the point head output of the prefill at every patch is the forecast the model
+would make from the context ending at that patch. A backtest over many
+cutoffs therefore only needs one prefill per series, with the point head run
+on all patches, instead of one forecast per cutoff.
+"""
+
+import dataclasses
+from typing import Sequence
+import warnings
+
+import numpy as np
+import torch
+
+from .. import configs
+from . import timesfm_2p5_torch
+
+QUANTILES = np.arange(1, 10) / 10.0
+
+
+@dataclasses.dataclass(frozen=True)
+class BacktestResult:
+  """Forecasts and errors of one series at every cutoff.
+
+  Attributes:
+    cutoffs: Index of the first forecast point of every cutoff, shape [k].
+      The forecast at cutoff c is made from series[:c].
+    point_forecast: Point forecasts of shape [k, horizon].
+    quantile_forecast: Mean and decile forecasts of shape [k, horizon, q].
+    mae: Mean absolute error against the realized future, shape [k].
+    mase: MAE scaled by the in-sample MAE of the seasonal naive forecast on
+      series[:c], shape [k].
+    quantile_loss: Mean pinball loss over the deciles, shape [k].
+  """
+
+  cutoffs: np.ndarray
+  point_forecast: np.ndarray
+  quantile_forecast: np.ndarray
+  mae: np.ndarray
+  mase: np.ndarray
+  quantile_loss: np.ndarray
+
+  def summary(self) -> dict[str, float]:
+    """Returns the metrics averaged over the cutoffs, ignoring NaNs."""
+    with warnings.catch_warnings():
+      warnings.simplefilter("ignore", RuntimeWarning)
+      return {
+          name: float(np.nanmean(getattr(self, name)))
+          for name in ("mae", "mase", "quantile_loss")
+      }
+
+
+@dataclasses.dataclass(frozen=True)
+class _Row:
+  """One prefill row: a window of a series and the cutoffs it serves."""
+
+  series: int
+  start: int
+  end: int
+  cutoffs: np.ndarray
+
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+  """Replaces NaNs with the previous valid value, leading NaNs with 0."""
+  index = np.where(np.isnan(values), -1, np.arange(len(values)))
+  index = np.maximum.accumulate(index)
+  return np.where(index >= 0, values[np.maximum(index, 0)], 0.0).astype(
+      np.float32
+  )
+
+
+def _make_rows(
+    series: int,
+    cutoffs: np.ndarray,
+    first_valid: int,
+    max_span: int,
+    min_context: int,
+    patch_len: int,
+) -> list[_Row]:
+  """Groups the cutoffs of a series into as few prefill rows as possible.
+
+  Cutoffs served by one row share its patch grid, so they must be congruent
+  modulo the patch length. Every row ends at its last cutoff and spans at
+  most `max_span` points; it serves the cutoffs with at least `min_context`
+  points of its window before them, or with all of their history in it.
+  """
+  rows = []
+  for residue in np.unique(cutoffs % patch_len):
+    remaining = np.sort(cutoffs[cutoffs % patch_len == residue])
+    while len(remaining):
+      end = int(remaining[-1])
+      start = max(first_valid, end - max_span)
+      served = (remaining - start >= min(min_context, max_span)) | (
+          start == first_valid
+      )
+      rows.append(_Row(series, start, end, remaining[served]))
+      remaining = remaining[~served]
+  return rows
+
+
+def _naive_scales(values: np.ndarray, seasonality: int) -> np.ndarray:
+  """In-sample MAE of the seasonal naive forecast on every prefix.
+
+  Returns:
+    An array of shape [len(values) + 1] whose entry c is the MAE of
+    values[t - seasonality] as a forecast of values[t] for t < c, ignoring
+    NaNs, or NaN if there is no such pair.
+  """
+  errors = np.abs(values[seasonality:] - values[:-seasonality])
+  is_valid = ~np.isnan(errors)
+  sums = np.concatenate([[0.0], np.cumsum(np.where(is_valid, errors, 0.0))])
+  counts = np.concatenate([[0], np.cumsum(is_valid)])
+  prefix = np.maximum(np.arange(len(values) + 1) - seasonality, 0)
+  with np.errstate(divide="ignore", invalid="ignore"):
+    scales = sums[prefix] / counts[prefix]
+  return np.where((counts[prefix] > 0) & (scales > 0), scales, np.nan)
+
+
+def _prefill_rows(
+    model: timesfm_2p5_torch.TimesFM_2p5_200M_torch_module,
+    values: list[np.ndarray],
+    rows: list[_Row],
+    horizon: int,
+    forecast_config: configs.ForecastConfig,
+) -> list[np.ndarray]:
+  """Returns the quantile forecasts of every cutoff of a batch of rows."""
+  fc = forecast_config
+  p = model.p
+  context = max(-(-(row.end - row.start) // p) * p for row in rows)
+  inputs = np.zeros((len(rows), context), dtype=np.float32)
+  masks = np.ones((len(rows), context), dtype=bool)
+  for i, row in enumerate(rows):
+    inputs[i, context - (row.end - row.start) :] = values[row.series][
+        row.start : row.end
+    ]
+    masks[i, context - (row.end - row.start) :] = False
+
+  inputs = torch.as_tensor(inputs, device=model.device)
+  masks = torch.as_tensor(masks, device=model.device)
+  if fc.force_flip_invariance:
+    inputs = torch.cat([inputs, -inputs], dim=0)
+    masks = torch.cat([masks, masks], dim=0)
+  with torch.no_grad():
+    outputs, _, _ = model.prefill(
+        inputs,
+        masks,
+        None,
+        return_all_patches=True,
+        return_quantile_spread=False,
+    )
+  if fc.force_flip_invariance:
+    outputs, flipped_outputs = torch.split(outputs, len(rows))
+    outputs = (outputs - timesfm_2p5_torch.flip_quantiles(flipped_outputs)) / 2
+
+  forecasts = []
+  num_patches = context // p
+  for i, row in enumerate(rows):
+    # The patch ending right before cutoff c, counted from the last patch.
+    patch = num_patches - 1 - (row.end - row.cutoffs) // p
+    forecast = outputs[i, torch.as_tensor(patch), :horizon]
+    if fc.fix_quantile_crossing:
+      forecast = timesfm_2p5_torch.fix_quantile_crossing(forecast)
+    forecast = forecast.cpu().numpy()
+    if fc.infer_is_positive:
+      window = values[row.series][row.start : row.end]
+      num_negative = np.concatenate([[0], np.cumsum(window < 0)])
+      is_positive = num_negative[row.cutoffs - row.start] == 0
+      forecast = np.where(
+          is_positive[:, None, None], np.maximum(forecast, 0.0), forecast
+      )
+    forecasts.append(forecast)
+  return forecasts
+
+
+def backtest(
+    model: timesfm_2p5_torch.TimesFM_2p5_200M_torch_module,
+    inputs: Sequence[np.ndarray],
+    horizon: int,
+    forecast_config: configs.ForecastConfig,
+    *,
+    cutoffs: Sequence[int] | None = None,
+    min_context: int | None = None,
+    seasonality: int = 1,
+    batch_size: int | None = None,
+) -> list[BacktestResult]:
+  """Backtests every series at many cutoffs with one prefill per series.
+
+  The cutoffs of a series share prefills spanning up to the context limit of
+  the model, so the forecast at cutoff c is made from the points of
+  series[:c] since the start of its prefill: at least `min_context` points,
+  when the series has them, and up to the context limit. It therefore
+  matches `TimesFM_2p5_200M_torch.forecast(horizon, [series[:c]])` whenever
+  series[:c] fits within max_context. Cutoffs that are not congruent modulo
+  the input patch length, or too far apart to share a prefill, are served by
+  separate prefills.
+
+  Missing values are forward filled, rather than interpolated as in
+  `forecast`, so that no cutoff sees future points. Of the forecasting flags,
+  force_flip_invariance, infer_is_positive and fix_quantile_crossing are
+  honoured. The quantiles come from the point head, as with
+  use_continuous_quantile_head=False, since the quantile head only runs on
+  the last patch. normalize_inputs is ignored since the model is invariant to
+  affine rescaling of its inputs.
+
+  Args:
+    model: A TimesFM 2.5 torch module with loaded weights.
+    inputs: The series to backtest.
+    horizon: Number of points forecast at every cutoff, at most one output
+      patch.
+    forecast_config: Forecasting flags.
+    cutoffs: Cutoffs to evaluate every series at, negative ones counting from
+      the end of the series. Cutoffs without a full horizon of realized
+      future or without any observed point before them are dropped. Defaults
+      to every input patch length points, ending `horizon` points before the
+      end of every series.
+    min_context: Minimum number of points before a cutoff within the window
+      of its prefill, or all points before it if there are fewer. Defaults
+      to max_context. Smaller values let more cutoffs share a prefill.
+    seasonality: Seasonality of the naive forecast scaling the MASE.
+    batch_size: Number of prefill rows run together. Defaults to
+      per_core_batch_size.
+
+  Returns:
+    One BacktestResult per series.
+  """
+  fc = forecast_config
+  p, o = model.p, model.o
+  if not 0 < horizon <= o:
+    raise ValueError(f"Backtest horizons must be in [1, {o}]: {horizon}.")
+  batch_size = batch_size or fc.per_core_batch_size
+  if min_context is None:
+    min_context = fc.max_context
+  max_span = model.config.context_limit - o
+
+  values, series_cutoffs, rows = [], [], []
+  for s, series in enumerate(inputs):
+    series = np.asarray(series, dtype=np.float32).reshape(-1)
+    is_valid = ~np.isnan(series)
+    first_valid = int(np.argmax(is_valid)) if np.any(is_valid) else len(series)
+    if cutoffs is None:
+      c = np.arange(len(series) - horizon, 0, -p)[::-1]
+    else:
+      c = np.asarray(cutoffs, dtype=np.int64)
+      c = np.where(c < 0, c + len(series), c)
+    c = np.unique(c[(c > first_valid) & (c + horizon <= len(series))])
+    values.append(_forward_fill(series))
+    series_cutoffs.append(c)
+    if len(c):
+      rows.extend(_make_rows(s, c, first_valid, max_span, min_context, p))
+
+  # Sort rows by length so that batches waste little padding.
+  rows.sort(key=lambda row: row.end - row.start)
+  forecasts: list[list[tuple[np.ndarray, np.ndarray]]] = [[] for _ in inputs]
+  for start in range(0, len(rows), batch_size):
+    batch = rows[start : start + batch_size]
+    for row, forecast in zip(
+        batch, _prefill_rows(model, values, batch, horizon, fc)
+    ):
+      forecasts[row.series].append((row.cutoffs, forecast))
+
+  results = []
+  for s, series in enumerate(inputs):
+    series = np.asarray(series, dtype=np.float32).reshape(-1)
+    c = series_cutoffs[s]
+    quantile_forecast = np.zeros((len(c), horizon, model.q), np.float32)
+    for row_cutoffs, forecast in forecasts[s]:
+      quantile_forecast[np.searchsorted(c, row_cutoffs)] = forecast
+    point_forecast = quantile_forecast[..., 5]
+    targets = series[c[:, None] + np.arange(horizon)]
+    with warnings.catch_warnings():
+      # Targets that are all NaN give NaN errors.
+      warnings.simplefilter("ignore", RuntimeWarning)
+      mae = np.nanmean(np.abs(point_forecast - targets), axis=1)
+      errors = targets[..., None] - quantile_forecast[..., 1:]
+      quantile_loss = np.nanmean(
+          np.maximum(QUANTILES * errors, (QUANTILES - 1) * errors), axis=(1, 2)
+      )
+    results.append(
+        BacktestResult(
+            cutoffs=c,
+            point_forecast=point_forecast,
+            quantile_forecast=quantile_forecast,
+            mae=mae,
+            mase=mae / _naive_scales(series, seasonality)[c],
+            quantile_loss=quantile_loss,
+        )
+    )
+  return results
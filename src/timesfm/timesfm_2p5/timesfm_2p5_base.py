@@ -14,10 +14,16 @@
 
 """TimesFM 2p5 base implementation."""
 
+import collections
+from concurrent import futures
 import dataclasses
-from typing import Any, Callable
+import itertools
+import math
+from typing import Any, Callable, Iterable, Iterator, Sequence
 import numpy as np
 from .. import configs
+from . import timesfm_2p5_cache
+from . import timesfm_2p5_profiling
 
 ResidualBlockConfig = configs.ResidualBlockConfig
 StackedTransformersConfig = configs.StackedTransformersConfig
@@ -68,7 +74,7 @@ def linear_interpolation(arr):
   try:
     arr[nans] = np.interp(nans_indices, non_nans_indices, non_nans_values)
   except ValueError:
-    if non_nans_values:
+    if non_nans_values.size > 0:
       mu = np.nanmean(arr)
     else:
       mu = 0.0
@@ -76,6 +82,311 @@ def linear_interpolation(arr):
   return arr
 
 
+@dataclasses.dataclass(frozen=True)
+class RaggedInputs:
+  """Preprocessed time series stored back to back in one flat array.
+
+  Attributes:
+    values: Flat float32 array holding all series, concatenated.
+    offsets: Int64 array of shape [num_series + 1]. Series i is stored in
+      values[offsets[i]:offsets[i + 1]].
+  """
+
+  values: np.ndarray
+  offsets: np.ndarray
+
+  def __len__(self) -> int:
+    return len(self.offsets) - 1
+
+  @property
+  def lengths(self) -> np.ndarray:
+    return np.diff(self.offsets)
+
+  def fill(
+      self,
+      indices: np.ndarray,
+      values_out: np.ndarray,
+      masks_out: np.ndarray,
+  ) -> None:
+    """Left-pads the selected series into preallocated buffers.
+
+    Rows of the buffers beyond len(indices) are filled with a short dummy
+    series so that the batch can be decoded at a fixed batch size.
+
+    Args:
+      indices: Indices of the series to write, one per buffer row.
+      values_out: Float32 buffer of shape [batch_size, context].
+      masks_out: Bool buffer of shape [batch_size, context]. Padded positions
+        are set to True.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    context = values_out.shape[1]
+    values_out.fill(0.0)
+    masks_out.fill(True)
+    masks_out[len(indices) :, -3:] = False
+
+    ends = self.offsets[indices + 1]
+    lengths = np.minimum(ends - self.offsets[indices], context)
+    rows = np.repeat(np.arange(len(indices)), lengths)
+    local = np.arange(len(rows)) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    cols = context - lengths[rows] + local
+    values_out[rows, cols] = self.values[ends[rows] - lengths[rows] + local]
+    masks_out[rows, cols] = False
+
+
+def preprocess_inputs(
+    inputs: Sequence[np.ndarray] | np.ndarray,
+    max_context: int,
+    offsets: np.ndarray | None = None,
+) -> RaggedInputs:
+  """Cleans a ragged collection of time series in one vectorized pass.
+
+  This is the batched equivalent of applying `strip_leading_nans`,
+  `linear_interpolation` and truncation to `max_context` to every series.
+
+  Args:
+    inputs: Either a sequence of 1D arrays, or a flat 1D array holding all
+      series back to back when `offsets` is given.
+    max_context: Only the last `max_context` points of each series are kept.
+    offsets: Optional int array of shape [num_series + 1] with the start of
+      every series in the flat `inputs` array.
+
+  Returns:
+    The cleaned series as a RaggedInputs.
+  """
+  if offsets is None:
+    lengths = np.array([np.size(x) for x in inputs], dtype=np.int64)
+    flat = np.concatenate(
+        [np.ravel(np.asarray(x, dtype=np.float64)) for x in inputs]
+        + [np.zeros(0)]
+    )
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+  else:
+    flat = np.array(inputs, dtype=np.float64).reshape(-1)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+
+  starts, ends = offsets[:-1], offsets[1:]
+  segment = np.repeat(np.arange(len(lengths)), lengths)
+  position = np.arange(len(flat))
+  is_valid = ~np.isnan(flat)
+
+  # Closest valid neighbours of every position within its own series.
+  prev_valid = np.maximum.accumulate(np.where(is_valid, position, -1))
+  next_valid = np.minimum.accumulate(
+      np.where(is_valid, position, len(flat))[::-1]
+  )[::-1]
+  has_prev = prev_valid >= starts[segment]
+  has_next = next_valid < ends[segment]
+
+  is_nan = ~is_valid
+  if np.any(is_nan):
+    both = is_nan & has_prev & has_next
+    x0, x1 = prev_valid[both], next_valid[both]
+    y0, y1 = flat[x0], flat[x1]
+    flat[both] = (y1 - y0) / (x1 - x0) * (position[both] - x0) + y0
+    # Trailing NaNs take the last valid value, as np.interp does.
+    trailing = is_nan & has_prev & ~has_next
+    flat[trailing] = flat[prev_valid[trailing]]
+    # Series without any valid value become all zeros.
+    flat[is_nan & ~has_prev & ~has_next] = 0.0
+
+  first_valid = np.full_like(starts, 0)
+  nonempty = lengths > 0
+  first_valid[nonempty] = next_valid[starts[nonempty]]
+  first_valid = np.where(first_valid < ends, first_valid, starts)
+  keep_from = np.maximum(first_valid, ends - max_context)
+  keep = position >= keep_from[segment]
+
+  new_lengths = ends - keep_from
+  return RaggedInputs(
+      values=flat[keep].astype(np.float32),
+      offsets=np.concatenate([[0], np.cumsum(new_lengths)]).astype(np.int64),
+  )
+
+
+_TOLERANCE = 1e-6
+
+
+def revin(
+    x: np.ndarray, mu: np.ndarray, sigma: np.ndarray, reverse: bool = False
+) -> np.ndarray:
+  """Reversible instance normalization along the last axis of mu and sigma."""
+  if reverse:
+    return x * sigma + mu
+  return (x - mu) / np.where(sigma < _TOLERANCE, 1.0, sigma)
+
+
+def flip_quantiles(x: np.ndarray) -> np.ndarray:
+  """Reverses the quantile order of the mirrored forecast of -x."""
+  return np.concatenate([x[..., :1], x[..., :0:-1]], axis=-1)
+
+
+def fix_quantile_crossing(full_forecast: np.ndarray) -> np.ndarray:
+  """Makes the quantiles monotonic around the median, in place."""
+  for i in [4, 3, 2, 1]:
+    full_forecast[:, :, i] = np.minimum(
+        full_forecast[:, :, i], full_forecast[:, :, i + 1]
+    )
+  for i in [6, 7, 8, 9]:
+    full_forecast[:, :, i] = np.maximum(
+        full_forecast[:, :, i], full_forecast[:, :, i - 1]
+    )
+  return full_forecast
+
+
+@dataclasses.dataclass(frozen=True)
+class DecodeInputs:
+  """A padded batch prepared for decoding, see `prepare_decode_inputs`.
+
+  Attributes:
+    inputs: The inputs to decode, [b, context] or [2 * b, context] with flip
+      invariance.
+    masks: The padding masks of the inputs, True for padding.
+    batch_size: The number of series b.
+    mu: The means of the series with normalize_inputs, [b, 1], or None.
+    sigma: The standard deviations of the series with normalize_inputs,
+      [b, 1], or None.
+    is_positive: Whether every series is nonnegative with infer_is_positive,
+      [b, 1], or None.
+  """
+
+  inputs: np.ndarray
+  masks: np.ndarray
+  batch_size: int
+  mu: np.ndarray | None
+  sigma: np.ndarray | None
+  is_positive: np.ndarray | None
+
+
+def prepare_decode_inputs(
+    inputs: np.ndarray,
+    masks: np.ndarray,
+    forecast_config: ForecastConfig,
+) -> DecodeInputs:
+  """Applies the forecasting flags to a padded batch before decoding.
+
+  Shared by all backends, so that they treat the flags the same way.
+
+  Args:
+    inputs: Left-padded series of shape [b, context].
+    masks: Padding masks of shape [b, context], True for padding.
+    forecast_config: The forecasting flags.
+
+  Returns:
+    The inputs to decode and the statistics `postprocess_forecast` needs.
+  """
+  fc = forecast_config
+  inputs = np.asarray(inputs, dtype=np.float32)
+  masks = np.asarray(masks, dtype=bool)
+  is_positive = mu = sigma = None
+  if fc.infer_is_positive:
+    is_positive = np.all(inputs >= 0, axis=-1, keepdims=True)
+  if fc.normalize_inputs:
+    mu = np.mean(inputs, axis=-1, keepdims=True)
+    sigma = np.std(inputs, axis=-1, keepdims=True, ddof=1)
+    inputs = revin(inputs, mu, sigma, reverse=False)
+  batch_size = len(inputs)
+  if fc.force_flip_invariance:
+    # Decode both orientations as one doubled batch.
+    inputs = np.concatenate([inputs, -inputs], axis=0)
+    masks = np.concatenate([masks, masks], axis=0)
+  return DecodeInputs(
+      inputs=np.ascontiguousarray(inputs, dtype=np.float32),
+      masks=np.ascontiguousarray(masks),
+      batch_size=batch_size,
+      mu=mu,
+      sigma=sigma,
+      is_positive=is_positive,
+  )
+
+
+def postprocess_forecast(
+    horizon: int,
+    outputs: np.ndarray,
+    quantile_spread: np.ndarray | None,
+    ar_outputs: np.ndarray | None,
+    decode_inputs: DecodeInputs,
+    forecast_config: ForecastConfig,
+    input_patch_len: int,
+) -> tuple[np.ndarray, np.ndarray]:
+  """Turns the decode outputs of a batch into its forecasts.
+
+  Shared by all backends, so that they treat the flags the same way.
+
+  Args:
+    horizon: The number of time points to forecast.
+    outputs: The renormalized outputs of every context patch, or of the last
+      one, [b, num_patches, o, q], with b doubled by flip invariance.
+    quantile_spread: The renormalized quantile spread of the last patch,
+      [b, os, q], or None if the continuous quantile head did not run.
+    ar_outputs: The renormalized autoregressive outputs,
+      [b, num_decode_steps, o, q], or None.
+    decode_inputs: The prepared batch the outputs were decoded from.
+    forecast_config: The forecasting flags.
+    input_patch_len: The input patch length, to lay out the backcast.
+
+  Returns:
+    The point forecasts and the quantile forecasts of the batch.
+  """
+  fc = forecast_config
+  batch_size = decode_inputs.batch_size
+  q = outputs.shape[-1]
+  to_cat = [outputs[:, -1, ...]]
+  if ar_outputs is not None:
+    to_cat.append(ar_outputs.reshape(len(outputs), -1, q))
+  full_forecast = np.concatenate(to_cat, axis=1)
+
+  if fc.force_flip_invariance:
+    outputs, flipped_outputs = np.split(outputs, 2)
+    full_forecast, flipped_full_forecast = np.split(full_forecast, 2)
+    if quantile_spread is not None:
+      quantile_spread, flipped_quantile_spread = np.split(quantile_spread, 2)
+      quantile_spread = (
+          quantile_spread - flip_quantiles(flipped_quantile_spread)
+      ) / 2
+    outputs = (outputs - flip_quantiles(flipped_outputs)) / 2
+    full_forecast = (full_forecast - flip_quantiles(flipped_full_forecast)) / 2
+
+  full_forecast = full_forecast[:, :horizon, :]
+  if fc.use_continuous_quantile_head:
+    for quantile_index in [1, 2, 3, 4, 6, 7, 8, 9]:
+      full_forecast[:, :, quantile_index] = (
+          quantile_spread[:, :horizon, quantile_index]
+          - quantile_spread[:, :horizon, 5]
+          + full_forecast[:, :, 5]
+      )
+
+  if fc.return_backcast:
+    full_backcast = outputs[:, :-1, :input_patch_len, :].reshape(
+        batch_size, -1, q
+    )
+    full_forecast = np.concatenate([full_backcast, full_forecast], axis=1)
+
+  if fc.fix_quantile_crossing:
+    full_forecast = fix_quantile_crossing(full_forecast)
+
+  if fc.normalize_inputs:
+    full_forecast = revin(
+        full_forecast,
+        decode_inputs.mu[..., None],
+        decode_inputs.sigma[..., None],
+        reverse=True,
+    )
+
+  if decode_inputs.is_positive is not None:
+    full_forecast = np.where(
+        decode_inputs.is_positive[..., None],
+        np.maximum(full_forecast, 0.0),
+        full_forecast,
+    )
+
+  full_forecast = full_forecast.astype(np.float32)
+  return full_forecast[..., 5], full_forecast
+
+
 @dataclasses.dataclass(frozen=True)
 class TimesFM_2p5_200M_Definition:
   """Framework-agnostic config of TimesFM 2.5."""
@@ -132,11 +443,21 @@ class TimesFM_2p5:
     forecast_config: Configuration for forecasting flags.
     compiled_decode: Compiled decode function.
     global_batch_size: Global batch size.
+    input_patch_len: Input patch length of the underlying model. Used to round
+      context lengths when bucketing inputs by length.
+    output_patch_len: Output patch length of the underlying model. Used to
+      round horizons up to the number of output patches they need.
+    result_cache: Optional cache of forecasts consulted by `forecast`, see
+      timesfm_2p5_cache.ForecastCache. Only the series that miss the cache
+      are decoded.
   """
 
   forecast_config: ForecastConfig | None = None
   compiled_decode: Callable[..., Any] | None = None
   global_batch_size: int = 0
+  input_patch_len: int = 0
+  output_patch_len: int = 0
+  result_cache: timesfm_2p5_cache.ForecastCache | None = None
 
   def load_checkpoint(self, path: str):
     """Loads a TimesFM model from a checkpoint."""
@@ -146,10 +467,84 @@ class TimesFM_2p5:
     """Compiles the TimesFM model for fast decoding."""
     raise NotImplementedError()
 
+  def _bucket_context(self, length: int) -> int:
+    """Returns the context length to decode a series of `length` points at."""
+    context = self.forecast_config.max_context
+    if not self.forecast_config.bucket_by_length or self.input_patch_len <= 0:
+      return context
+    p = self.input_patch_len
+    return min(context, max(p, math.ceil(length / p) * p))
+
+  def horizon_bucket(self, horizon: int) -> int:
+    """Returns the horizon the model actually decodes for `horizon`.
+
+    Decoding stops at the smallest number of output patches that covers the
+    horizon, so all horizons of the same bucket cost the same.
+    """
+    o = self.output_patch_len
+    if o <= 0:
+      return self.forecast_config.max_horizon
+    return max(o, math.ceil(horizon / o) * o)
+
+  def batch_rows(self, num_series: int) -> int:
+    """Returns the number of rows a batch of `num_series` series decodes.
+
+    Batches that are not full only decode the smallest power of two of rows
+    holding their series, up to the global batch size, so that a lone series
+    does not pay for a full batch while the number of distinct batch shapes
+    stays logarithmic.
+    """
+    return min(self.global_batch_size, 1 << max(num_series - 1, 0).bit_length())
+
+  def _decode_batch(
+      self, horizon: int, values: np.ndarray, masks: np.ndarray
+  ) -> tuple[np.ndarray, np.ndarray]:
+    """Decodes one padded batch and aligns backcasts to max_context."""
+    with timesfm_2p5_profiling.stage("decode_batch"):
+      point_forecast, quantile_forecast = self.compiled_decode(
+          horizon, values, masks
+      )
+    context = self.forecast_config.max_context
+    if (w := context - values.shape[1]) > 0 and (
+        self.forecast_config.return_backcast
+    ):
+      point_forecast = np.pad(
+          point_forecast, ((0, 0), (w, 0)), constant_values=np.nan
+      )
+      quantile_forecast = np.pad(
+          quantile_forecast,
+          ((0, 0), (w, 0), (0, 0)),
+          constant_values=np.nan,
+      )
+    return point_forecast, quantile_forecast
+
   def forecast(
-      self, horizon: int, inputs: list[np.ndarray]
+      self,
+      horizon: int,
+      inputs: Sequence[np.ndarray] | np.ndarray,
+      offsets: np.ndarray | None = None,
+  ) -> tuple[np.ndarray, np.ndarray]:
+    """Forecasts the time series.
+
+    Args:
+      horizon: The number of time points to forecast.
+      inputs: A sequence of 1D arrays, one per time series. Alternatively, a
+        flat 1D array holding all time series back to back, with `offsets`.
+      offsets: Optional int array of shape [num_series + 1] marking the start
+        of every series in a flat `inputs` array.
+
+    Returns:
+      A tuple of point forecasts and quantile forecasts.
+    """
+    with timesfm_2p5_profiling.stage("forecast"):
+      return self._forecast(horizon, inputs, offsets)
+
+  def _forecast(
+      self,
+      horizon: int,
+      inputs: Sequence[np.ndarray] | np.ndarray,
+      offsets: np.ndarray | None,
   ) -> tuple[np.ndarray, np.ndarray]:
-    """Forecasts the time series."""
     if self.compiled_decode is None:
       raise RuntimeError("Model is not compiled. Please call compile() first.")
 
@@ -157,36 +552,123 @@ class TimesFM_2p5:
     assert self.forecast_config is not None
 
     context = self.forecast_config.max_context
-    num_inputs = len(inputs)
-    if (w := num_inputs % self.global_batch_size) != 0:
-      inputs += [np.array([0.0] * 3)] * (self.global_batch_size - w)
-
-    output_points = []
-    output_quantiles = []
-    values = []
-    masks = []
-    idx = 0
-    for each_input in inputs:
-      value = linear_interpolation(strip_leading_nans(np.array(each_input)))
-      if (w := len(value)) >= context:
-        value = value[-context:]
-        mask = np.zeros_like(value, dtype=bool)
-      else:
-        mask = np.array([True] * (context - w) + [False] * w)
-        value = np.pad(value, (context - w, 0), "constant", constant_values=0.0)
-      values.append(value)
-      masks.append(mask)
-      idx += 1
-      if idx == self.global_batch_size:
-        idx = 0
-        point_forecast, quantile_forecast = self.compiled_decode(
+    with timesfm_2p5_profiling.stage("preprocess"):
+      ragged = preprocess_inputs(inputs, context, offsets)
+    num_inputs = len(ragged)
+
+    output_points = [None] * num_inputs
+    output_quantiles = [None] * num_inputs
+    cache_keys = None
+    if (cache := self.result_cache) is not None:
+      with timesfm_2p5_profiling.stage("cache_lookup"):
+        cache_keys = [
+            cache.make_key(
+                ragged.values[ragged.offsets[i] : ragged.offsets[i + 1]],
+                horizon,
+                self.forecast_config,
+            )
+            for i in range(num_inputs)
+        ]
+        for idx, key in enumerate(cache_keys):
+          if (quantile_forecast := cache.get(key)) is not None:
+            output_points[idx] = quantile_forecast[..., 5]
+            output_quantiles[idx] = quantile_forecast
+
+    buckets = collections.defaultdict(list)
+    for idx, length in enumerate(ragged.lengths.tolist()):
+      if output_quantiles[idx] is None:
+        buckets[self._bucket_context(length)].append(idx)
+
+    values_buffer = np.empty(self.global_batch_size * context, dtype=np.float32)
+    masks_buffer = np.empty(self.global_batch_size * context, dtype=bool)
+    for bucket_context in sorted(buckets):
+      indices = buckets[bucket_context]
+      for start in range(0, len(indices), self.global_batch_size):
+        batch_indices = indices[start : start + self.global_batch_size]
+        size = self.batch_rows(len(batch_indices)) * bucket_context
+        values = values_buffer[:size].reshape(-1, bucket_context)
+        masks = masks_buffer[:size].reshape(-1, bucket_context)
+        with timesfm_2p5_profiling.stage("fill"):
+          ragged.fill(batch_indices, values, masks)
+
+        point_forecast, quantile_forecast = self._decode_batch(
             horizon, values, masks
         )
-        output_points.append(point_forecast)
-        output_quantiles.append(quantile_forecast)
-        values = []
-        masks = []
-
-    output_points = np.concatenate(output_points, axis=0)
-    output_quantiles = np.concatenate(output_quantiles, axis=0)
-    return output_points[:num_inputs], output_quantiles[:num_inputs]
+        for i, idx in enumerate(batch_indices):
+          output_points[idx] = point_forecast[i]
+          output_quantiles[idx] = quantile_forecast[i]
+          if cache_keys is not None:
+            cache.put(cache_keys[idx], quantile_forecast[i])
+
+    return np.stack(output_points, axis=0), np.stack(output_quantiles, axis=0)
+
+  def forecast_iter(
+      self, horizon: int, inputs: Iterable[np.ndarray]
+  ) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Forecasts a lazily consumed stream of time series, batch by batch.
+
+    Unlike `forecast`, the inputs are read one batch at a time and results are
+    yielded as soon as a batch is decoded, so memory stays bounded by a few
+    batches regardless of the number of series. The next batch is read and
+    preprocessed on a background thread while the current one is decoded.
+
+    With bucket_by_length, every batch is decoded at the bucket context of its
+    longest series.
+
+    Args:
+      horizon: The number of time points to forecast.
+      inputs: An iterable of 1D arrays, one per time series.
+
+    Yields:
+      Tuples of the indices of the series in `inputs`, their point forecasts
+      and their quantile forecasts.
+    """
+    if self.compiled_decode is None:
+      raise RuntimeError("Model is not compiled. Please call compile() first.")
+
+    assert self.global_batch_size > 0
+    assert self.forecast_config is not None
+
+    batch_size = self.global_batch_size
+    context = self.forecast_config.max_context
+    iterator = iter(inputs)
+
+    def prepare(buffers):
+      chunk = list(itertools.islice(iterator, batch_size))
+      if not chunk:
+        return None
+      with timesfm_2p5_profiling.stage("preprocess"):
+        ragged = preprocess_inputs(chunk, context)
+      batch_context = max(self._bucket_context(w) for w in ragged.lengths)
+      rows = self.batch_rows(len(chunk))
+      values = buffers[0][: rows * batch_context]
+      masks = buffers[1][: rows * batch_context]
+      values = values.reshape(rows, batch_context)
+      masks = masks.reshape(rows, batch_context)
+      ragged.fill(np.arange(len(chunk)), values, masks)
+      return len(chunk), values, masks
+
+    # Two sets of buffers: one being decoded, one being filled.
+    buffers = [
+        (
+            np.empty(batch_size * context, dtype=np.float32),
+            np.empty(batch_size * context, dtype=bool),
+        )
+        for _ in range(2)
+    ]
+    start = 0
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+      next_batch = executor.submit(prepare, buffers[0])
+      while (batch := next_batch.result()) is not None:
+        num_series, values, masks = batch
+        next_batch = executor.submit(prepare, buffers[1])
+        buffers.reverse()
+        point_forecast, quantile_forecast = self._decode_batch(
+            horizon, values, masks
+        )
+        yield (
+            np.arange(start, start + num_series),
+            point_forecast[:num_series],
+            quantile_forecast[:num_series],
+        )
+        start += num_series
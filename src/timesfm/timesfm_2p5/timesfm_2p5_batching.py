@@ -0,0 +1,160 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-batching of concurrent forecast requests."""
+
+import collections
+from concurrent import futures
+import dataclasses
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from . import timesfm_2p5_base
+
+
+@dataclasses.dataclass
+class _Request:
+  series: np.ndarray
+  horizon: int
+  future: futures.Future
+
+
+class ForecastBatcher:
+  """Collects concurrent single-series forecasts into batched calls.
+
+  A background thread waits for up to `max_wait_ms` after the first pending
+  request, or until `max_batch_size` requests are queued, and then issues a
+  `forecast` call per horizon bucket, see `TimesFM_2p5.horizon_bucket`.
+  Results are fanned back out through futures. Requests with different
+  horizons of the same bucket share the call: it is forecast to their largest
+  horizon and every result is trimmed to its own horizon.
+
+  The batcher is the only caller of the model, so the model itself does not
+  need to be thread-safe.
+  """
+
+  def __init__(
+      self,
+      model: timesfm_2p5_base.TimesFM_2p5,
+      *,
+      max_batch_size: int | None = None,
+      max_wait_ms: float = 5.0,
+  ):
+    """Starts the batching thread.
+
+    Args:
+      model: A compiled TimesFM model.
+      max_batch_size: Maximum number of requests per forecast call. Defaults
+        to the global batch size of the model.
+      max_wait_ms: Maximum time to wait for more requests after the first one
+        of a batch arrived.
+    """
+    self.model = model
+    self.max_batch_size = max_batch_size or max(model.global_batch_size, 1)
+    self.max_wait_ms = max_wait_ms
+    self._queue: queue.Queue[_Request | None] = queue.Queue()
+    self._closed = False
+    self._lock = threading.Lock()
+    self._thread = threading.Thread(
+        target=self._run, name="ForecastBatcher", daemon=True
+    )
+    self._thread.start()
+
+  def submit(self, series: np.ndarray, horizon: int) -> futures.Future:
+    """Queues a forecast request.
+
+    Args:
+      series: The time series to forecast.
+      horizon: The number of time points to forecast.
+
+    Returns:
+      A future resolving to the point forecast and the quantile forecast of
+      the series, as returned by `forecast` for a single input.
+    """
+    fc = self.model.forecast_config
+    if fc is not None and horizon > fc.max_horizon:
+      raise ValueError(
+          "Horizon must be less than the max horizon."
+          f" {horizon} > {fc.max_horizon}."
+      )
+    future = futures.Future()
+    with self._lock:
+      if self._closed:
+        raise RuntimeError("ForecastBatcher is closed.")
+      self._queue.put(_Request(np.asarray(series), horizon, future))
+    return future
+
+  def forecast(
+      self, series: np.ndarray, horizon: int, timeout: float | None = None
+  ) -> tuple[np.ndarray, np.ndarray]:
+    """Queues a forecast request and waits for its result."""
+    return self.submit(series, horizon).result(timeout=timeout)
+
+  def close(self) -> None:
+    """Serves the pending requests and stops the batching thread."""
+    with self._lock:
+      if self._closed:
+        return
+      self._closed = True
+      self._queue.put(None)
+    self._thread.join()
+
+  def _run(self) -> None:
+    running = True
+    while running:
+      request = self._queue.get()
+      if request is None:
+        return
+      batch = [request]
+      deadline = time.monotonic() + self.max_wait_ms / 1000.0
+      while len(batch) < self.max_batch_size:
+        try:
+          request = self._queue.get(
+              timeout=max(deadline - time.monotonic(), 0.0)
+          )
+        except queue.Empty:
+          break
+        if request is None:
+          running = False
+          break
+        batch.append(request)
+      self._process(batch)
+
+  def _process(self, batch: list[_Request]) -> None:
+    batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+    buckets = collections.defaultdict(list)
+    for r in batch:
+      buckets[self.model.horizon_bucket(r.horizon)].append(r)
+    for bucket in buckets.values():
+      self._process_bucket(bucket)
+
+  def _process_bucket(self, batch: list[_Request]) -> None:
+    horizon = max(r.horizon for r in batch)
+    try:
+      points, quantiles = self.model.forecast(
+          horizon=horizon, inputs=[r.series for r in batch]
+      )
+    except Exception as e:  # pylint: disable=broad-except
+      logging.exception("Batched forecast of %d requests failed.", len(batch))
+      for r in batch:
+        r.future.set_exception(e)
+      return
+    for i, r in enumerate(batch):
+      # Any backcast comes first, so trimming from the end keeps it intact.
+      end = points.shape[1] - (horizon - r.horizon)
+      r.future.set_result((points[i, :end], quantiles[i, :end]))
@@ -0,0 +1,292 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-addressed cache of TimesFM 2.5 forecasts."""
+
+import collections
+import dataclasses
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from .. import configs
+
+_TOLERANCE = 1e-6
+
+# ForecastConfig fields that only affect the speed of decoding, not results.
+_PERFORMANCE_FIELDS = frozenset(
+    ["max_horizon", "per_core_batch_size", "num_cpu_workers"]
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheKey:
+  """Cache key of one series and the affine map to its canonical form.
+
+  Attributes:
+    digest: Hex digest of the canonical series, horizon and config.
+    shift: Shift `b` such that the series is `scale * canonical + shift`.
+    scale: Scale `a` such that the series is `scale * canonical + shift`.
+  """
+
+  digest: str
+  shift: float
+  scale: float
+
+
+@dataclasses.dataclass
+class CacheStats:
+  """Counters of a ForecastCache.
+
+  Attributes:
+    hits: Lookups served from memory or disk.
+    disk_hits: Lookups served from the disk tier, a subset of `hits`.
+    misses: Lookups that had to run the model.
+    evictions: Entries dropped from memory to stay within the bounds.
+    disk_evictions: Files dropped from disk to stay within `max_disk_bytes`.
+    expirations: Entries dropped because they outlived the TTL.
+  """
+
+  hits: int = 0
+  disk_hits: int = 0
+  misses: int = 0
+  evictions: int = 0
+  disk_evictions: int = 0
+  expirations: int = 0
+
+
+class ForecastCache:
+  """LRU/TTL cache of forecasts keyed by the content of the inputs.
+
+  TimesFM is affine equivariant: TimesFM(a * x + b) = a * TimesFM(x) + b for
+  a > 0. Every series is therefore canonicalized to zero mean and unit
+  standard deviation before hashing, and forecasts are stored for the
+  canonical series. A hit is rescaled to the series at hand, so shifted and
+  scaled duplicates of a series share one entry. With
+  `infer_is_positive`, nonnegative series are only canonicalized by scale, as
+  clamping forecasts at zero does not commute with shifts.
+
+  By default the canonical series are hashed exactly, so only exact
+  duplicates are sure to hit: float rounding in the affine map makes most
+  affine duplicates miss. With `decimals`, canonical series are rounded
+  before hashing, so that affine duplicates miss only if a point falls within
+  rounding error of a quantization boundary. This is lossy: distinct series
+  that agree to `decimals` decimals after canonicalization share one
+  forecast. The digest also covers the horizon, the ForecastConfig fields
+  that affect results and a `namespace` identifying the model. Clear the
+  cache, or use a new namespace, when the weights change.
+
+  Entries are kept in memory in least-recently-used order, bounded by
+  `max_entries` and `max_bytes`. With `directory`, every entry is also
+  written through to one file per digest, which is consulted on memory
+  misses and can be shared by several processes. The disk tier is bounded by
+  `max_disk_bytes`, evicting the least recently written files; without it,
+  files are only removed by `clear()` and by reads that find them expired,
+  so the directory grows without limit.
+  """
+
+  def __init__(
+      self,
+      *,
+      max_entries: int = 10_000,
+      max_bytes: int = 256 << 20,
+      ttl_seconds: float | None = None,
+      directory: str | None = None,
+      max_disk_bytes: int | None = None,
+      namespace: str = "",
+      decimals: int | None = None,
+  ):
+    """Creates an empty cache.
+
+    Args:
+      max_entries: Maximum number of entries in memory.
+      max_bytes: Maximum total size of the cached arrays in memory.
+      ttl_seconds: Time after which an entry expires, or None to never expire.
+      directory: Optional directory of the on-disk tier.
+      max_disk_bytes: Maximum total size of the files of the on-disk tier, or
+        None for no bound. With a bound, every write lists the directory.
+      namespace: Identifies the model in the keys, e.g. its checkpoint.
+      decimals: Decimals the canonical series are rounded to before hashing,
+        or None to hash them exactly.
+    """
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.ttl_seconds = ttl_seconds
+    self.directory = directory
+    self.max_disk_bytes = max_disk_bytes
+    self.namespace = namespace
+    self.decimals = decimals
+    self.stats = CacheStats()
+    self.num_bytes = 0
+    self._entries: collections.OrderedDict[
+        str, tuple[float, np.ndarray]
+    ] = collections.OrderedDict()
+    self._lock = threading.Lock()
+    if directory is not None:
+      os.makedirs(directory, exist_ok=True)
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def make_key(
+      self,
+      series: np.ndarray,
+      horizon: int,
+      forecast_config: configs.ForecastConfig,
+  ) -> CacheKey:
+    """Returns the cache key of a preprocessed series.
+
+    Args:
+      series: The preprocessed series, as decoded by the model.
+      horizon: The forecast horizon.
+      forecast_config: The forecast config the model is compiled with.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    is_positive = forecast_config.infer_is_positive and bool(
+        np.all(series >= 0)
+    )
+    if series.size == 0:
+      shift, scale = 0.0, 1.0
+    elif is_positive:
+      shift, scale = 0.0, float(np.sqrt(np.mean(np.square(series))))
+    else:
+      shift, scale = float(np.mean(series)), float(np.std(series))
+    if scale < _TOLERANCE:
+      scale = 1.0
+    canonical = (series - shift) / scale
+    if self.decimals is not None:
+      canonical = np.round(canonical, self.decimals)
+    canonical = canonical + 0.0
+
+    config = sorted(
+        (f.name, getattr(forecast_config, f.name))
+        for f in dataclasses.fields(forecast_config)
+        if f.name not in _PERFORMANCE_FIELDS
+    )
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((self.namespace, horizon, is_positive, config)).encode())
+    h.update(canonical.tobytes())
+    return CacheKey(digest=h.hexdigest(), shift=shift, scale=scale)
+
+  def get(self, key: CacheKey) -> np.ndarray | None:
+    """Returns the cached quantile forecast of a key, or None on a miss."""
+    with self._lock:
+      canonical = self._get_canonical(key.digest)
+      if canonical is None:
+        self.stats.misses += 1
+        return None
+      self.stats.hits += 1
+    return (canonical * key.scale + key.shift).astype(np.float32)
+
+  def put(self, key: CacheKey, quantile_forecast: np.ndarray) -> None:
+    """Caches the quantile forecast of a key, see `TimesFM_2p5.forecast`."""
+    canonical = (
+        np.asarray(quantile_forecast, dtype=np.float32) - key.shift
+    ) / np.float32(key.scale)
+    with self._lock:
+      self._insert(key.digest, canonical, time.monotonic())
+    if self.directory is not None:
+      path = self._path(key.digest)
+      with tempfile.NamedTemporaryFile(
+          dir=self.directory, suffix=".tmp", delete=False
+      ) as f:
+        np.save(f, canonical)
+      os.replace(f.name, path)
+      if self.max_disk_bytes is not None:
+        self._prune_disk()
+
+  def clear(self) -> None:
+    """Drops all entries from memory and disk."""
+    with self._lock:
+      self._entries.clear()
+      self.num_bytes = 0
+      if self.directory is not None:
+        for name in os.listdir(self.directory):
+          if name.endswith(".npy"):
+            os.remove(os.path.join(self.directory, name))
+
+  def _prune_disk(self) -> None:
+    """Removes the oldest files until the disk tier fits `max_disk_bytes`."""
+    files = []
+    for entry in os.scandir(self.directory):
+      if entry.name.endswith(".npy"):
+        try:
+          stat = entry.stat()
+        except OSError:
+          continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    num_bytes = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+      if num_bytes <= self.max_disk_bytes:
+        break
+      num_bytes -= size
+      try:
+        os.remove(path)
+      except OSError:
+        continue  # Removed by another process sharing the directory.
+      with self._lock:
+        self.stats.disk_evictions += 1
+
+  def _path(self, digest: str) -> str:
+    return os.path.join(self.directory, digest + ".npy")
+
+  def _expired(self, age: float) -> bool:
+    return self.ttl_seconds is not None and age > self.ttl_seconds
+
+  def _get_canonical(self, digest: str) -> np.ndarray | None:
+    """Looks a digest up in memory, then on disk."""
+    if (entry := self._entries.get(digest)) is not None:
+      created, canonical = entry
+      if not self._expired(time.monotonic() - created):
+        self._entries.move_to_end(digest)
+        return canonical
+      self._remove(digest)
+      self.stats.expirations += 1
+    if self.directory is None:
+      return None
+
+    path = self._path(digest)
+    try:
+      age = time.time() - os.path.getmtime(path)
+      if self._expired(age):
+        os.remove(path)
+        self.stats.expirations += 1
+        return None
+      canonical = np.load(path)
+    except OSError:
+      return None
+    self._insert(digest, canonical, time.monotonic() - age)
+    self.stats.disk_hits += 1
+    return canonical
+
+  def _insert(self, digest: str, canonical: np.ndarray, created: float):
+    """Inserts an entry and evicts the least recently used ones."""
+    if digest in self._entries:
+      self._remove(digest)
+    self._entries[digest] = (created, canonical)
+    self.num_bytes += canonical.nbytes
+    while self._entries and (
+        len(self._entries) > self.max_entries
+        or self.num_bytes > self.max_bytes
+    ):
+      self._remove(next(iter(self._entries)))
+      self.stats.evictions += 1
+
+  def _remove(self, digest: str) -> None:
+    _, canonical = self._entries.pop(digest)
+    self.num_bytes -= canonical.nbytes
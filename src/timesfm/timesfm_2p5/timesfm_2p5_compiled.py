@@ -0,0 +1,194 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shape-specialized compiled decode graphs of the TimesFM 2.5 torch module."""
+
+import logging
+import os
+from typing import Any, Iterable
+
+import torch
+
+_ARTIFACTS_FILE = "timesfm_2p5_compile_cache.bin"
+
+GraphKey = tuple[int, int, int, tuple[tuple[str, Any], ...]]
+
+
+def _compile_errors() -> tuple[type[Exception], ...]:
+  """The exceptions raised when tracing, lowering or compiling a graph fails.
+
+  Errors raised by running a graph, e.g. out of memory, are not among them.
+  """
+  # pylint: disable=g-import-not-at-top,protected-access
+  import torch._dynamo.exc
+  import torch._inductor.exc
+
+  candidates = [
+      (torch._dynamo.exc, "BackendCompilerFailed"),
+      (torch._dynamo.exc, "Unsupported"),
+      (torch._dynamo.exc, "InternalTorchDynamoError"),
+      (torch._inductor.exc, "InductorError"),
+      (torch._inductor.exc, "LoweringException"),
+      (torch._inductor.exc, "CppCompileError"),
+  ]
+  return tuple(
+      getattr(module, name)
+      for module, name in candidates
+      if hasattr(module, name)
+  )
+
+
+def _raise_recompile_limit(limit: int) -> None:
+  """Lets torch.compile keep at least `limit` specializations per function."""
+  config = torch._dynamo.config  # pylint: disable=protected-access
+  if hasattr(config, "recompile_limit"):
+    name = "recompile_limit"
+  else:
+    name = "cache_size_limit"
+  setattr(config, name, max(getattr(config, name), limit))
+
+
+class CompiledDecodeGraphs:
+  """Decode graphs compiled with torch.compile, specialized by shape.
+
+  `model.run_decode` is compiled with static shapes, so torch.compile keeps
+  one graph, with the autoregressive loop unrolled, per (batch size, context
+  length, number of decode steps) and set of head selections. This class
+  only keeps the bookkeeping of the shapes seen so far: it raises the
+  recompile limit of torch.compile to fit them and records the shapes whose
+  compilation failed, which fall back to eager decoding. The decode caches
+  are checked out eagerly, outside of the graphs. The compiler artifacts can
+  be persisted to a directory, so that a restarted process warms up from the
+  disk instead of recompiling; this needs a torch version with
+  `torch.compiler.save_cache_artifacts` and is skipped otherwise.
+  """
+
+  def __init__(
+      self,
+      model: torch.nn.Module,
+      *,
+      cache_dir: str | None = None,
+      **compile_kwargs,
+  ):
+    """Initializes the cache.
+
+    Args:
+      model: A TimesFM 2.5 torch module.
+      cache_dir: Optional directory to load the compiler artifacts from and
+        save them to.
+      **compile_kwargs: Keyword arguments of torch.compile, e.g. backend and
+        mode.
+    """
+    self.model = model
+    self.cache_dir = cache_dir
+    self._compiled = torch.compile(
+        model.run_decode, dynamic=False, **compile_kwargs
+    )
+    # Maps the key of every shape decoded so far to whether it runs eagerly.
+    self._is_eager: dict[GraphKey, bool] = {}
+    if cache_dir is not None:
+      self._load_artifacts()
+
+  @property
+  def keys(self) -> list[GraphKey]:
+    """The keys of the shapes decoded so far."""
+    return list(self._is_eager)
+
+  @property
+  def eager_keys(self) -> list[GraphKey]:
+    """The keys of the shapes that fell back to eager decoding."""
+    return [key for key, is_eager in self._is_eager.items() if is_eager]
+
+  def decode(
+      self, horizon: int, inputs: torch.Tensor, masks: torch.Tensor, **kwargs
+  ):
+    """Decodes with the graph compiled for the shape of the inputs."""
+    with torch.no_grad():
+      inputs, masks, num_decode_steps, decode_caches = (
+          self.model.prepare_decode(horizon, inputs, masks)
+      )
+      key = (
+          inputs.shape[0],
+          inputs.shape[1],
+          num_decode_steps,
+          tuple(sorted(kwargs.items())),
+      )
+      if key not in self._is_eager:
+        # Every shape is its own specialization of the compiled function.
+        _raise_recompile_limit(len(self._is_eager) + 1)
+        self._is_eager[key] = False
+      if self._is_eager[key]:
+        return self.model.run_decode(
+            inputs, masks, num_decode_steps, decode_caches, **kwargs
+        )
+      try:
+        return self._compiled(
+            inputs, masks, num_decode_steps, decode_caches, **kwargs
+        )
+      except _compile_errors():
+        logging.warning(
+            "Compiling the decode graph for %s failed, falling back to eager.",
+            key,
+            exc_info=True,
+        )
+        self._is_eager[key] = True
+        return self.model.decode(horizon, inputs, masks, **kwargs)
+
+  def warmup(self, shapes: Iterable[tuple[int, int, int]], **kwargs) -> None:
+    """Compiles the graphs of the given shapes ahead of time.
+
+    Args:
+      shapes: (batch size, context, horizon) tuples to compile.
+      **kwargs: Keyword arguments of the decode calls, see `model.decode`.
+    """
+    for batch_size, context, horizon in shapes:
+      inputs = torch.zeros(batch_size, context, device=self.model.device)
+      masks = torch.zeros(
+          batch_size, context, dtype=torch.bool, device=self.model.device
+      )
+      self.decode(horizon, inputs, masks, **kwargs)
+    if self.cache_dir is not None:
+      self._save_artifacts()
+
+  def _load_artifacts(self) -> None:
+    path = os.path.join(self.cache_dir, _ARTIFACTS_FILE)
+    if not os.path.exists(path):
+      return
+    if not hasattr(torch.compiler, "load_cache_artifacts"):
+      logging.warning(
+          "Ignoring compiler cache %s, torch %s cannot load it.",
+          path,
+          torch.__version__,
+      )
+      return
+    with open(path, "rb") as f:
+      artifacts = f.read()
+    try:
+      torch.compiler.load_cache_artifacts(artifacts)
+    except Exception:  # pylint: disable=broad-except
+      logging.warning(
+          "Ignoring unreadable compiler cache %s.", path, exc_info=True
+      )
+
+  def _save_artifacts(self) -> None:
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+      return
+    artifacts = torch.compiler.save_cache_artifacts()
+    if artifacts is None:
+      return
+    os.makedirs(self.cache_dir, exist_ok=True)
+    path = os.path.join(self.cache_dir, _ARTIFACTS_FILE)
+    with open(path + ".tmp", "wb") as f:
+      f.write(artifacts[0])
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,108 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Int8 quantized TimesFM 2.5 for CPU serving."""
+
+from safetensors.torch import save_file
+import torch
+
+from .. import configs
+from ..torch import quantization
+from ..torch import util
+from . import timesfm_2p5_torch
+
+_FORMAT = "timesfm_2p5_200m_int8"
+
+
+def quantize_module(
+    module: timesfm_2p5_torch.TimesFM_2p5_200M_torch_module,
+    verify: bool = True,
+) -> None:
+  """Folds the weights of the module and quantizes them to int8, in place.
+
+  The linear layers of the transformer stack and of the output heads become
+  Int8Linear layers. The tokenizer, whose inputs are the raw normalized
+  values, stays in float.
+
+  Args:
+    module: A TimesFM 2.5 torch module.
+    verify: Whether to verify the weight folding, see `fold_weights`.
+  """
+  module.fold_weights(verify=verify)
+  for child in [
+      module.stacked_xf,
+      module.output_projection_point,
+      module.output_projection_quantiles,
+  ]:
+    quantization.quantize_linear_layers(child)
+
+
+class TimesFM_2p5_200M_torch_int8(timesfm_2p5_torch.TimesFM_2p5_200M_torch):
+  """TimesFM 2.5 with int8 weights and dynamically quantized activations.
+
+  The model is produced from the float safetensors checkpoint by
+  `load_checkpoint`, and can be saved with `save_quantized` and loaded back
+  with `load_quantized` as its own, about 4x smaller, artifact.
+  """
+
+  def load_checkpoint(
+      self,
+      *,
+      path: str | None = None,
+      hf_repo_id: str | None = "google/timesfm-2.5-200m-pytorch",
+  ) -> None:
+    """Loads a float safetensors checkpoint and quantizes it.
+
+    Args:
+        path: Path to a local checkpoint. If not provided, will try to download
+          from the default Hugging Face repo.
+        hf_repo_id: If provided, will download from the specified Hugging Face
+          repo instead.
+    """
+    super().load_checkpoint(path=path, hf_repo_id=hf_repo_id)
+    quantize_module(self.model)
+
+  def compile(
+      self, forecast_config: configs.ForecastConfig, **kwargs
+  ) -> None:
+    """Compiles the model, see TimesFM_2p5_200M_torch.compile.
+
+    Lower precisions are not supported: casting the model would also cast
+    the float32 scales of the int8 weights.
+    """
+    if forecast_config.precision != "float32":
+      raise ValueError(
+          "The int8 model only runs in float32, not in"
+          f" {forecast_config.precision}."
+      )
+    super().compile(forecast_config, **kwargs)
+
+  def save_quantized(self, path: str) -> None:
+    """Saves the quantized weights as a safetensors file."""
+    save_file(
+        {k: v.contiguous() for k, v in self.model.state_dict().items()},
+        path,
+        metadata={"format": _FORMAT},
+    )
+
+  def load_quantized(self, path: str) -> None:
+    """Loads quantized weights saved by `save_quantized`."""
+    tensors, metadata = util.mmap_safetensors(path)
+    if metadata.get("format") != _FORMAT:
+      raise ValueError(f"{path} is not a quantized TimesFM 2.5 checkpoint.")
+    with torch.device("meta"):
+      module = type(self.model)()
+      quantize_module(module, verify=False)
+    module.load_state_dict(tensors, assign=True)
+    self.model = module.to(module.device)
@@ -0,0 +1,207 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""onnxruntime implementation of TimesFM 2.5.
+
+Runs the graphs written by timesfm_2p5_onnx_export on CPU with numpy only, so
+it can be deployed without torch.
+"""
+
+import logging
+import math
+import os
+
+import numpy as np
+import onnxruntime as ort
+
+from .. import configs
+from . import timesfm_2p5_base
+
+# File names of timesfm_2p5_onnx_export.
+PREFILL_FILE = "prefill.onnx"
+DECODE_STEP_FILE = "decode_step.onnx"
+
+
+class TimesFM_2p5_200M_onnx(timesfm_2p5_base.TimesFM_2p5):
+  """onnxruntime implementation of TimesFM 2.5 with 200M parameters.
+
+  Export the graphs with timesfm_2p5_onnx_export.export, or
+  TimesFM_2p5_200M_torch.export_onnx, and load them with `load_checkpoint`.
+  """
+
+  config = timesfm_2p5_base.TimesFM_2p5_200M_Definition()
+
+  def __init__(self):
+    self.p = self.config.input_patch_len
+    self.o = self.config.output_patch_len
+    self.os = self.config.output_quantile_len
+    self.q = len(self.config.quantiles) + 1
+    self.aridx = self.config.decode_index
+    self.prefill_session: ort.InferenceSession | None = None
+    self.decode_step_session: ort.InferenceSession | None = None
+
+  def load_checkpoint(
+      self,
+      path: str,
+      *,
+      num_threads: int = 0,
+      providers: list[str] | None = None,
+  ) -> None:
+    """Loads the exported graphs into onnxruntime sessions.
+
+    Args:
+      path: Directory holding `prefill.onnx` and `decode_step.onnx`.
+      num_threads: Number of intra-op threads of each session. 0 lets
+        onnxruntime decide.
+      providers: onnxruntime execution providers, the CPU one by default.
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = (
+        ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    options.intra_op_num_threads = num_threads
+    providers = providers or ["CPUExecutionProvider"]
+    logging.info("Loading ONNX graphs from: %s", path)
+    self.prefill_session = ort.InferenceSession(
+        os.path.join(path, PREFILL_FILE), options, providers=providers
+    )
+    self.decode_step_session = ort.InferenceSession(
+        os.path.join(path, DECODE_STEP_FILE), options, providers=providers
+    )
+
+  def decode(
+      self, horizon: int, inputs: np.ndarray, masks: np.ndarray
+  ) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """Decodes the time series.
+
+    Returns:
+      The same renormalized outputs as TimesFM_2p5_200M_torch_module.decode:
+      the outputs of every context patch [b, num_patches, o, q], the quantile
+      spread of the last patch [b, os, q] and the autoregressive outputs
+      [b, num_decode_steps, o, q], or None if no step is needed.
+    """
+    outputs, quantile_spread, n, mu, sigma, keys, values, num_masked = (
+        self.prefill_session.run(
+            None,
+            {
+                "inputs": np.ascontiguousarray(inputs, dtype=np.float32),
+                "masks": np.ascontiguousarray(masks, dtype=bool),
+            },
+        )
+    )
+    num_decode_steps = (horizon - 1) // self.o
+    last_output = outputs[:, -1, :, self.aridx]
+    ar_outputs = []
+    for _ in range(num_decode_steps):
+      output, n, mu, sigma, keys, values, num_masked = (
+          self.decode_step_session.run(
+              None,
+              {
+                  "last_output": last_output,
+                  "n": n,
+                  "mu": mu,
+                  "sigma": sigma,
+                  "keys": keys,
+                  "values": values,
+                  "num_masked": num_masked,
+              },
+          )
+      )
+      ar_outputs.append(output)
+      last_output = output[..., self.aridx]
+    return (
+        outputs,
+        quantile_spread,
+        np.stack(ar_outputs, axis=1) if ar_outputs else None,
+    )
+
+  def compile(self, forecast_config: configs.ForecastConfig) -> None:
+    """Sets up decoding for the forecast config.
+
+    Supports the same forecasting flags as TimesFM_2p5_200M_torch.compile,
+    except for the attention window and the decode cache precision, which
+    the exported graphs do not implement. The torch-specific
+    `attention_backend`, `precision` and `num_cpu_workers` flags are
+    ignored.
+
+    Args:
+      forecast_config: Configuration for forecasting flags.
+    """
+    if self.prefill_session is None:
+      raise ValueError("Load the ONNX graphs with load_checkpoint first.")
+    if forecast_config.attention_window or forecast_config.num_global_patches:
+      raise ValueError("The ONNX graphs do not support an attention window.")
+    if forecast_config.kv_cache_precision != "auto":
+      raise ValueError(
+          "The ONNX graphs do not support the decode cache precision"
+          f" {forecast_config.kv_cache_precision}."
+      )
+    self.input_patch_len = self.p
+    self.output_patch_len = self.o
+    self.global_batch_size = forecast_config.per_core_batch_size
+
+    # Shortcut.
+    fc = forecast_config
+
+    if fc.max_context % self.p != 0:
+      logging.info(
+          "When compiling, max context needs to be multiple of the patch size"
+          " %d. Using max context = %d instead.",
+          self.p,
+          new_context := math.ceil(fc.max_context / self.p) * self.p,
+      )
+      fc.max_context = new_context
+    if fc.max_horizon % self.o != 0:
+      logging.info(
+          "When compiling, max horizon needs to be multiple of the output patch"
+          " size %d. Using max horizon = %d instead.",
+          self.o,
+          new_horizon := math.ceil(fc.max_horizon / self.o) * self.o,
+      )
+      fc.max_horizon = new_horizon
+    if fc.max_context + fc.max_horizon > self.config.context_limit:
+      raise ValueError(
+          "Context + horizon must be less than the context limit."
+          f" {fc.max_context} + {fc.max_horizon} >"
+          f" {self.config.context_limit}."
+      )
+    if fc.use_continuous_quantile_head and (fc.max_horizon > self.os):
+      raise ValueError(
+          "Continuous quantile head is not supported for horizons >"
+          f" {self.os}."
+      )
+    self.forecast_config = fc
+
+    def _compiled_decode(horizon, inputs, masks):
+      if horizon > fc.max_horizon:
+        raise ValueError(
+            "Horizon must be less than the max horizon."
+            f" {horizon} > {fc.max_horizon}."
+        )
+
+      prepared = timesfm_2p5_base.prepare_decode_inputs(inputs, masks, fc)
+      outputs, quantile_spread, ar_outputs = self.decode(
+          self.horizon_bucket(horizon), prepared.inputs, prepared.masks
+      )
+      return timesfm_2p5_base.postprocess_forecast(
+          horizon,
+          outputs,
+          quantile_spread if fc.use_continuous_quantile_head else None,
+          ar_outputs,
+          prepared,
+          fc,
+          self.p,
+      )
+
+    self.compiled_decode = _compiled_decode
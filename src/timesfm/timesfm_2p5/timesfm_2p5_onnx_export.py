@@ -0,0 +1,263 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Exports the TimesFM 2.5 torch module to ONNX.
+
+The model is exported as two graphs with the decode caches of all layers as
+explicit inputs and outputs, so that a runtime without torch can drive the
+autoregressive decoding:
+
+- `prefill.onnx` runs the context through the model. Inputs: `inputs` and
+  `masks` of shape [b, context]. Outputs: `outputs` [b, num_patches, o, q],
+  the point head on every patch, `quantile_spread` [b, os, q], the running
+  stats `n`, `mu` and `sigma` [b], the caches `keys` and `values`
+  [num_layers, b, num_patches, h, hd] and `num_masked` [num_layers, b].
+- `decode_step.onnx` decodes one output patch. Inputs: `last_output` [b, o],
+  the point forecast fed back autoregressively, the running stats and the
+  caches as returned by the previous graph. Outputs: `output` [b, o, q], the
+  updated stats and the caches grown by o / p patches.
+
+The batch size, context and cache length are dynamic.
+"""
+
+import os
+
+import torch
+from torch import nn
+
+from ..torch import util
+
+PREFILL_FILE = "prefill.onnx"
+DECODE_STEP_FILE = "decode_step.onnx"
+
+
+def _make_caches(
+    module: nn.Module,
+    keys: torch.Tensor,
+    values: torch.Tensor,
+    next_index: torch.Tensor,
+    num_masked: torch.Tensor,
+) -> list[util.DecodeCache]:
+  """Wraps stacked keys and values into per-layer decode caches."""
+  # Every layer advances its own next_index in place.
+  return [
+      util.DecodeCache(
+          next_index=next_index.clone(),
+          num_masked=num_masked[i],
+          key=keys[i],
+          value=values[i],
+      )
+      for i in range(module.x)
+  ]
+
+
+def _stack_caches(
+    caches: list[util.DecodeCache],
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+  """Stacks the keys, values and masked counts of all layers."""
+  return (
+      torch.stack([c.key for c in caches]),
+      torch.stack([c.value for c in caches]),
+      torch.stack([c.num_masked.to(torch.int32) for c in caches]),
+  )
+
+
+class _PrefillGraph(nn.Module):
+  """Prefill with the decode caches as outputs."""
+
+  def __init__(self, module: nn.Module):
+    super().__init__()
+    self.module = module
+
+  def forward(self, inputs: torch.Tensor, masks: torch.Tensor):
+    module = self.module
+    batch_size = inputs.shape[0]
+    num_patches = inputs.shape[1] // module.p
+    zeros = torch.zeros(
+        (module.x, batch_size, num_patches, module.h, module.hd),
+        dtype=inputs.dtype,
+    )
+    caches = _make_caches(
+        module,
+        zeros,
+        torch.zeros_like(zeros),
+        torch.zeros(batch_size, dtype=torch.int32),
+        torch.zeros((module.x, batch_size), dtype=torch.int32),
+    )
+    outputs, quantile_spread, (n, mu, sigma) = module.prefill(
+        inputs, masks, caches
+    )
+    return (outputs, quantile_spread, n, mu, sigma, *_stack_caches(caches))
+
+
+class _DecodeStepGraph(nn.Module):
+  """One autoregressive step with the decode caches as inputs and outputs."""
+
+  def __init__(self, module: nn.Module):
+    super().__init__()
+    self.module = module
+
+  def forward(
+      self,
+      last_output: torch.Tensor,
+      n: torch.Tensor,
+      mu: torch.Tensor,
+      sigma: torch.Tensor,
+      keys: torch.Tensor,
+      values: torch.Tensor,
+      num_masked: torch.Tensor,
+  ):
+    module = self.module
+    num_layers, batch_size, cache_size, _, _ = keys.shape
+    room = keys.new_zeros((num_layers, batch_size, module.m) + keys.shape[3:])
+    caches = _make_caches(
+        module,
+        torch.cat([keys, room], dim=2),
+        torch.cat([values, room], dim=2),
+        torch.full((batch_size,), cache_size, dtype=torch.int32),
+        num_masked,
+    )
+    # The stats before the step are recomputed from the new patch, exactly as
+    # in TimesFM_2p5_200M_torch_module.autoregressive_decode.
+    patched_input = torch.reshape(last_output, (batch_size, module.m, module.p))
+    mask = torch.zeros_like(patched_input, dtype=torch.bool)
+    new_n, new_mu, new_sigma = util.cumulative_running_stats(
+        n, mu, sigma, patched_input, mask
+    )
+    normed_input = util.revin(patched_input, new_mu, new_sigma, reverse=False)
+    (_, _, normed_output, _), caches = module(
+        normed_input, mask, caches, point_head="last", quantile_head="none"
+    )
+    output = torch.reshape(
+        util.revin(
+            normed_output[:, 0],
+            new_mu[:, -1],
+            new_sigma[:, -1],
+            reverse=True,
+        ),
+        (batch_size, module.o, module.q),
+    )
+    return (
+        output,
+        new_n[:, -1],
+        new_mu[:, -1],
+        new_sigma[:, -1],
+        *_stack_caches(caches),
+    )
+
+
+def export(
+    module: nn.Module,
+    directory: str,
+    *,
+    example_batch_size: int = 2,
+    example_context: int = 512,
+) -> None:
+  """Exports the prefill and decode step graphs of a module to ONNX.
+
+  The exported graphs use the attention backend and the weights of the module
+  as they are, so a module with folded weights exports smaller graphs.
+
+  Args:
+    module: A float32 TimesFM_2p5_200M_torch_module on CPU.
+    directory: Directory to write `prefill.onnx` and `decode_step.onnx` to.
+    example_batch_size: Batch size of the example inputs traced for export.
+    example_context: Context of the example inputs traced for export.
+  """
+  if module.dtype != torch.float32:
+    raise ValueError(f"Only float32 modules can be exported: {module.dtype}.")
+  if module.stacked_xf[0].attn.attention_window > 0:
+    raise ValueError("Modules with an attention window cannot be exported.")
+  os.makedirs(directory, exist_ok=True)
+  module.eval()
+  p = module.p
+  batch = torch.export.Dim("batch")
+  patches = torch.export.Dim("patches", max=module.config.context_limit // p)
+  cache = torch.export.Dim("cache", max=module.config.context_limit // p)
+
+  with torch.no_grad():
+    inputs = torch.randn(example_batch_size, example_context)
+    masks = torch.zeros_like(inputs, dtype=torch.bool)
+    masks[0, : example_context // 3] = True
+    torch.onnx.export(
+        _PrefillGraph(module).eval(),
+        (inputs, masks),
+        os.path.join(directory, PREFILL_FILE),
+        dynamo=True,
+        input_names=["inputs", "masks"],
+        output_names=[
+            "outputs",
+            "quantile_spread",
+            "n",
+            "mu",
+            "sigma",
+            "keys",
+            "values",
+            "num_masked",
+        ],
+        dynamic_shapes=(
+            {0: batch, 1: p * patches},
+            {0: batch, 1: p * patches},
+        ),
+    )
+
+    step_graph = _DecodeStepGraph(module).eval()
+    num_patches = example_context // p
+    stats = [torch.full((example_batch_size,), v) for v in (300.0, 0.1, 1.0)]
+    cache_shape = (
+        module.x,
+        example_batch_size,
+        num_patches,
+        module.h,
+        module.hd,
+    )
+    torch.onnx.export(
+        step_graph,
+        (
+            torch.randn(example_batch_size, module.o),
+            *stats,
+            torch.randn(cache_shape),
+            torch.randn(cache_shape),
+            torch.zeros((module.x, example_batch_size), dtype=torch.int32),
+        ),
+        os.path.join(directory, DECODE_STEP_FILE),
+        dynamo=True,
+        input_names=[
+            "last_output",
+            "n",
+            "mu",
+            "sigma",
+            "keys",
+            "values",
+            "num_masked",
+        ],
+        output_names=[
+            "output",
+            "new_n",
+            "new_mu",
+            "new_sigma",
+            "new_keys",
+            "new_values",
+            "new_num_masked",
+        ],
+        dynamic_shapes=(
+            {0: batch},
+            {0: batch},
+            {0: batch},
+            {0: batch},
+            {1: batch, 2: cache},
+            {1: batch, 2: cache},
+            {1: batch},
+        ),
+    )
@@ -0,0 +1,339 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Packed decoding of several short series per row of the TimesFM 2.5 stack.
+
+In a left-padded batch, a short series occupies a full row and its padded
+patches still go through every transformer layer. Packed decoding moves the
+unpadded patches of all series into as few rows as possible, back to back,
+and only runs the transformer stack on those rows:
+
+- every patch attends causally to the patches of its own series only, through
+  a block-diagonal mask,
+- rotary positions count from the first patch of every series,
+- running stats, normalization and the output heads are computed per series,
+  exactly as in the unpacked decode.
+
+The outputs are unpacked back to one row per series, so packing does not
+change results beyond floating point summation order.
+"""
+
+import dataclasses
+
+import numpy as np
+import torch
+from torch import nn
+
+from ..torch import util
+
+
+@dataclasses.dataclass(frozen=True)
+class PackedLayout:
+  """Placement of the patches of a batch of series in packed rows.
+
+  Attributes:
+    num_rows: Number of packed rows.
+    width: Number of patches per packed row.
+    source: Flat index in the unpacked [b, num_input_patches] patches of every
+      packed patch, shape [num_tokens].
+    slot: Flat index in the packed [num_rows, width] patches of every packed
+      patch, shape [num_tokens].
+    segment: Series of every packed patch, or -1 for padding, shape
+      [num_rows, width].
+    position: Rotary position of every packed patch, shape [num_rows, width].
+    last_slot: Flat packed index of the last patch of every series, shape [b].
+    step_width: Number of patches per row in every autoregressive step.
+    step_slot: Flat index in the packed [num_rows, step_width] patches of the
+      new patches of every series, shape [b, m].
+    step_segment: Series of every patch of a step, or -1 for padding, shape
+      [num_rows, step_width].
+    step_position: Rotary position of every patch of the first step, shape
+      [num_rows, step_width]. Step i adds i * m.
+  """
+
+  num_rows: int
+  width: int
+  source: torch.Tensor
+  slot: torch.Tensor
+  segment: torch.Tensor
+  position: torch.Tensor
+  last_slot: torch.Tensor
+  step_width: int
+  step_slot: torch.Tensor
+  step_segment: torch.Tensor
+  step_position: torch.Tensor
+
+
+def make_packed_layout(
+    patch_masks: np.ndarray, patches_per_step: int, device: torch.device
+) -> PackedLayout:
+  """Packs the unpadded patches of left-padded series into rows.
+
+  Series are placed first-fit in decreasing order of length into rows as wide
+  as the unpacked context. Every series keeps at least its last patch.
+
+  Args:
+    patch_masks: Boolean patch padding masks of shape [b, num_input_patches],
+      True for padded patches. Padding must be on the left.
+    patches_per_step: Number of patches every series appends per
+      autoregressive step.
+    device: Device of the layout tensors.
+
+  Returns:
+    The packed layout.
+  """
+  batch_size, capacity = patch_masks.shape
+  m = patches_per_step
+  num_patches = np.maximum(np.sum(~patch_masks, axis=1), 1)
+
+  rows: list[list[int]] = []
+  fill: list[int] = []
+  for i in np.argsort(-num_patches, kind="stable").tolist():
+    for r, used in enumerate(fill):
+      if used + num_patches[i] <= capacity:
+        break
+    else:
+      r = len(rows)
+      rows.append([])
+      fill.append(0)
+    rows[r].append(i)
+    fill[r] += int(num_patches[i])
+
+  num_rows = len(rows)
+  width = max(fill)
+  step_width = m * max(len(row) for row in rows)
+  source, slot = [], []
+  segment = np.full((num_rows, width), -1, dtype=np.int64)
+  position = np.zeros((num_rows, width), dtype=np.int64)
+  last_slot = np.zeros(batch_size, dtype=np.int64)
+  step_slot = np.zeros((batch_size, m), dtype=np.int64)
+  step_segment = np.full((num_rows, step_width), -1, dtype=np.int64)
+  step_position = np.zeros((num_rows, step_width), dtype=np.int64)
+  for r, row in enumerate(rows):
+    start = 0
+    for k, i in enumerate(row):
+      n = int(num_patches[i])
+      source.append(i * capacity + np.arange(capacity - n, capacity))
+      slot.append(r * width + np.arange(start, start + n))
+      segment[r, start : start + n] = i
+      position[r, start : start + n] = np.arange(n)
+      last_slot[i] = r * width + start + n - 1
+      step_slot[i] = r * step_width + np.arange(k * m, (k + 1) * m)
+      step_segment[r, k * m : (k + 1) * m] = i
+      step_position[r, k * m : (k + 1) * m] = n + np.arange(m)
+      start += n
+
+  def tensor(x):
+    return torch.as_tensor(x, dtype=torch.long, device=device)
+
+  return PackedLayout(
+      num_rows=num_rows,
+      width=width,
+      source=tensor(np.concatenate(source)),
+      slot=tensor(np.concatenate(slot)),
+      segment=tensor(segment),
+      position=tensor(position),
+      last_slot=tensor(last_slot),
+      step_width=step_width,
+      step_slot=tensor(step_slot),
+      step_segment=tensor(step_segment),
+      step_position=tensor(step_position),
+  )
+
+
+def block_causal_mask(
+    query_segment: torch.Tensor,
+    query_offset: int,
+    kv_segment: torch.Tensor,
+) -> torch.Tensor:
+  """Returns the attention mask of packed queries over a packed cache.
+
+  Args:
+    query_segment: Series of every query, or -1 for padding, shape [r, q].
+    query_offset: Cache index of the first query.
+    kv_segment: Series of every cache entry, shape [r, k].
+
+  Returns:
+    A boolean mask of shape [r, 1, q, k], True where a query attends to a key:
+    keys of the same series at or before the query.
+  """
+  q_index = query_offset + torch.arange(
+      query_segment.shape[1], device=query_segment.device
+  )
+  kv_index = torch.arange(kv_segment.shape[1], device=kv_segment.device)
+  return (
+      (query_segment[:, :, None] == kv_segment[:, None, :])
+      & (query_segment >= 0)[:, :, None]
+      & (q_index[:, None] >= kv_index[None, :])[None]
+  )[:, None]
+
+
+def _run_stack(
+    module: nn.Module,
+    embeddings: torch.Tensor,
+    segment: torch.Tensor,
+    position: torch.Tensor,
+    attn_mask: torch.Tensor,
+    decode_caches: list[util.DecodeCache],
+) -> torch.Tensor:
+  """Runs the transformer stack on packed embeddings."""
+  patch_mask = segment < 0
+  for layer, cache in zip(module.stacked_xf, decode_caches):
+    embeddings, _ = layer(
+        embeddings, patch_mask, cache, attn_mask=attn_mask, position=position
+    )
+  return embeddings
+
+
+def _tokenize(
+    module: nn.Module, inputs: torch.Tensor, masks: torch.Tensor
+) -> torch.Tensor:
+  tokenizer_inputs = torch.cat([inputs, masks.to(inputs.dtype)], dim=-1)
+  return module.tokenizer(tokenizer_inputs.to(module.dtype))
+
+
+def decode_packed(
+    module: nn.Module,
+    horizon: int,
+    inputs: torch.Tensor,
+    masks: torch.Tensor,
+    *,
+    return_quantile_spread: bool = True,
+):
+  """Decodes left-padded series with several series packed per row.
+
+  Args:
+    module: A TimesFM_2p5_200M_torch_module.
+    horizon: The horizon to decode.
+    inputs: Left-padded contexts of shape [b, context].
+    masks: Padding masks of the same shape, True for padded points.
+    return_quantile_spread: Whether to run the quantile head.
+
+  Returns:
+    The same outputs as TimesFM_2p5_200M_torch_module.decode with
+    `return_all_patches=False`.
+  """
+  p, m, o, q = module.p, module.m, module.o, module.q
+  inputs = inputs.to(module.device)
+  masks = masks.to(module.device)
+  batch_size = inputs.shape[0]
+  patched_inputs = torch.reshape(inputs, (batch_size, -1, p))
+  patched_masks = torch.reshape(masks, (batch_size, -1, p))
+  num_decode_steps = (horizon - 1) // o
+
+  layout = make_packed_layout(
+      patched_masks[..., -1].cpu().numpy(), m, inputs.device
+  )
+  r, w, sw = layout.num_rows, layout.width, layout.step_width
+  cache_size = w + num_decode_steps * sw
+  decode_caches = module._get_decode_caches(  # pylint: disable=protected-access
+      r, cache_size, inputs.device
+  )
+  kv_segment = torch.cat(
+      [layout.segment] + [layout.step_segment] * num_decode_steps, dim=1
+  )
+
+  # Prefill. The stats and normalization are computed on the unpacked rows.
+  zeros = torch.zeros(batch_size, device=inputs.device)
+  context_n, context_mu, context_sigma = util.cumulative_running_stats(
+      zeros, zeros, zeros, patched_inputs, patched_masks
+  )
+  last_n = context_n[:, -1]
+  last_mu = context_mu[:, -1]
+  last_sigma = context_sigma[:, -1]
+  normed_inputs = util.revin(
+      patched_inputs, context_mu, context_sigma, reverse=False
+  )
+  normed_inputs = torch.where(patched_masks, 0.0, normed_inputs)
+  tokens = _tokenize(
+      module,
+      normed_inputs.reshape(-1, p)[layout.source],
+      patched_masks.reshape(-1, p)[layout.source],
+  )
+  embeddings = tokens.new_zeros((r * w, tokens.shape[-1]))
+  embeddings[layout.slot] = tokens
+  embeddings = _run_stack(
+      module,
+      embeddings.view(r, w, -1),
+      layout.segment,
+      layout.position,
+      block_causal_mask(layout.segment, 0, kv_segment),
+      decode_caches,
+  )
+  last_embeddings = embeddings.reshape(r * w, -1)[layout.last_slot]
+  outputs = module.output_projection_point(last_embeddings).to(torch.float32)
+  outputs = torch.reshape(
+      util.revin(outputs, last_mu, last_sigma, reverse=True),
+      (batch_size, 1, o, q),
+  )
+  if return_quantile_spread:
+    quantile_spread = module.output_projection_quantiles(last_embeddings)
+    quantile_spread = torch.reshape(
+        util.revin(
+            quantile_spread.to(torch.float32),
+            last_mu,
+            last_sigma,
+            reverse=True,
+        ),
+        (batch_size, module.os, q),
+    )
+  else:
+    quantile_spread = None
+
+  # Autoregressive decode, with the new patches of every series packed into
+  # the rows of the series.
+  last_output = outputs[:, -1, :, module.aridx]
+  ar_outputs = []
+  for step in range(num_decode_steps):
+    new_input = torch.reshape(last_output, (batch_size, m, p))
+    new_mask = torch.zeros_like(new_input, dtype=torch.bool)
+    new_n, new_mu, new_sigma = util.cumulative_running_stats(
+        last_n, last_mu, last_sigma, new_input, new_mask
+    )
+    last_n = new_n[:, -1]
+    last_mu = new_mu[:, -1]
+    last_sigma = new_sigma[:, -1]
+    tokens = _tokenize(
+        module,
+        util.revin(new_input, new_mu, new_sigma, reverse=False),
+        new_mask,
+    )
+    embeddings = tokens.new_zeros((r * sw, tokens.shape[-1]))
+    embeddings[layout.step_slot.reshape(-1)] = tokens.reshape(
+        batch_size * m, -1
+    )
+    embeddings = _run_stack(
+        module,
+        embeddings.view(r, sw, -1),
+        layout.step_segment,
+        layout.step_position + step * m,
+        block_causal_mask(layout.step_segment, w + step * sw, kv_segment),
+        decode_caches,
+    )
+    last_embeddings = embeddings.reshape(r * sw, -1)[layout.step_slot[:, -1]]
+    new_output = module.output_projection_point(last_embeddings)
+    new_output = torch.reshape(
+        util.revin(
+            new_output.to(torch.float32), last_mu, last_sigma, reverse=True
+        ),
+        (batch_size, o, q),
+    )
+    ar_outputs.append(new_output)
+    last_output = new_output[..., module.aridx]
+
+  return (
+      outputs,
+      quantile_spread,
+      torch.stack(ar_outputs, dim=1) if ar_outputs else None,
+  )
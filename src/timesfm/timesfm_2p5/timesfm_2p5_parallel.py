@@ -0,0 +1,232 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Data-parallel decoding of the TimesFM 2.5 torch module."""
+
+from concurrent import futures
+import copy
+from typing import Sequence
+
+import torch
+import torch.multiprocessing as mp
+
+from ..torch import util
+
+DecodeOutputs = tuple[torch.Tensor, torch.Tensor, torch.Tensor | None]
+
+
+def _split_batch(
+    inputs: torch.Tensor, masks: torch.Tensor, num_shards: int
+) -> list[tuple[torch.Tensor, torch.Tensor]]:
+  """Splits a batch into at most `num_shards` non-empty contiguous shards."""
+  return [
+      (x, m)
+      for x, m in zip(
+          torch.tensor_split(inputs, num_shards),
+          torch.tensor_split(masks, num_shards),
+      )
+      if len(x)
+  ]
+
+
+def _gather(outputs: Sequence[DecodeOutputs]) -> DecodeOutputs:
+  """Concatenates the decode outputs of all shards along the batch axis."""
+  return tuple(
+      None if parts[0] is None else torch.cat(parts, dim=0)
+      for parts in zip(*outputs)
+  )
+
+
+class DeviceParallelDecoder:
+  """Shards decode batches across replicas of the model on several devices.
+
+  The weights are replicated once to every device. Each call splits the batch
+  into one contiguous sub-batch per device, decodes all of them concurrently
+  from a thread pool and gathers the results on the device of the first
+  replica.
+  """
+
+  def __init__(self, model: torch.nn.Module, devices: Sequence[torch.device]):
+    self.replicas = [model]
+    for device in devices[1:]:
+      replica = copy.deepcopy(model).to(device)
+      replica.device = torch.device(device)
+      replica._decode_cache_arena = None  # pylint: disable=protected-access
+      self.replicas.append(replica)
+    self._executor = futures.ThreadPoolExecutor(
+        max_workers=len(self.replicas), thread_name_prefix="TimesFMReplica"
+    )
+
+  def decode(
+      self, horizon: int, inputs: torch.Tensor, masks: torch.Tensor, **kwargs
+  ) -> DecodeOutputs:
+    shards = _split_batch(inputs, masks, len(self.replicas))
+    outputs = list(
+        self._executor.map(
+            lambda args: args[0].decode(horizon, *args[1], **kwargs),
+            zip(self.replicas, shards),
+        )
+    )
+    device = self.replicas[0].device
+    return _gather([
+        tuple(None if x is None else x.to(device) for x in output)
+        for output in outputs
+    ])
+
+  def close(self) -> None:
+    self._executor.shutdown()
+
+
+def _set_tensor(model: torch.nn.Module, name: str, tensor: torch.Tensor):
+  """Replaces the parameter or buffer `name` of the model with `tensor`."""
+  # pylint: disable=protected-access
+  module_name, _, attr = name.rpartition(".")
+  module = model.get_submodule(module_name)
+  if attr in module._parameters:
+    if not isinstance(tensor, torch.nn.Parameter):
+      tensor = torch.nn.Parameter(
+          tensor, requires_grad=module._parameters[attr].requires_grad
+      )
+    module._parameters[attr] = tensor
+  else:
+    module._buffers[attr] = tensor
+
+
+def _cpu_worker(
+    model: torch.nn.Module,
+    connection,
+    num_threads: int,
+    checkpoint: tuple[str, list[str]] | None,
+) -> None:
+  """Serves decode requests of a CpuWorkerPoolDecoder."""
+  torch.set_num_threads(num_threads)
+  if checkpoint is not None:
+    # Map the weights that the parent sent as placeholders from the file.
+    path, names = checkpoint
+    tensors, _ = util.mmap_safetensors(path)
+    for name in names:
+      _set_tensor(model, name, tensors[name])
+  while (request := connection.recv()) is not None:
+    horizon, inputs, masks, kwargs = request
+    try:
+      outputs = model.decode(
+          horizon, torch.from_numpy(inputs), torch.from_numpy(masks), **kwargs
+      )
+      connection.send(
+          tuple(None if x is None else x.cpu().numpy() for x in outputs)
+      )
+    except Exception as e:  # pylint: disable=broad-except
+      connection.send(e)
+
+
+class CpuWorkerPoolDecoder:
+  """Shards decode batches across CPU worker processes.
+
+  The CPU counterpart of DeviceParallelDecoder. The workers are started with
+  the "spawn" method. Weights still backed by the memory-mapped checkpoint,
+  see `mapped_checkpoint`, are mapped again from the file by every worker,
+  so all processes share its page cache without any copy. All other
+  weights, e.g. randomly initialized, cast to another precision or folded,
+  are copied once into a shared memory segment that all workers map. The
+  intra-op threads of the host are split evenly between the workers.
+  """
+
+  def __init__(self, model: torch.nn.Module, num_workers: int):
+    if num_workers < 1:
+      raise ValueError(f"num_workers must be positive: {num_workers}.")
+    path, mapped = model.mapped_checkpoint()
+    state = model.state_dict(keep_vars=True)
+    for name, tensor in state.items():
+      if name not in mapped:
+        tensor.share_memory_()
+    # Every worker allocates its own decode caches.
+    model._decode_cache_arena = None  # pylint: disable=protected-access
+    num_threads = max(1, torch.get_num_threads() // num_workers)
+    context = mp.get_context("spawn")
+    self._connections = []
+    self._processes = []
+    # The mapped weights are sent as data-less placeholders while the
+    # workers are started, which pickles the model.
+    for name in mapped:
+      _set_tensor(model, name, state[name].to("meta"))
+    try:
+      for _ in range(num_workers):
+        connection, worker_connection = context.Pipe()
+        process = context.Process(
+            target=_cpu_worker,
+            args=(
+                model,
+                worker_connection,
+                num_threads,
+                (path, mapped) if mapped else None,
+            ),
+            daemon=True,
+        )
+        process.start()
+        self._connections.append(connection)
+        self._processes.append(process)
+    finally:
+      for name in mapped:
+        _set_tensor(model, name, state[name])
+
+  def decode(
+      self, horizon: int, inputs: torch.Tensor, masks: torch.Tensor, **kwargs
+  ) -> DecodeOutputs:
+    shards = _split_batch(inputs.cpu(), masks.cpu(), len(self._connections))
+    for connection, (x, m) in zip(self._connections, shards):
+      connection.send((horizon, x.numpy(), m.numpy(), kwargs))
+    outputs = []
+    errors = []
+    for connection, _ in zip(self._connections, shards):
+      output = connection.recv()
+      if isinstance(output, Exception):
+        errors.append(output)
+      else:
+        outputs.append(
+            tuple(None if x is None else torch.from_numpy(x) for x in output)
+        )
+    if errors:
+      raise errors[0]
+    return _gather(outputs)
+
+  def close(self) -> None:
+    for connection in self._connections:
+      connection.send(None)
+    for process in self._processes:
+      process.join()
+    self._connections = []
+    self._processes = []
+
+
+def make_decoder(model: torch.nn.Module, num_cpu_workers: int = 0):
+  """Returns a data-parallel decoder for the model, if there is parallelism.
+
+  Args:
+    model: A TimesFM 2.5 torch module.
+    num_cpu_workers: Number of CPU worker processes to use when the model
+      runs on CPU.
+
+  Returns:
+    A DeviceParallelDecoder if the model is on a CUDA device and there are
+    several of them, a CpuWorkerPoolDecoder if the model is on CPU and
+    `num_cpu_workers` > 1, and None otherwise.
+  """
+  if model.device.type == "cuda" and model.device_count > 1:
+    return DeviceParallelDecoder(
+        model,
+        [torch.device("cuda", i) for i in range(model.device_count)],
+    )
+  if model.device.type == "cpu" and num_cpu_workers > 1:
+    return CpuWorkerPoolDecoder(model, num_cpu_workers)
+  return None
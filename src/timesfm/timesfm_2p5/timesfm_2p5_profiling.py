@@ -0,0 +1,484 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-stage and per-layer profiling of the TimesFM 2.5 forecast pipeline.
+
+The pipeline marks its stages with `stage(name)`, e.g. "preprocess",
+"prefill" or "autoregressive_decode". While no Profiler is active, `stage`
+returns a shared no-op context manager after a single global lookup, so the
+markers cost next to nothing. Inside `with Profiler() as profiler:`, every
+stage entered on any thread is recorded with its wall time and, optionally,
+the tensors it allocated and its peak memory. Modules passed to the Profiler,
+e.g. the transformer layers, are recorded through forward hooks that only
+exist while the Profiler is active.
+
+On CUDA, the profiler synchronizes with the device at the start and end of
+every stage, so that the kernels a stage launches are charged to it rather
+than to the next stage that waits for the device, e.g. the copy of the
+results to the host.
+
+Stages are skipped while torch.compile traces a graph, so compiled decode
+graphs are recorded as a whole by the stage around them. Entering a profiler
+changes the globals and hooks the graphs are guarded on, so the first
+profiled call of a compiled graph recompiles it.
+"""
+
+import collections
+import contextlib
+import dataclasses
+import importlib
+import json
+import sys
+import threading
+import time
+from typing import Any, Mapping
+import weakref
+
+# The active profiler, or None. Read without a lock on the fast path.
+_ACTIVE: "Profiler | None" = None
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def _not_compiling() -> bool:
+  return False
+
+
+# Whether torch.compile is tracing, set to torch.compiler.is_compiling once a
+# profiler is entered with torch loaded.
+_is_compiling = _not_compiling
+
+
+def stage(name: str) -> contextlib.AbstractContextManager:
+  """Returns a context manager recording `name` in the active profiler."""
+  profiler = _ACTIVE
+  if profiler is None or _is_compiling():
+    return _NULL_STAGE
+  return profiler.stage(name)
+
+
+@dataclasses.dataclass(frozen=True)
+class ProfileEvent:
+  """One recorded stage.
+
+  Attributes:
+    name: Name of the stage.
+    category: "stage" for pipeline stages, "module" for hooked modules.
+    start_us: Start time in microseconds since the profiler was entered.
+    duration_us: Wall time in microseconds.
+    thread_id: Identifier of the thread the stage ran on.
+    depth: Number of enclosing stages on the same thread.
+    num_tensors: Number of tensors allocated during the stage, or None if
+      memory is not recorded.
+    allocated_bytes: Bytes of the tensors allocated during the stage, or None.
+    peak_bytes: Peak memory allocated during the stage above the memory
+      allocated when it started, or None. The profiler never resets the
+      peak statistics of the process, so when the stage does not set a new
+      process-wide peak this is a lower bound: the larger of the memory
+      allocated at its start and at its end.
+  """
+
+  name: str
+  category: str
+  start_us: float
+  duration_us: float
+  thread_id: int
+  depth: int
+  num_tensors: int | None = None
+  allocated_bytes: int | None = None
+  peak_bytes: int | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class StageSummary:
+  """Aggregate of all events of one stage.
+
+  Attributes:
+    name: Name of the stage.
+    count: Number of times the stage ran.
+    total_ms: Total wall time in milliseconds.
+    mean_ms: Mean wall time in milliseconds.
+    max_ms: Maximum wall time in milliseconds.
+    num_tensors: Total number of tensors allocated, or None.
+    allocated_bytes: Total bytes of the tensors allocated, or None.
+    peak_bytes: Maximum peak memory of a single run, or None.
+  """
+
+  name: str
+  count: int
+  total_ms: float
+  mean_ms: float
+  max_ms: float
+  num_tensors: int | None
+  allocated_bytes: int | None
+  peak_bytes: int | None
+
+
+@dataclasses.dataclass
+class _Frame:
+  name: str
+  category: str
+  start_ns: int
+  start_bytes: int = 0
+  start_count: int = 0
+  start_allocated: int = 0
+  start_peak: int = 0
+
+
+class _CudaMemory:
+  """Reads the allocator stats of the current CUDA device."""
+
+  def __init__(self, torch):
+    self._cuda = torch.cuda
+
+  def counters(self) -> tuple[int, int, int]:
+    """Returns the live bytes, allocation count and allocated bytes."""
+    stats = self._cuda.memory_stats()
+    return (
+        stats.get("allocated_bytes.all.current", 0),
+        stats.get("allocation.all.allocated", 0),
+        stats.get("allocated_bytes.all.allocated", 0),
+    )
+
+  def peak(self) -> int:
+    """Returns the peak bytes allocated since the process last reset them."""
+    return self._cuda.max_memory_allocated()
+
+  def close(self) -> None:
+    pass
+
+
+class _TensorMemory:
+  """Tracks the tensors created by torch ops on the profiling thread.
+
+  Every op output that does not alias an input counts as an allocation of
+  its storage. Allocated tensors are tracked until they are garbage
+  collected, which gives the live and peak bytes. Tensors created on other
+  threads or outside of torch ops, e.g. by numpy, are not seen.
+  """
+
+  def __init__(self, torch):
+    python_dispatch = importlib.import_module("torch.utils._python_dispatch")
+    self._tree_leaves = importlib.import_module(
+        "torch.utils._pytree"
+    ).tree_leaves
+    tracker = self
+    self.live_bytes = 0
+    self.num_allocated = 0
+    self.allocated_bytes = 0
+    self._peak = 0
+    self._lock = threading.Lock()
+
+    class _Mode(python_dispatch.TorchDispatchMode):
+
+      def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        outputs = func(*args, **(kwargs or {}))
+        tracker.record(args, kwargs, outputs)
+        return outputs
+
+    self._torch = torch
+    self._mode = _Mode()
+    self._mode.__enter__()
+
+  def record(self, args, kwargs, outputs) -> None:
+    """Counts the outputs of an op that own new storage."""
+    torch = self._torch
+    tensors = self._tree_leaves(outputs)
+    inputs = {
+        t.untyped_storage().data_ptr()
+        for t in self._tree_leaves((args, kwargs))
+        if isinstance(t, torch.Tensor) and t.layout == torch.strided
+    }
+    for t in tensors:
+      if not isinstance(t, torch.Tensor) or t.layout != torch.strided:
+        continue
+      storage = t.untyped_storage()
+      if storage.data_ptr() in inputs or storage.nbytes() == 0:
+        continue
+      nbytes = storage.nbytes()
+      with self._lock:
+        self.num_allocated += 1
+        self.allocated_bytes += nbytes
+        self.live_bytes += nbytes
+        self._peak = max(self._peak, self.live_bytes)
+      weakref.finalize(t, self._free, nbytes)
+
+  def _free(self, nbytes: int) -> None:
+    with self._lock:
+      self.live_bytes -= nbytes
+
+  def counters(self) -> tuple[int, int, int]:
+    return self.live_bytes, self.num_allocated, self.allocated_bytes
+
+  def peak(self) -> int:
+    """Returns the peak live bytes since the tracker was created."""
+    return self._peak
+
+  def close(self) -> None:
+    self._mode.__exit__(None, None, None)
+
+
+class _Stage:
+  """Records one stage of the profiler it belongs to."""
+
+  def __init__(self, profiler: "Profiler", name: str):
+    self._profiler = profiler
+    self._name = name
+
+  def __enter__(self):
+    self._profiler.push(self._name, "stage")
+
+  def __exit__(self, *exc_info):
+    self._profiler.pop()
+
+
+class Profiler:
+  """Records the wall time and memory of the stages of a forecast.
+
+  Usage:
+    modules = model.model.profiled_modules()
+    with timesfm.Profiler(modules=modules) as profiler:
+      model.forecast(horizon=128, inputs=inputs)
+    print(profiler.summary_table())
+    profiler.save_chrome_trace("trace.json")
+
+  Only one profiler can be active at a time. The trace can be opened in
+  chrome://tracing or Perfetto.
+  """
+
+  def __init__(
+      self,
+      *,
+      modules: Mapping[str, Any] | None = None,
+      record_memory: bool = False,
+      synchronize: bool = True,
+  ):
+    """Creates an inactive profiler.
+
+    Args:
+      modules: Torch modules to record every forward call of, by name.
+      record_memory: Whether to record the tensors allocated and the peak
+        memory of every stage. On CUDA this reads the allocator stats. On
+        CPU every torch op of the profiling thread is intercepted, which
+        slows the forecast down and makes compiled graphs fall back to
+        eager.
+      synchronize: Whether to synchronize with the CUDA device at stage
+        boundaries so that stages are charged their own kernels. Without it,
+        stages only measure the time the host spent launching their work.
+        Ignored without CUDA.
+    """
+    self.modules = dict(modules or {})
+    self.record_memory = record_memory
+    self.synchronize = synchronize
+    self.events: list[ProfileEvent] = []
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._start_ns = 0
+    self._hooks = []
+    self._memory = None
+    self._synchronize = None
+
+  def __enter__(self) -> "Profiler":
+    global _ACTIVE, _is_compiling
+    if _ACTIVE is not None:
+      raise RuntimeError("Another profiler is already active.")
+    torch = sys.modules.get("torch")
+    if torch is not None:
+      _is_compiling = torch.compiler.is_compiling
+      if self.synchronize and torch.cuda.is_available():
+        self._synchronize = torch.cuda.synchronize
+    if self.record_memory:
+      if torch is None:
+        raise RuntimeError("Recording memory requires torch.")
+      if torch.cuda.is_available():
+        self._memory = _CudaMemory(torch)
+      else:
+        self._memory = _TensorMemory(torch)
+    for name, module in self.modules.items():
+      self._hooks.append(
+          module.register_forward_pre_hook(self._pre_hook(name))
+      )
+      self._hooks.append(module.register_forward_hook(self._post_hook()))
+    self._start_ns = time.perf_counter_ns()
+    _ACTIVE = self
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    global _ACTIVE
+    _ACTIVE = None
+    for hook in self._hooks:
+      hook.remove()
+    self._hooks = []
+    if self._memory is not None:
+      self._memory.close()
+      self._memory = None
+    self._synchronize = None
+
+  def stage(self, name: str) -> _Stage:
+    """Returns a context manager recording a stage."""
+    return _Stage(self, name)
+
+  def _pre_hook(self, name: str):
+    def hook(module, args):
+      del module, args
+      if not _is_compiling():
+        self.push(name, "module")
+
+    return hook
+
+  def _post_hook(self):
+    def hook(module, args, output):
+      del module, args, output
+      if not _is_compiling():
+        self.pop()
+
+    return hook
+
+  def _stack(self) -> list[_Frame]:
+    if not hasattr(self._local, "stack"):
+      self._local.stack = []
+    return self._local.stack
+
+  def push(self, name: str, category: str) -> None:
+    """Starts recording a stage on the current thread."""
+    stack = self._stack()
+    frame = _Frame(name, category, 0)
+    if self._synchronize is not None:
+      self._synchronize()
+    if (memory := self._memory) is not None:
+      frame.start_bytes, frame.start_count, frame.start_allocated = (
+          memory.counters()
+      )
+      frame.start_peak = memory.peak()
+    stack.append(frame)
+    frame.start_ns = time.perf_counter_ns()
+
+  def pop(self) -> None:
+    """Stops recording the innermost stage of the current thread."""
+    if self._synchronize is not None:
+      self._synchronize()
+    end_ns = time.perf_counter_ns()
+    stack = self._stack()
+    frame = stack.pop()
+    num_tensors = allocated_bytes = peak_bytes = None
+    if (memory := self._memory) is not None:
+      live, count, allocated = memory.counters()
+      num_tensors = count - frame.start_count
+      allocated_bytes = allocated - frame.start_allocated
+      # A peak above the one at the start was reached during the stage.
+      peak = memory.peak()
+      if peak <= frame.start_peak:
+        peak = max(frame.start_bytes, live)
+      peak_bytes = peak - frame.start_bytes
+    event = ProfileEvent(
+        name=frame.name,
+        category=frame.category,
+        start_us=(frame.start_ns - self._start_ns) / 1e3,
+        duration_us=(end_ns - frame.start_ns) / 1e3,
+        thread_id=threading.get_ident(),
+        depth=len(stack),
+        num_tensors=num_tensors,
+        allocated_bytes=allocated_bytes,
+        peak_bytes=peak_bytes,
+    )
+    with self._lock:
+      self.events.append(event)
+
+  def summary(self) -> list[StageSummary]:
+    """Aggregates the events by stage name, by decreasing total time."""
+    groups = collections.defaultdict(list)
+    for event in self.events:
+      groups[event.name].append(event)
+    summaries = []
+    for name, events in groups.items():
+      durations = [e.duration_us / 1e3 for e in events]
+      has_memory = events[0].num_tensors is not None
+      summaries.append(
+          StageSummary(
+              name=name,
+              count=len(events),
+              total_ms=sum(durations),
+              mean_ms=sum(durations) / len(events),
+              max_ms=max(durations),
+              num_tensors=(
+                  sum(e.num_tensors for e in events) if has_memory else None
+              ),
+              allocated_bytes=(
+                  sum(e.allocated_bytes for e in events)
+                  if has_memory
+                  else None
+              ),
+              peak_bytes=(
+                  max(e.peak_bytes for e in events) if has_memory else None
+              ),
+          )
+      )
+    return sorted(summaries, key=lambda s: -s.total_ms)
+
+  def summary_table(self) -> str:
+    """Returns the summary as a markdown table."""
+    lines = [
+        "| stage | count | total (ms) | mean (ms) | max (ms) | tensors |"
+        " allocated (MB) | peak (MB) |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for s in self.summary():
+      memory = (
+          ["-"] * 3
+          if s.num_tensors is None
+          else [
+              str(s.num_tensors),
+              f"{s.allocated_bytes / 2**20:.1f}",
+              f"{s.peak_bytes / 2**20:.1f}",
+          ]
+      )
+      lines.append(
+          f"| {s.name} | {s.count} | {s.total_ms:.2f} | {s.mean_ms:.3f} |"
+          f" {s.max_ms:.3f} | " + " | ".join(memory) + " |"
+      )
+    return "\n".join(lines)
+
+  def chrome_trace(self) -> dict[str, Any]:
+    """Returns the events in the Chrome trace event format."""
+    trace_events = []
+    for event in self.events:
+      args = {
+          k: v
+          for k, v in (
+              ("num_tensors", event.num_tensors),
+              ("allocated_bytes", event.allocated_bytes),
+              ("peak_bytes", event.peak_bytes),
+          )
+          if v is not None
+      }
+      trace_events.append({
+          "name": event.name,
+          "cat": event.category,
+          "ph": "X",
+          "ts": event.start_us,
+          "dur": event.duration_us,
+          "pid": 0,
+          "tid": event.thread_id,
+          "args": args,
+      })
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+  def save_chrome_trace(self, path: str) -> None:
+    """Writes the Chrome trace to a JSON file."""
+    with open(path, "w") as f:
+      json.dump(self.chrome_trace(), f)
+
+  def save_summary(self, path: str) -> None:
+    """Writes the summary to a JSON file."""
+    with open(path, "w") as f:
+      json.dump([dataclasses.asdict(s) for s in self.summary()], f, indent=2)
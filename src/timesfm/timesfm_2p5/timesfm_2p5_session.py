@@ -0,0 +1,432 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental streaming forecasts on top of the TimesFM 2.5 torch module."""
+
+import math
+from typing import Callable, Sequence, TypeVar
+
+import numpy as np
+import torch
+
+from .. import configs
+from ..torch import util
+from . import timesfm_2p5_base
+from . import timesfm_2p5_torch
+
+revin = util.revin
+
+_T = TypeVar("_T")
+
+
+def _forward_fill(values: np.ndarray, last_value: float) -> np.ndarray:
+  """Replaces NaNs with the previous valid value."""
+  values = np.asarray(values, dtype=np.float32).reshape(-1)
+  is_nan = np.isnan(values)
+  if not np.any(is_nan):
+    return values
+  index = np.where(is_nan, -1, np.arange(len(values)))
+  index = np.maximum.accumulate(index)
+  filled = np.where(index >= 0, values[np.maximum(index, 0)], last_value)
+  return filled.astype(np.float32)
+
+
+class ForecastSession:
+  """Stateful forecaster for streams that grow a few points at a time.
+
+  The session keeps the per-layer decode caches, the running (n, mu, sigma)
+  stats and the points of the not yet complete input patch of every series.
+  Whenever `input_patch_len` new points of a series have arrived, only that
+  patch is run through the transformer against the cached keys and values.
+  This works because both the patch normalization and the attention of
+  TimesFM 2.5 are causal.
+
+  Points of an incomplete patch are not seen by the model yet. Forecasts still
+  start right after the last appended point: the model output for the
+  already observed points is skipped.
+
+  Once a series fills `max_context`, the oldest `eviction_patches` patches are
+  evicted by re-running the prefill on the retained window. With
+  `eviction_patches=1` the context is exactly the last `max_context` points,
+  at the price of a full prefill per new patch; larger values amortize the
+  prefill over several patches while the context varies between
+  `max_context - (eviction_patches - 1) * input_patch_len` and `max_context`.
+
+  Of the forecasting flags, force_flip_invariance, infer_is_positive,
+  use_continuous_quantile_head and fix_quantile_crossing are honoured.
+  normalize_inputs is ignored since the model is invariant to affine
+  rescaling of its inputs, and return_backcast is not supported.
+  """
+
+  def __init__(
+      self,
+      model: timesfm_2p5_torch.TimesFM_2p5_200M_torch_module,
+      histories: Sequence[np.ndarray],
+      forecast_config: configs.ForecastConfig,
+      *,
+      eviction_patches: int | None = None,
+  ):
+    """Prefills the session with the initial history of every series.
+
+    Args:
+      model: A TimesFM 2.5 torch module with loaded weights.
+      histories: The initial history of every series. Each must contain at
+        least one point.
+      forecast_config: Forecasting flags. max_context must be a multiple of
+        the input patch length.
+      eviction_patches: Number of the oldest patches evicted at once when a
+        series fills max_context. Defaults to a quarter of the window.
+    """
+    fc = forecast_config
+    p = model.p
+    if fc.max_context <= 0 or fc.max_context % p != 0:
+      raise ValueError(
+          f"max_context must be a positive multiple of {p}: {fc.max_context}."
+      )
+    if fc.max_horizon <= 0:
+      raise ValueError(f"max_horizon must be positive: {fc.max_horizon}.")
+    if fc.return_backcast:
+      raise ValueError("ForecastSession does not support return_backcast.")
+    if fc.use_continuous_quantile_head and (fc.max_horizon + p - 1 > model.os):
+      raise ValueError(
+          "Continuous quantile head is not supported for horizons >"
+          f" {model.os - p + 1}."
+      )
+
+    self.model = model
+    self.forecast_config = fc
+    self._needs_spread = fc.use_continuous_quantile_head
+    self.num_series = len(histories)
+    self._window_patches = fc.max_context // p
+    if eviction_patches is None:
+      eviction_patches = max(1, self._window_patches // 4)
+    if not 1 <= eviction_patches <= self._window_patches:
+      raise ValueError(
+          f"eviction_patches must be in [1, {self._window_patches}]:"
+          f" {eviction_patches}."
+      )
+    self.eviction_patches = eviction_patches
+    self._max_decode_steps = (fc.max_horizon + p - 2) // model.o
+
+    num_rows = self.num_series * (2 if fc.force_flip_invariance else 1)
+    device = model.device
+    self._caches = util.DecodeCacheArena(
+        num_layers=model.x,
+        batch_size=num_rows,
+        cache_size=self._window_patches + self._max_decode_steps * model.m,
+        num_heads=model.h,
+        head_dim=model.hd,
+        device=device,
+        dtype=model.cache_dtype,
+    )
+    self._n = torch.zeros(num_rows, device=device)
+    self._mu = torch.zeros(num_rows, device=device)
+    self._sigma = torch.zeros(num_rows, device=device)
+    self._last_output = torch.zeros(num_rows, model.o, model.q, device=device)
+    self._last_spread = torch.zeros(num_rows, model.os, model.q, device=device)
+
+    ragged = timesfm_2p5_base.preprocess_inputs(histories, fc.max_context)
+    if np.any(ragged.lengths == 0):
+      raise ValueError("Every history must contain at least one point.")
+    self._history = [
+        ragged.values[ragged.offsets[i] : ragged.offsets[i + 1]]
+        for i in range(self.num_series)
+    ]
+    self._pending = np.zeros(self.num_series, dtype=np.int64)
+    self._prefill(np.arange(self.num_series), self._window_patches)
+
+  @property
+  def num_pending(self) -> np.ndarray:
+    """Number of points per series that are not yet seen by the model."""
+    return self._pending.copy()
+
+  def _rows(self, series: np.ndarray) -> np.ndarray:
+    if self.forecast_config.force_flip_invariance:
+      return np.concatenate([series, series + self.num_series])
+    return series
+
+  def _with_caches(
+      self,
+      rows: np.ndarray,
+      fn: Callable[[list[util.DecodeCache]], _T],
+  ) -> _T:
+    """Runs `fn` on the decode caches of the given rows and stores them back."""
+    arena = self._caches
+    if len(rows) == arena.key.shape[1]:
+      index = slice(None)
+    else:
+      index = torch.as_tensor(rows, device=arena.key.device)
+    caches = [arena.layer(i, index) for i in range(arena.key.shape[0])]
+    result = fn(caches)
+    for i, cache in enumerate(caches):
+      arena.num_masked[i, index] = cache.num_masked.to(torch.int32)
+      if not isinstance(index, slice):
+        arena.next_index[i, index] = cache.next_index.to(torch.int32)
+        arena.key[i, index] = cache.key
+        arena.value[i, index] = cache.value
+        if arena.key_scale is not None:
+          arena.key_scale[i, index] = cache.key_scale
+          arena.value_scale[i, index] = cache.value_scale
+    return result
+
+  def _to_rows(self, values: np.ndarray, mirror: bool = True) -> torch.Tensor:
+    """Moves per-series values to the device, adding the mirrored rows."""
+    values = torch.as_tensor(values, device=self.model.device)
+    if self.forecast_config.force_flip_invariance:
+      values = torch.cat([values, -values if mirror else values], dim=0)
+    return values
+
+  def _prefill(
+      self,
+      series: np.ndarray,
+      num_patches: int | np.ndarray,
+      *,
+      by_length: bool = False,
+  ) -> None:
+    """Rebuilds the caches of `series` from their last committed patches.
+
+    Args:
+      series: The series to prefill.
+      num_patches: The number of committed patches to prefill, per series or
+        for all of them.
+      by_length: Whether to prefill the series in groups with the same number
+        of patches, so that no row is padded with whole patches, instead of
+        in one batch padded to the longest series.
+    """
+    p = self.model.p
+    num_patches = np.broadcast_to(num_patches, series.shape)
+    contexts = [
+        self._history[s][: len(self._history[s]) - self._pending[s]][
+            -k * p :
+        ]
+        for s, k in zip(series, num_patches)
+    ]
+    if not by_length:
+      self._prefill_batch(series, contexts)
+      return
+    lengths = np.array([math.ceil(len(c) / p) for c in contexts])
+    for length in np.unique(lengths):
+      (group,) = np.nonzero(lengths == length)
+      self._prefill_batch(series[group], [contexts[i] for i in group])
+
+  def _prefill_batch(
+      self, series: np.ndarray, contexts: list[np.ndarray]
+  ) -> None:
+    """Prefills the caches of `series` from contexts padded to the longest."""
+    p = self.model.p
+    context = math.ceil(max(len(c) for c in contexts) / p) * p
+    values = np.zeros((len(series), context), dtype=np.float32)
+    masks = np.ones((len(series), context), dtype=bool)
+    for i, c in enumerate(contexts):
+      values[i, context - len(c) :] = c
+      masks[i, context - len(c) :] = False
+
+    rows = self._rows(series)
+    self._caches.next_index[:, rows] = 0
+    self._caches.num_masked[:, rows] = 0
+    with torch.no_grad():
+      outputs, spread, (n, mu, sigma) = self._with_caches(
+          rows,
+          lambda caches: self.model.prefill(
+              self._to_rows(values),
+              self._to_rows(masks, False),
+              caches,
+              return_all_patches=False,
+              return_quantile_spread=self._needs_spread,
+          ),
+      )
+    self._last_output[rows] = outputs[:, -1]
+    if self._needs_spread:
+      self._last_spread[rows] = spread
+    self._n[rows], self._mu[rows], self._sigma[rows] = n, mu, sigma
+
+  def _append_patch(self, series: np.ndarray) -> None:
+    """Runs the oldest pending patch of every series through the model."""
+    model = self.model
+    patches = np.stack([
+        self._history[s][
+            len(self._history[s]) - self._pending[s] :
+        ][: model.p]
+        for s in series
+    ])
+    self._pending[series] -= model.p
+
+    rows = self._rows(series)
+    x = self._to_rows(patches)[:, None, :]
+    mask = torch.zeros_like(x, dtype=torch.bool)
+    with torch.no_grad():
+      n, mu, sigma = util.cumulative_running_stats(
+          self._n[rows], self._mu[rows], self._sigma[rows], x, mask
+      )
+      normed_x = revin(x, mu, sigma, reverse=False)
+      (_, _, output, spread), _ = self._with_caches(
+          rows,
+          lambda caches: model(
+              normed_x,
+              mask,
+              caches,
+              point_head="last",
+              quantile_head="last" if self._needs_spread else "none",
+          ),
+      )
+    self._last_output[rows] = torch.reshape(
+        revin(output, mu, sigma, reverse=True), (len(rows), model.o, model.q)
+    )
+    if self._needs_spread:
+      self._last_spread[rows] = torch.reshape(
+          revin(spread, mu, sigma, reverse=True),
+          (len(rows), model.os, model.q),
+      )
+    self._n[rows], self._mu[rows], self._sigma[rows] = (
+        n[:, -1],
+        mu[:, -1],
+        sigma[:, -1],
+    )
+
+  def append(self, values: Sequence[np.ndarray]) -> None:
+    """Appends new points to every series.
+
+    Args:
+      values: One array of new points per series, possibly empty. NaNs are
+        replaced by the previous value of the series.
+    """
+    if len(values) != self.num_series:
+      raise ValueError(
+          f"Expected new values for {self.num_series} series, got"
+          f" {len(values)}."
+      )
+    p = self.model.p
+    for s, new_values in enumerate(values):
+      new_values = _forward_fill(new_values, self._history[s][-1])
+      self._history[s] = np.concatenate([self._history[s], new_values])
+      self._pending[s] += len(new_values)
+
+    window = self._window_patches
+    while len(ready := np.flatnonzero(self._pending >= p)):
+      index = torch.as_tensor(ready)
+      next_index = self._caches.next_index[0, index].cpu().numpy()
+      num_masked = self._caches.num_masked[0, index].cpu().numpy()
+      # Series with a full window of patches evict their oldest ones. The
+      # others without a free cache slot were padded by a batched prefill,
+      # so they are prefilled again from their whole history, unpadded.
+      is_full = next_index - num_masked >= window
+      has_room = next_index < window
+      if not np.all(has_room):
+        rebuilt = ready[~has_room]
+        self._pending[rebuilt] -= p
+        self._prefill(
+            rebuilt,
+            np.where(
+                is_full[~has_room], window - self.eviction_patches + 1, window
+            ),
+            by_length=True,
+        )
+      if np.any(has_room):
+        self._append_patch(ready[has_room])
+
+    max_len = self.forecast_config.max_context
+    for s in range(self.num_series):
+      self._history[s] = self._history[s][-(max_len + self._pending[s]) :]
+
+  def forecast(self, horizon: int) -> tuple[np.ndarray, np.ndarray]:
+    """Forecasts every series from its latest state.
+
+    Args:
+      horizon: The number of time points to forecast after the last appended
+        point of every series.
+
+    Returns:
+      A tuple of point forecasts of shape [num_series, horizon] and quantile
+      forecasts of shape [num_series, horizon, q].
+    """
+    fc = self.forecast_config
+    model = self.model
+    if horizon > fc.max_horizon:
+      raise ValueError(
+          "Horizon must be less than the max horizon."
+          f" {horizon} > {fc.max_horizon}."
+      )
+    num_decode_steps = math.ceil((horizon + self._pending.max()) / model.o) - 1
+
+    with torch.no_grad():
+      full_forecast = self._last_output
+      if num_decode_steps > 0:
+        # Roll out past the committed patches and rewind the caches after.
+        arena = self._caches
+        next_index = arena.next_index.clone()
+        num_masked = arena.num_masked.clone()
+        ar_outputs = self._with_caches(
+            np.arange(arena.key.shape[1]),
+            lambda caches: model.autoregressive_decode(
+                num_decode_steps,
+                self._last_output[..., model.aridx],
+                (self._n, self._mu, self._sigma),
+                caches,
+            ),
+        )
+        arena.next_index.copy_(next_index)
+        arena.num_masked.copy_(num_masked)
+        ar_outputs = ar_outputs.reshape(len(full_forecast), -1, model.q)
+        full_forecast = torch.cat([full_forecast, ar_outputs], dim=1)
+      quantile_spread = self._last_spread
+
+      if fc.force_flip_invariance:
+        full_forecast, flipped_full_forecast = torch.split(
+            full_forecast, self.num_series
+        )
+        quantile_spread, flipped_quantile_spread = torch.split(
+            quantile_spread, self.num_series
+        )
+        full_forecast = (
+            full_forecast
+            - timesfm_2p5_torch.flip_quantiles(flipped_full_forecast)
+        ) / 2
+        quantile_spread = (
+            quantile_spread
+            - timesfm_2p5_torch.flip_quantiles(flipped_quantile_spread)
+        ) / 2
+
+      # Skip the outputs for points that were already observed.
+      device = full_forecast.device
+      row_index = torch.arange(self.num_series, device=device)[:, None]
+      time_index = (
+          torch.as_tensor(self._pending, device=device)[:, None]
+          + torch.arange(horizon, device=device)[None]
+      )
+      full_forecast = full_forecast[row_index, time_index]
+
+      if fc.use_continuous_quantile_head:
+        quantile_spread = quantile_spread[row_index, time_index]
+        for quantile_index in [1, 2, 3, 4, 6, 7, 8, 9]:
+          full_forecast[:, :, quantile_index] = (
+              quantile_spread[:, :, quantile_index]
+              - quantile_spread[:, :, 5]
+              + full_forecast[:, :, 5]
+          )
+
+      if fc.fix_quantile_crossing:
+        full_forecast = timesfm_2p5_torch.fix_quantile_crossing(full_forecast)
+
+      if fc.infer_is_positive:
+        is_positive = torch.as_tensor(
+            [bool(np.all(h >= 0)) for h in self._history], device=device
+        )
+        full_forecast = torch.where(
+            is_positive[:, None, None],
+            torch.clamp(full_forecast, min=0.0),
+            full_forecast,
+        )
+
+    full_forecast = full_forecast.detach().cpu().numpy()
+    return full_forecast[..., 5], full_forecast
@@ -14,14 +14,15 @@
 
 """TimesFM models."""
 
+import copy
+import functools
 import logging
 import math
 import os
-from typing import Sequence
+from typing import Literal, NamedTuple, Sequence
 
 import huggingface_hub
 import numpy as np
-from safetensors.torch import load_file
 import torch
 from torch import nn
 
@@ -30,9 +31,91 @@ from ..torch import dense
 from ..torch import transformer
 from ..torch import util
 from . import timesfm_2p5_base
+from . import timesfm_2p5_compiled
+from . import timesfm_2p5_onnx_export
+from . import timesfm_2p5_packing
+from . import timesfm_2p5_parallel
+from . import timesfm_2p5_profiling
 
 revin = util.revin
 
+HeadSelection = Literal["all", "last", "none"]
+
+_PRECISIONS = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+}
+
+_KV_CACHE_PRECISIONS = {
+    "auto": None,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "int8": torch.int8,
+}
+
+
+class DecodePlan(NamedTuple):
+  """Static shapes of one decode call."""
+
+  num_input_patches: int
+  num_decode_steps: int
+  decode_cache_size: int
+
+
+@functools.lru_cache(maxsize=64)
+def make_decode_plan(
+    context: int, horizon: int, input_patch_len: int, output_patch_len: int
+) -> DecodePlan:
+  """Returns the decode plan covering `horizon` from `context` points.
+
+  Plans are cached by shape, so traffic that mixes a few context and horizon
+  buckets computes each of them once.
+  """
+  num_input_patches = context // input_patch_len
+  num_decode_steps = (horizon - 1) // output_patch_len
+  return DecodePlan(
+      num_input_patches=num_input_patches,
+      num_decode_steps=num_decode_steps,
+      decode_cache_size=num_input_patches
+      + num_decode_steps * (output_patch_len // input_patch_len),
+  )
+
+
+def _apply_head(
+    head: nn.Module, embeddings: torch.Tensor, selection: HeadSelection
+) -> torch.Tensor | None:
+  """Runs an output head on all patches, on the last one only, or not at all."""
+  if selection == "all":
+    return head(embeddings)
+  if selection == "last":
+    return head(embeddings[:, -1:])
+  if selection == "none":
+    return None
+  raise ValueError(f"Head selection: {selection} not supported.")
+
+
+def flip_quantiles(x: torch.Tensor) -> torch.Tensor:
+  """Reverses the quantile order of the mirrored forecast of -x."""
+  return torch.cat([x[..., :1], torch.flip(x[..., 1:], dims=(-1,))], dim=-1)
+
+
+def fix_quantile_crossing(full_forecast: torch.Tensor) -> torch.Tensor:
+  """Makes the quantiles monotonic around the median, in place."""
+  for i in [4, 3, 2, 1]:
+    full_forecast[:, :, i] = torch.where(
+        full_forecast[:, :, i] < full_forecast[:, :, i + 1],
+        full_forecast[:, :, i],
+        full_forecast[:, :, i + 1],
+    )
+  for i in [6, 7, 8, 9]:
+    full_forecast[:, :, i] = torch.where(
+        full_forecast[:, :, i] > full_forecast[:, :, i - 1],
+        full_forecast[:, :, i],
+        full_forecast[:, :, i - 1],
+    )
+  return full_forecast
+
 
 class TimesFM_2p5_200M_torch_module(nn.Module):
   """TimesFM 2.5 with 200M parameters."""
@@ -57,7 +140,10 @@ class TimesFM_2p5_200M_torch_module(nn.Module):
     # Layers.
     self.tokenizer = dense.ResidualBlock(self.config.tokenizer)
     self.stacked_xf = nn.ModuleList([
-        transformer.Transformer(self.config.stacked_transformers.transformer)
+        transformer.Transformer(
+            self.config.stacked_transformers.transformer,
+            max_position=self.config.context_limit // self.p,
+        )
         for _ in range(self.x)
     ])
     self.output_projection_point = dense.ResidualBlock(
@@ -75,33 +161,317 @@ class TimesFM_2p5_200M_torch_module(nn.Module):
       self.device = torch.device("cpu")
       self.device_count = 1
 
+    # Decode cache arena reused across decode calls.
+    self._decode_cache_arena: util.DecodeCacheArena | None = None
+
+    # Whether fold_weights() has turned this into an inference-only module.
+    self.is_folded = False
+
+    # The path of the memory-mapped checkpoint and the data pointers of the
+    # weights that load_checkpoint() assigned from it without copying.
+    self._mapped_checkpoint: tuple[str, dict[str, int]] | None = None
+
+    # The dtype of the weights, activations and decode caches.
+    self.dtype = torch.float32
+
+    # The storage dtype of the decode caches, or None for `dtype`.
+    self.kv_cache_dtype: torch.dtype | None = None
+
+  def _get_decode_caches(
+      self, batch_size: int, decode_cache_size: int, device: torch.device
+  ) -> list[util.DecodeCache]:
+    """Returns fresh per-layer decode caches backed by the reused arena.
+
+    With an attention window, see set_attention_window, the caches are
+    fixed-size ring buffers instead, regardless of `decode_cache_size`.
+    """
+    attention = self.stacked_xf[0].attn
+    if attention.attention_window > 0:
+      return [
+          util.RingDecodeCache.create(
+              batch_size=batch_size,
+              num_global=attention.num_global_patches,
+              ring_size=attention.attention_window + self.m,
+              num_heads=self.h,
+              head_dim=self.hd,
+              device=device,
+              dtype=self.dtype,
+          )
+          for _ in range(self.x)
+      ]
+    arena = self._decode_cache_arena
+    if arena is None or not arena.fits(
+        batch_size, decode_cache_size, device, self.cache_dtype
+    ):
+      arena = util.DecodeCacheArena(
+          num_layers=self.x,
+          batch_size=batch_size,
+          cache_size=decode_cache_size,
+          num_heads=self.h,
+          head_dim=self.hd,
+          device=device,
+          dtype=self.cache_dtype,
+      )
+      self._decode_cache_arena = arena
+    return arena.checkout(decode_cache_size)
+
+  @property
+  def cache_dtype(self) -> torch.dtype:
+    """The storage dtype of the keys and values in the decode caches."""
+    return self.kv_cache_dtype or self.dtype
+
+  def decode_cache_bytes(
+      self, batch_size: int, context: int, horizon: int
+  ) -> int:
+    """Bytes of the decode caches of one decode call.
+
+    Args:
+      batch_size: Number of rows decoded together.
+      context: Context length of the rows.
+      horizon: Horizon to decode.
+
+    Returns:
+      The size of the keys, values and scales of all layers, which is
+      linear in `batch_size`.
+    """
+    attention = self.stacked_xf[0].attn
+    if attention.attention_window > 0:
+      cache_size = (
+          attention.num_global_patches + attention.attention_window + self.m
+      )
+      dtype = self.dtype
+    else:
+      cache_size = make_decode_plan(
+          context, horizon, self.p, self.o
+      ).decode_cache_size
+      dtype = self.cache_dtype
+    return util.decode_cache_bytes(
+        num_layers=self.x,
+        batch_size=batch_size,
+        cache_size=cache_size,
+        num_heads=self.h,
+        head_dim=self.hd,
+        dtype=dtype,
+    )
+
+  def set_kv_cache_precision(self, precision: str) -> None:
+    """Sets the storage dtype of the keys and values in the decode caches.
+
+    Args:
+      precision: One of "auto", which stores them in the dtype of the
+        module, "float16", "bfloat16" and "int8".
+    """
+    if precision not in _KV_CACHE_PRECISIONS:
+      raise ValueError(f"KV cache precision: {precision} not supported.")
+    dtype = _KV_CACHE_PRECISIONS[precision]
+    if dtype != self.kv_cache_dtype:
+      self.kv_cache_dtype = dtype
+      self._decode_cache_arena = None
+
+  def profiled_modules(self) -> dict[str, nn.Module]:
+    """Returns the submodules to record in a timesfm.Profiler, by name."""
+    return {
+        "tokenizer": self.tokenizer,
+        **{f"stacked_xf.{i}": layer for i, layer in enumerate(self.stacked_xf)},
+        "output_projection_point": self.output_projection_point,
+        "output_projection_quantiles": self.output_projection_quantiles,
+    }
+
+  def set_attention_backend(self, backend: str) -> None:
+    """Selects the attention implementation of all transformer layers."""
+    if backend not in ("eager", "sdpa"):
+      raise ValueError(f"Attention backend: {backend} not supported.")
+    for layer in self.stacked_xf:
+      layer.attn.attention_backend = backend
+
+  def set_attention_window(self, window: int, num_global: int = 0) -> None:
+    """Restricts the attention of all layers to a sliding window.
+
+    See transformer.MultiHeadAttention.set_attention_window.
+
+    Args:
+      window: Number of most recent patches to attend to, 0 for full causal
+        attention.
+      num_global: Number of leading patches every patch attends to.
+    """
+    for layer in self.stacked_xf:
+      layer.attn.set_attention_window(window, num_global)
+
+  def set_precision(self, precision: str) -> None:
+    """Casts the weights, activations and decode caches to `precision`.
+
+    Inputs are cast to the precision after the float32 normalization and the
+    outputs of the heads are cast back to float32 before renormalization.
+
+    Args:
+      precision: One of "float32", "bfloat16" and "float16".
+    """
+    if precision not in _PRECISIONS:
+      raise ValueError(f"Precision: {precision} not supported.")
+    dtype = _PRECISIONS[precision]
+    if dtype != self.dtype:
+      self.to(dtype)
+      self.dtype = dtype
+      self._decode_cache_arena = None
+
   def load_checkpoint(self, path: str):
-    """Loads a PyTorch TimesFM model from a checkpoint."""
-    tensors = load_file(path, device="cpu")
-    self.load_state_dict(tensors)
-    self.to(self.device)
+    """Loads a PyTorch TimesFM model from a checkpoint.
+
+    The weights are memory-mapped from the safetensors file and assigned to
+    the module without copying when it runs on CPU in float32, so the module
+    can be constructed on the meta device beforehand.
+    """
+    if self.is_folded:
+      raise RuntimeError("Cannot load a checkpoint into a folded model.")
+    tensors, _ = util.mmap_safetensors(path)
+    self.load_state_dict(tensors, assign=True)
+    self.to(self.device, self.dtype)
+    state = self.state_dict(keep_vars=True)
+    self._mapped_checkpoint = (
+        path,
+        {
+            name: t.data_ptr()
+            for name, t in state.items()
+            if name in tensors
+            and t.numel()
+            and t.data_ptr() == tensors[name].data_ptr()
+        },
+    )
+
+  def mapped_checkpoint(self) -> tuple[str | None, list[str]]:
+    """Returns the checkpoint whose memory map still backs some weights.
+
+    Returns:
+      The path of the checkpoint, or None, and the names of the weights in
+      the state dict that are still the memory-mapped tensors assigned by
+      load_checkpoint(), i.e. that were not cast, moved, folded or replaced
+      since. In-place updates of these weights are not detected.
+    """
+    if self._mapped_checkpoint is None:
+      return None, []
+    path, pointers = self._mapped_checkpoint
+    state = self.state_dict(keep_vars=True)
+    names = [
+        name
+        for name, pointer in pointers.items()
+        if name in state and state[name].data_ptr() == pointer
+    ]
+    return path, names
+
+  @torch.no_grad()
+  def fold_weights(self, verify: bool = True, rtol: float = 1e-4) -> None:
+    """Folds the weights into a frozen inference-only module.
+
+    Fuses the attention projections of every transformer layer and folds the
+    norm and query scales into them, see transformer.Transformer.fold_weights.
+    The folded module has a different state dict, so checkpoints must be
+    loaded before folding.
+
+    Args:
+      verify: Whether to check every folded layer against its original on a
+        random probe.
+      rtol: The tolerance of the check, relative to the largest absolute
+        output of the original layer.
+
+    Raises:
+      RuntimeError: If a folded layer does not match its original.
+    """
+    if self.is_folded:
+      return
+    if verify:
+      generator = torch.Generator().manual_seed(0)
+      probe = torch.randn(2, 8, self.md, generator=generator).to(
+          self.device, self.dtype
+      )
+      probe_mask = torch.zeros(2, 8, dtype=torch.bool, device=self.device)
+    for i, layer in enumerate(self.stacked_xf):
+      original = copy.deepcopy(layer) if verify else None
+      layer.fold_weights()
+      if original is not None:
+        expected, _ = original(probe, probe_mask)
+        actual, _ = layer(probe, probe_mask)
+        expected = expected.to(torch.float32)
+        error = torch.max(torch.abs(actual.to(torch.float32) - expected))
+        if error > rtol * torch.max(torch.abs(expected)):
+          raise RuntimeError(
+              f"Folded layer {i} does not match the original: max abs error"
+              f" {error.item():.3g}."
+          )
+    self.requires_grad_(False)
+    self.eval()
+    self.is_folded = True
 
   def forward(
       self,
       inputs: torch.Tensor,
       masks: torch.Tensor,
       decode_caches: list[util.DecodeCache] | None = None,
+      *,
+      point_head: HeadSelection = "all",
+      quantile_head: HeadSelection = "all",
   ):
+    """Runs the model on patched inputs.
+
+    Args:
+      inputs: Normalized patched inputs of shape [b, n, p].
+      masks: Padding masks of the same shape, True for padded points.
+      decode_caches: Optional per-layer decode caches to attend to and update.
+      point_head: On which patches to run the point output head: "all", only
+        the "last" one, or "none".
+      quantile_head: Same as `point_head`, for the quantile output head.
+
+    Returns:
+      A tuple of the input embeddings, the output embeddings, the point head
+      outputs and the quantile head outputs, and the new decode caches. A head
+      run on the last patch only keeps a patch axis of size 1; a head that is
+      not run returns None.
+    """
     tokenizer_inputs = torch.cat([inputs, masks.to(inputs.dtype)], dim=-1)
+    tokenizer_inputs = tokenizer_inputs.to(self.dtype)
     input_embeddings = self.tokenizer(tokenizer_inputs)
 
     if decode_caches is None:
       decode_caches = [None] * self.x
 
+    patch_mask, attn_mask, is_causal = masks[..., -1], None, False
+    attention, cache = self.stacked_xf[0].attn, decode_caches[0]
+    if attention.attention_window == 0:
+      if attention.attention_backend == "sdpa" and not (
+          torch.compiler.is_compiling()
+      ):
+        # One host sync per call: rows that are all unpadded and start an
+        # empty cache attend causally with no mask at all.
+        is_unaligned = torch.any(patch_mask)
+        if cache is not None:
+          is_unaligned |= torch.any(cache.next_index) | torch.any(
+              cache.num_masked
+          )
+        is_causal = not is_unaligned
+      if not is_causal:
+        # All layers share the mask, so it is built once per call.
+        attn_mask = attention.make_attn_mask(patch_mask, cache, self.dtype)
+
     output_embeddings = input_embeddings
     new_decode_caches = []
     for i, layer in enumerate(self.stacked_xf):
       output_embeddings, new_cache = layer(
-          output_embeddings, masks[..., -1], decode_caches[i]
+          output_embeddings,
+          patch_mask,
+          decode_caches[i],
+          attn_mask=attn_mask,
+          is_causal=is_causal,
       )
       new_decode_caches.append(new_cache)
-    output_ts = self.output_projection_point(output_embeddings)
-    output_quantile_spread = self.output_projection_quantiles(output_embeddings)
+    output_ts = _apply_head(
+        self.output_projection_point, output_embeddings, point_head
+    )
+    output_quantile_spread = _apply_head(
+        self.output_projection_quantiles, output_embeddings, quantile_head
+    )
+    if output_ts is not None:
+      output_ts = output_ts.to(torch.float32)
+    if output_quantile_spread is not None:
+      output_quantile_spread = output_quantile_spread.to(torch.float32)
 
     return (
         input_embeddings,
@@ -110,125 +480,240 @@ class TimesFM_2p5_200M_torch_module(nn.Module):
         output_quantile_spread,
     ), new_decode_caches
 
-  def decode(self, horizon: int, inputs, masks):
-    """Decodes the time series."""
-
-    inputs = inputs.to(self.device)
-    masks = masks.to(self.device)
+  def prefill(
+      self,
+      inputs: torch.Tensor,
+      masks: torch.Tensor,
+      decode_caches: list[util.DecodeCache] | None,
+      *,
+      return_all_patches: bool = True,
+      return_quantile_spread: bool = True,
+  ) -> tuple[
+      torch.Tensor,
+      torch.Tensor | None,
+      tuple[torch.Tensor, torch.Tensor, torch.Tensor],
+  ]:
+    """Runs the context through the model and fills the decode caches.
 
-    with torch.no_grad():
-      batch_size, context = inputs.shape[0], inputs.shape[1]
-      num_decode_steps = (horizon - 1) // self.o
-      num_input_patches = context // self.p
-      decode_cache_size = num_input_patches + num_decode_steps * self.m
-
-      # Prefill
-      patched_inputs = torch.reshape(inputs, (batch_size, -1, self.p))
-      patched_masks = torch.reshape(masks, (batch_size, -1, self.p))
-
-      # running stats
-      n = torch.zeros(batch_size, device=inputs.device)
-      mu = torch.zeros(batch_size, device=inputs.device)
-      sigma = torch.zeros(batch_size, device=inputs.device)
-      patch_mu = []
-      patch_sigma = []
-      for i in range(num_input_patches):
-        (n, mu, sigma), _ = util.update_running_stats(
-            n, mu, sigma, patched_inputs[:, i], patched_masks[:, i]
-        )
-        patch_mu.append(mu)
-        patch_sigma.append(sigma)
-      last_n, last_mu, last_sigma = n, mu, sigma
-      context_mu = torch.stack(patch_mu, dim=1)
-      context_sigma = torch.stack(patch_sigma, dim=1)
-
-      decode_caches = [
-          util.DecodeCache(
-              next_index=torch.zeros(
-                  batch_size, dtype=torch.int32, device=inputs.device
-              ),
-              num_masked=torch.zeros(
-                  batch_size, dtype=torch.int32, device=inputs.device
-              ),
-              key=torch.zeros(
-                  batch_size,
-                  decode_cache_size,
-                  self.h,
-                  self.hd,
-                  device=inputs.device,
-              ),
-              value=torch.zeros(
-                  batch_size,
-                  decode_cache_size,
-                  self.h,
-                  self.hd,
-                  device=inputs.device,
-              ),
-          )
-          for _ in range(self.x)
-      ]
+    Args:
+      inputs: Left-padded contexts of shape [b, context], where context is a
+        multiple of the input patch length.
+      masks: Padding masks of the same shape, True for padded points.
+      decode_caches: Per-layer decode caches to fill, or None to only
+        compute the outputs.
+      return_all_patches: Whether to run the point head on every patch, e.g.
+        for backcasts, or only on the last one.
+      return_quantile_spread: Whether to run the quantile head on the last
+        patch.
 
-      normed_inputs = revin(
-          patched_inputs, context_mu, context_sigma, reverse=False
-      )
-      normed_inputs = torch.where(patched_masks, 0.0, normed_inputs)
-      (_, _, normed_outputs, normed_quantile_spread), decode_caches = self(
-          normed_inputs, patched_masks, decode_caches
-      )
-      renormed_outputs = torch.reshape(
-          revin(normed_outputs, context_mu, context_sigma, reverse=True),
-          (batch_size, -1, self.o, self.q),
+    Returns:
+      A tuple of the renormalized outputs of every patch, of shape
+      [b, num_patches, o, q], or of the last patch only, of shape [b, 1, o, q],
+      the renormalized quantile spread of the last patch, of shape [b, os, q],
+      or None, and the running (n, mu, sigma) stats after the last patch, each
+      of shape [b].
+    """
+    batch_size = inputs.shape[0]
+    patched_inputs = torch.reshape(inputs, (batch_size, -1, self.p))
+    patched_masks = torch.reshape(masks, (batch_size, -1, self.p))
+
+    # running stats
+    with timesfm_2p5_profiling.stage("running_stats"):
+      zeros = torch.zeros(batch_size, device=inputs.device)
+      context_n, context_mu, context_sigma = util.cumulative_running_stats(
+          zeros, zeros, zeros, patched_inputs, patched_masks
       )
+    last_stats = (context_n[:, -1], context_mu[:, -1], context_sigma[:, -1])
+
+    normed_inputs = revin(
+        patched_inputs, context_mu, context_sigma, reverse=False
+    )
+    normed_inputs = torch.where(patched_masks, 0.0, normed_inputs)
+    (_, _, normed_outputs, normed_quantile_spread), _ = self(
+        normed_inputs,
+        patched_masks,
+        decode_caches,
+        point_head="all" if return_all_patches else "last",
+        quantile_head="last" if return_quantile_spread else "none",
+    )
+    if not return_all_patches:
+      context_mu = context_mu[:, -1:]
+      context_sigma = context_sigma[:, -1:]
+    renormed_outputs = torch.reshape(
+        revin(normed_outputs, context_mu, context_sigma, reverse=True),
+        (batch_size, -1, self.o, self.q),
+    )
+    if return_quantile_spread:
       renormed_quantile_spread = torch.reshape(
           revin(
-              normed_quantile_spread, context_mu, context_sigma, reverse=True
+              normed_quantile_spread,
+              last_stats[1][:, None],
+              last_stats[2][:, None],
+              reverse=True,
           ),
-          (batch_size, -1, self.os, self.q),
-      )[:, -1, ...]
+          (batch_size, self.os, self.q),
+      )
+    else:
+      renormed_quantile_spread = None
+    return renormed_outputs, renormed_quantile_spread, last_stats
 
-      # Autogressive decode
-      ar_outputs = []
-      last_renormed_output = renormed_outputs[:, -1, :, self.aridx]
+  def autoregressive_decode(
+      self,
+      num_decode_steps: int,
+      last_renormed_output: torch.Tensor,
+      last_stats: tuple[torch.Tensor, torch.Tensor, torch.Tensor],
+      decode_caches: list[util.DecodeCache],
+  ) -> torch.Tensor | None:
+    """Rolls the forecast out autoregressively from filled decode caches.
 
-      for _ in range(num_decode_steps):
-        new_patched_input = torch.reshape(
-            last_renormed_output, (batch_size, self.m, self.p)
-        )
-        new_mask = torch.zeros_like(new_patched_input, dtype=torch.bool)
+    Args:
+      num_decode_steps: Number of output patches to decode.
+      last_renormed_output: The point forecast of the last patch in the cache,
+        of shape [b, o].
+      last_stats: The running (n, mu, sigma) stats after the last patch.
+      decode_caches: Per-layer decode caches with room for
+        num_decode_steps * o / p more patches.
 
-        n, mu, sigma = last_n, last_mu, last_sigma
-        new_mus, new_sigmas = [], []
-        for i in range(self.m):
-          (n, mu, sigma), _ = util.update_running_stats(
-              n, mu, sigma, new_patched_input[:, i], new_mask[:, i]
-          )
-          new_mus.append(mu)
-          new_sigmas.append(sigma)
-        last_n, last_mu, last_sigma = n, mu, sigma
-        new_mu = torch.stack(new_mus, dim=1)
-        new_sigma = torch.stack(new_sigmas, dim=1)
-
-        new_normed_input = revin(
-            new_patched_input, new_mu, new_sigma, reverse=False
-        )
-        (_, _, new_normed_output, _), decode_caches = self(
-            new_normed_input, new_mask, decode_caches
-        )
+    Returns:
+      The renormalized outputs of shape [b, num_decode_steps, o, q], or None
+      if num_decode_steps is 0.
+    """
+    batch_size = last_renormed_output.shape[0]
+    last_n, last_mu, last_sigma = last_stats
+    ar_outputs = []
+    for _ in range(num_decode_steps):
+      new_patched_input = torch.reshape(
+          last_renormed_output, (batch_size, self.m, self.p)
+      )
+      new_mask = torch.zeros_like(new_patched_input, dtype=torch.bool)
 
-        new_renormed_output = torch.reshape(
-            revin(new_normed_output, new_mu, new_sigma, reverse=True),
-            (batch_size, self.m, self.o, self.q),
-        )
-        ar_outputs.append(new_renormed_output[:, -1, ...])
-        last_renormed_output = new_renormed_output[:, -1, :, self.aridx]
+      new_n, new_mu, new_sigma = util.cumulative_running_stats(
+          last_n, last_mu, last_sigma, new_patched_input, new_mask
+      )
+      last_n = new_n[:, -1]
+      last_mu = new_mu[:, -1]
+      last_sigma = new_sigma[:, -1]
+
+      new_normed_input = revin(
+          new_patched_input, new_mu, new_sigma, reverse=False
+      )
+      (_, _, new_normed_output, _), decode_caches = self(
+          new_normed_input,
+          new_mask,
+          decode_caches,
+          point_head="last",
+          quantile_head="none",
+      )
+
+      new_renormed_output = torch.reshape(
+          revin(new_normed_output[:, 0], last_mu, last_sigma, reverse=True),
+          (batch_size, self.o, self.q),
+      )
+      ar_outputs.append(new_renormed_output)
+      last_renormed_output = new_renormed_output[..., self.aridx]
+
+    if num_decode_steps > 0:
+      return torch.stack(ar_outputs, dim=1)
+    else:
+      return None
+
+  def prepare_decode(
+      self, horizon: int, inputs, masks
+  ) -> tuple[torch.Tensor, torch.Tensor, int, list[util.DecodeCache]]:
+    """Moves the inputs to the device and checks out fresh decode caches.
+
+    Returns:
+      The inputs and masks on the device, the number of autoregressive decode
+      steps covering `horizon` and the decode caches to decode with.
+    """
+    inputs = inputs.to(self.device)
+    masks = masks.to(self.device)
+    batch_size, context = inputs.shape[0], inputs.shape[1]
+    plan = make_decode_plan(context, horizon, self.p, self.o)
+    decode_caches = self._get_decode_caches(
+        batch_size, plan.decode_cache_size, inputs.device
+    )
+    return inputs, masks, plan.num_decode_steps, decode_caches
+
+  def run_decode(
+      self,
+      inputs: torch.Tensor,
+      masks: torch.Tensor,
+      num_decode_steps: int,
+      decode_caches: list[util.DecodeCache] | None,
+      *,
+      return_all_patches: bool = True,
+      return_quantile_spread: bool = True,
+  ):
+    """Runs the prefill and the autoregressive steps, see `decode`."""
+    # Prefill
+    with timesfm_2p5_profiling.stage("prefill"):
+      renormed_outputs, renormed_quantile_spread, last_stats = self.prefill(
+          inputs,
+          masks,
+          decode_caches,
+          return_all_patches=return_all_patches,
+          return_quantile_spread=return_quantile_spread,
+      )
 
-      if num_decode_steps > 0:
-        ar_renormed_outputs = torch.stack(ar_outputs, dim=1)
-      else:
-        ar_renormed_outputs = None
+    # Autogressive decode
+    with timesfm_2p5_profiling.stage("autoregressive_decode"):
+      ar_renormed_outputs = self.autoregressive_decode(
+          num_decode_steps,
+          renormed_outputs[:, -1, :, self.aridx],
+          last_stats,
+          decode_caches,
+      )
 
     return renormed_outputs, renormed_quantile_spread, ar_renormed_outputs
 
+  def decode(
+      self,
+      horizon: int,
+      inputs,
+      masks,
+      *,
+      return_all_patches: bool = True,
+      return_quantile_spread: bool = True,
+  ):
+    """Decodes the time series.
+
+    `return_all_patches` and `return_quantile_spread` select the output heads
+    to run during the prefill, see `prefill`. The autoregressive steps only
+    run the point head on their last patch.
+    """
+    with torch.no_grad():
+      return self.run_decode(
+          *self.prepare_decode(horizon, inputs, masks),
+          return_all_patches=return_all_patches,
+          return_quantile_spread=return_quantile_spread,
+      )
+
+  def decode_packed(
+      self,
+      horizon: int,
+      inputs,
+      masks,
+      *,
+      return_all_patches: bool = False,
+      return_quantile_spread: bool = True,
+  ):
+    """Decodes the time series with several short series packed per row.
+
+    See timesfm_2p5_packing.decode_packed. Only the outputs of the last patch
+    are returned, so `return_all_patches` must be False.
+    """
+    if return_all_patches:
+      raise ValueError("Packed decoding only returns the last patch.")
+    with torch.no_grad():
+      return timesfm_2p5_packing.decode_packed(
+          self,
+          horizon,
+          inputs,
+          masks,
+          return_quantile_spread=return_quantile_spread,
+      )
+
   def forecast_naive(
       self, horizon: int, inputs: Sequence[np.ndarray]
   ) -> list[np.ndarray]:
@@ -270,9 +755,22 @@ class TimesFM_2p5_200M_torch_module(nn.Module):
 
 
 class TimesFM_2p5_200M_torch(timesfm_2p5_base.TimesFM_2p5):
-  """PyTorch implementation of TimesFM 2.5 with 200M parameters."""
+  """PyTorch implementation of TimesFM 2.5 with 200M parameters.
+
+  The model is constructed on the meta device, without allocating or
+  initializing any weight, and materialized by `load_checkpoint`.
+  """
 
-  model: nn.Module = TimesFM_2p5_200M_torch_module()
+  parallel_decoder: (
+      timesfm_2p5_parallel.DeviceParallelDecoder
+      | timesfm_2p5_parallel.CpuWorkerPoolDecoder
+      | None
+  ) = None
+  compiled_graphs: timesfm_2p5_compiled.CompiledDecodeGraphs | None = None
+
+  def __init__(self):
+    with torch.device("meta"):
+      self.model = TimesFM_2p5_200M_torch_module()
 
   def load_checkpoint(
       self,
@@ -302,21 +800,116 @@ class TimesFM_2p5_200M_torch(timesfm_2p5_base.TimesFM_2p5):
       raise ValueError("Either path or hf_repo_id must be provided.")
     self.model.load_checkpoint(path)
 
-  def compile(self, forecast_config: configs.ForecastConfig, **kwargs) -> None:
+  def fold_weights(self, verify: bool = True) -> None:
+    """Folds the weights of the loaded model for fast inference.
+
+    See TimesFM_2p5_200M_torch_module.fold_weights. Call it after
+    load_checkpoint and before compile.
+
+    Args:
+      verify: Whether to check the folded layers against the originals.
+    """
+    self.model.fold_weights(verify=verify)
+
+  def export_onnx(self, directory: str) -> None:
+    """Exports the loaded model to ONNX for TimesFM_2p5_200M_onnx.
+
+    See timesfm_2p5_onnx_export.export. Call it after load_checkpoint, and
+    optionally fold_weights, with the model in float32.
+
+    Args:
+      directory: Directory to write the ONNX graphs to.
+    """
+    timesfm_2p5_onnx_export.export(self.model.cpu(), directory)
+
+  def decode_cache_bytes(self, batch_size: int | None = None) -> int:
+    """Bytes of the decode caches of one batch with the compiled config.
+
+    Use it to size `per_core_batch_size` against a memory budget: the size is
+    linear in the batch size and, without an attention window, in
+    max_context + max_horizon.
+
+    Args:
+      batch_size: Number of series decoded together. Defaults to the global
+        batch size of the compiled config.
+
+    Returns:
+      The size of the keys, values and scales of all layers, counting the
+      mirrored rows of force_flip_invariance.
+    """
+    fc = self.forecast_config
+    if fc is None:
+      raise RuntimeError("Model is not compiled. Please call compile() first.")
+    num_rows = (batch_size or self.global_batch_size) * (
+        2 if fc.force_flip_invariance else 1
+    )
+    return self.model.decode_cache_bytes(
+        num_rows, fc.max_context, fc.max_horizon
+    )
+
+  def compile(
+      self,
+      forecast_config: configs.ForecastConfig,
+      *,
+      warmup: bool = True,
+      compile_cache_dir: str | None = None,
+      **kwargs,
+  ) -> None:
     """Attempts to compile the model for fast decoding.
 
     See configs.ForecastConfig for more details on the supported flags.
 
+    When a torch.compile `backend` is passed, decoding goes through a cache
+    of graphs compiled per (batch size, context, decode steps), see
+    timesfm_2p5_compiled.CompiledDecodeGraphs. Otherwise, in the workers of
+    data-parallel decoding and with packed inputs, the model runs eagerly in
+    the calling process.
+
     Args:
       forecast_config: Configuration for forecasting flags.
-      **kwargs: Additional keyword arguments to pass to model.compile().
+      warmup: Whether to compile the graphs of max_context, of every batch
+        size of `batch_rows` and of every horizon bucket up to max_horizon
+        right away, instead of on first use.
+      compile_cache_dir: Optional directory in which the compiler artifacts
+        are persisted across restarts.
+      **kwargs: Additional keyword arguments to pass to torch.compile().
     """
 
-    if kwargs.get("backend", None) is not None:
-      self.model.compile(**kwargs)
-    self.global_batch_size = (
-        forecast_config.per_core_batch_size * self.model.device_count
+    self.input_patch_len = self.model.p
+    self.output_patch_len = self.model.o
+    self.model.set_attention_backend(forecast_config.attention_backend)
+    self.model.set_attention_window(
+        forecast_config.attention_window, forecast_config.num_global_patches
+    )
+    self.model.set_precision(forecast_config.precision)
+    self.model.set_kv_cache_precision(forecast_config.kv_cache_precision)
+
+    if self.parallel_decoder is not None:
+      self.parallel_decoder.close()
+    self.parallel_decoder = timesfm_2p5_parallel.make_decoder(
+        self.model, forecast_config.num_cpu_workers
     )
+    if self.model.device.type == "cpu":
+      num_replicas = max(forecast_config.num_cpu_workers, 1)
+    else:
+      num_replicas = self.model.device_count
+    self.global_batch_size = forecast_config.per_core_batch_size * num_replicas
+    self.compiled_graphs = None
+    backend = kwargs.get("backend", None)
+    if (
+        backend is not None
+        and self.parallel_decoder is None
+        and not forecast_config.pack_inputs
+    ):
+      self.compiled_graphs = timesfm_2p5_compiled.CompiledDecodeGraphs(
+          self.model, cache_dir=compile_cache_dir, **kwargs
+      )
+    if forecast_config.pack_inputs:
+      decode = self.model.decode_packed
+    else:
+      decode = (
+          self.parallel_decoder or self.compiled_graphs or self.model
+      ).decode
 
     # Shortcut.
     fc = forecast_config
@@ -350,7 +943,35 @@ class TimesFM_2p5_200M_torch(timesfm_2p5_base.TimesFM_2p5):
           "Continuous quantile head is not supported for horizons >"
           f" {self.model.os}."
       )
+    if fc.pack_inputs and fc.return_backcast:
+      raise ValueError("Packed inputs do not support backcasts.")
+    if fc.pack_inputs and fc.attention_window:
+      raise ValueError("Packed inputs do not support an attention window.")
     self.forecast_config = fc
+    decode_kwargs = dict(
+        return_all_patches=fc.return_backcast,
+        return_quantile_spread=fc.use_continuous_quantile_head,
+    )
+
+    if self.compiled_graphs is not None and warmup:
+      # Every batch size that batch_rows() can return.
+      batch_sizes = sorted(
+          {self.batch_rows(n) for n in range(1, self.global_batch_size + 1)}
+      )
+      self.compiled_graphs.warmup(
+          [
+              (
+                  batch_size * (2 if fc.force_flip_invariance else 1),
+                  fc.max_context,
+                  horizon,
+              )
+              for batch_size in batch_sizes
+              for horizon in range(
+                  self.model.o, fc.max_horizon + 1, self.model.o
+              )
+          ],
+          **decode_kwargs,
+      )
 
     def _compiled_decode(horizon, inputs, masks):
       if horizon > fc.max_horizon:
@@ -359,90 +980,25 @@ class TimesFM_2p5_200M_torch(timesfm_2p5_base.TimesFM_2p5):
             f" {horizon} > {fc.max_horizon}."
         )
 
-      inputs = torch.Tensor(np.array(inputs)).to(self.model.device)
-      masks = torch.Tensor(np.array(masks)).to(self.model.device).to(torch.bool)
-      batch_size = inputs.shape[0]
-
-      if fc.infer_is_positive:
-        is_positive = torch.all(inputs >= 0, dim=-1, keepdim=True)
-      else:
-        is_positive = None
-
-      if fc.normalize_inputs:
-        mu = torch.mean(inputs, dim=-1, keepdim=True)
-        sigma = torch.std(inputs, dim=-1, keepdim=True)
-        inputs = revin(inputs, mu, sigma, reverse=False)
-      else:
-        mu, sigma = None, None
-
-      pf_outputs, quantile_spreads, ar_outputs = self.model.decode(
-          forecast_config.max_horizon, inputs, masks
-      )
-      to_cat = [pf_outputs[:, -1, ...]]
-      if ar_outputs is not None:
-        to_cat.append(ar_outputs.reshape(batch_size, -1, self.model.q))
-      full_forecast = torch.cat(to_cat, dim=1)
-
-      flip_quantile_fn = lambda x: torch.cat(
-          [x[..., :1], torch.flip(x[..., 1:], dims=(-1,))], dim=-1
-      )
-
-      if fc.force_flip_invariance:
-        flipped_pf_outputs, flipped_quantile_spreads, flipped_ar_outputs = (
-            self.model.decode(forecast_config.max_horizon, -inputs, masks)
+      with timesfm_2p5_profiling.stage("prepare_inputs"):
+        prepared = timesfm_2p5_base.prepare_decode_inputs(inputs, masks, fc)
+        decode_inputs = torch.as_tensor(
+            prepared.inputs, device=self.model.device
         )
-        flipped_quantile_spreads = flip_quantile_fn(flipped_quantile_spreads)
-        flipped_pf_outputs = flip_quantile_fn(flipped_pf_outputs)
-        to_cat = [flipped_pf_outputs[:, -1, ...]]
-        if flipped_ar_outputs is not None:
-          to_cat.append(
-              flipped_ar_outputs.reshape(batch_size, -1, self.model.q)
-          )
-        flipped_full_forecast = torch.cat(to_cat, dim=1)
-        quantile_spreads = (quantile_spreads - flipped_quantile_spreads) / 2
-        pf_outputs = (pf_outputs - flipped_pf_outputs) / 2
-        full_forecast = (full_forecast - flipped_full_forecast) / 2
-
-      if fc.use_continuous_quantile_head:
-        for quantile_index in [1, 2, 3, 4, 6, 7, 8, 9]:
-          full_forecast[:, :, quantile_index] = (
-              quantile_spreads[:, : fc.max_horizon, quantile_index]
-              - quantile_spreads[:, : fc.max_horizon, 5]
-              + full_forecast[:, : fc.max_horizon, 5]
-          )
-      full_forecast = full_forecast[:, :horizon, :]
-
-      if fc.return_backcast:
-        full_backcast = pf_outputs[:, :-1, : self.model.p, :].reshape(
-            batch_size, -1, self.model.q
+        decode_masks = torch.as_tensor(prepared.masks, device=self.model.device)
+      with timesfm_2p5_profiling.stage("decode"):
+        outputs = decode(
+            self.horizon_bucket(horizon),
+            decode_inputs,
+            decode_masks,
+            **decode_kwargs,
         )
-        full_forecast = torch.cat([full_backcast, full_forecast], dim=1)
-
-      if fc.fix_quantile_crossing:
-        for i in [4, 3, 2, 1]:
-          full_forecast[:, :, i] = torch.where(
-              full_forecast[:, :, i] < full_forecast[:, :, i + 1],
-              full_forecast[:, :, i],
-              full_forecast[:, :, i + 1],
-          )
-        for i in [6, 7, 8, 9]:
-          full_forecast[:, :, i] = torch.where(
-              full_forecast[:, :, i] > full_forecast[:, :, i - 1],
-              full_forecast[:, :, i],
-              full_forecast[:, :, i - 1],
-          )
-
-      if fc.normalize_inputs:
-        full_forecast = revin(full_forecast, mu, sigma, reverse=True)
-
-      if is_positive is not None:
-        full_forecast = torch.where(
-            is_positive[..., None],
-            torch.maximum(full_forecast, torch.zeros_like(full_forecast)),
-            full_forecast,
+      with timesfm_2p5_profiling.stage("postprocess"):
+        outputs = [
+            None if x is None else x.detach().cpu().numpy() for x in outputs
+        ]
+        return timesfm_2p5_base.postprocess_forecast(
+            horizon, *outputs, prepared, fc, self.model.p
         )
 
-      full_forecast = full_forecast.detach().cpu().numpy()
-      return full_forecast[..., 5], full_forecast
-
     self.compiled_decode = _compiled_decode
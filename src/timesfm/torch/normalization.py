@@ -33,7 +33,12 @@ class RMSNorm(nn.Module):
     self.epsilon = epsilon
 
   def forward(self, inputs: torch.Tensor) -> torch.Tensor:
-    var = torch.mean(torch.square(inputs), dim=-1, keepdim=True)
-    normed_inputs = inputs * torch.rsqrt(var + self.epsilon)
-    normed_inputs = normed_inputs * self.scale
+    # The statistics are accumulated in float32 for reduced-precision inputs.
+    var = torch.mean(
+        torch.square(inputs.to(torch.float32)), dim=-1, keepdim=True
+    )
+    normed_inputs = inputs * torch.rsqrt(var + self.epsilon).to(inputs.dtype)
+    # The scale is None once it has been folded into the next projection.
+    if self.scale is not None:
+      normed_inputs = normed_inputs * self.scale
     return normed_inputs
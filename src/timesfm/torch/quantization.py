@@ -0,0 +1,118 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Int8 quantization of the linear layers of TimesFM."""
+
+import torch
+from torch import nn
+
+_INT8_MAX = 127.0
+_MIN_SCALE = 1e-12
+
+
+def quantize_per_row(x: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+  """Symmetrically quantizes every row of a matrix to int8.
+
+  Args:
+    x: A float matrix of shape [m, n].
+
+  Returns:
+    The int8 matrix and the float32 scale of every row, of shape [m], such
+    that x ~= q * scale[:, None].
+  """
+  x = x.to(torch.float32)
+  scale = torch.clamp(
+      torch.amax(torch.abs(x), dim=-1) / _INT8_MAX, min=_MIN_SCALE
+  )
+  q = torch.clamp(torch.round(x / scale[:, None]), -_INT8_MAX, _INT8_MAX)
+  return q.to(torch.int8), scale
+
+
+# The int8 GEMM of torch is private and missing from older versions.
+_HAS_INT_MM = hasattr(torch, "_int_mm")
+
+
+def _int8_matmul(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+  """Computes a @ b.T of int8 matrices, accumulated in int32."""
+  m, k = a.shape
+  n = b.shape[0]
+  if _HAS_INT_MM and (
+      a.device.type == "cpu" or (m > 16 and k % 8 == 0 and n % 8 == 0)
+  ):
+    return torch._int_mm(a, b.t())  # pylint: disable=protected-access
+  # Without the int8 GEMM, or for shapes its accelerator kernels do not
+  # support, dequantize and multiply in float.
+  return (a.to(torch.float32) @ b.to(torch.float32).t()).to(torch.int32)
+
+
+class Int8Linear(nn.Module):
+  """Linear layer with int8 weights and dynamically quantized activations.
+
+  The weights are quantized once with one scale per output channel. At every
+  call the activations are quantized with one scale per row, the product is
+  computed by an int8 GEMM with int32 accumulation and rescaled to the dtype
+  of the inputs.
+  """
+
+  def __init__(self, in_features: int, out_features: int, bias: bool = True):
+    super().__init__()
+    self.in_features = in_features
+    self.out_features = out_features
+    self.register_buffer(
+        "weight", torch.zeros(out_features, in_features, dtype=torch.int8)
+    )
+    self.register_buffer("weight_scale", torch.ones(out_features))
+    if bias:
+      self.bias = nn.Parameter(torch.zeros(out_features))
+    else:
+      self.register_parameter("bias", None)
+
+  @classmethod
+  @torch.no_grad()
+  def from_linear(cls, linear: nn.Linear) -> "Int8Linear":
+    """Quantizes a float linear layer."""
+    layer = cls(
+        linear.in_features, linear.out_features, bias=linear.bias is not None
+    ).to(linear.weight.device)
+    weight, weight_scale = quantize_per_row(linear.weight)
+    layer.weight.copy_(weight)
+    layer.weight_scale.copy_(weight_scale)
+    if linear.bias is not None:
+      layer.bias.copy_(linear.bias)
+    return layer
+
+  def forward(self, x: torch.Tensor) -> torch.Tensor:
+    shape = x.shape
+    x_q, x_scale = quantize_per_row(x.reshape(-1, self.in_features))
+    y = _int8_matmul(x_q, self.weight).to(torch.float32)
+    y = y * x_scale[:, None] * self.weight_scale[None, :]
+    if self.bias is not None:
+      y = y + self.bias.to(torch.float32)
+    return y.to(x.dtype).reshape(*shape[:-1], self.out_features)
+
+  def extra_repr(self) -> str:
+    return (
+        f"in_features={self.in_features}, out_features={self.out_features},"
+        f" bias={self.bias is not None}"
+    )
+
+
+def quantize_linear_layers(module: nn.Module) -> nn.Module:
+  """Replaces every nn.Linear in `module` by an Int8Linear, in place."""
+  for name, child in module.named_children():
+    if isinstance(child, nn.Linear):
+      setattr(module, name, Int8Linear.from_linear(child))
+    else:
+      quantize_linear_layers(child)
+  return module
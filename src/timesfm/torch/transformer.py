@@ -14,8 +14,9 @@
 
 """Transformer layers for TimesFM."""
 
+import functools
 import math
-from typing import Callable
+from typing import Callable, Literal
 
 import torch
 from torch import nn
@@ -30,6 +31,20 @@ RMSNorm = normalization.RMSNorm
 DecodeCache = util.DecodeCache
 
 
+@functools.lru_cache(maxsize=64)
+def _attn_index_grids(
+    query_length: int, kv_length: int, device: torch.device
+) -> tuple[torch.Tensor, torch.Tensor]:
+  """Returns the query and key index grids of an attention mask.
+
+  The grids only depend on the shape, so they are built once per
+  (query_length, kv_length, device) and shared by all layers and calls.
+  """
+  q_index = torch.arange(query_length, device=device)[None, None, :, None]
+  kv_index = torch.arange(kv_length, device=device)[None, None, None, :]
+  return q_index, kv_index
+
+
 def make_attn_mask(
     query_length: int,
     num_all_masked_kv: torch.Tensor,
@@ -40,20 +55,76 @@ def make_attn_mask(
   if kv_length == 0:
     kv_length = query_length
 
-  q_index = torch.arange(query_length, device=num_all_masked_kv.device)[
-      None, None, :, None
-  ]
+  grids = _attn_index_grids
+  if torch.compiler.is_compiling():
+    # Compiled graphs bake the grids in as constants themselves.
+    grids = grids.__wrapped__
+  q_index, kv_index = grids(query_length, kv_length, num_all_masked_kv.device)
   if query_index_offset is not None:
     q_index = q_index + query_index_offset[:, None, None, None]
-  kv_index = torch.arange(kv_length, device=num_all_masked_kv.device)[
-      None, None, None, :
-  ]
   return torch.logical_and(
       q_index >= kv_index,
       kv_index >= num_all_masked_kv[:, None, None, None],
   )
 
 
+def make_local_attn_mask(
+    query_position: torch.Tensor,
+    kv_position: torch.Tensor,
+    kv_is_global: torch.Tensor,
+    window: int,
+    num_global: int,
+) -> torch.Tensor:
+  """Makes the attention mask of local attention with global patches.
+
+  A query at position t attends to the keys at positions (t - window, t] and
+  to the keys of the first `num_global` positions. Negative positions mark
+  padding and empty cache slots.
+
+  Args:
+    query_position: Positions of the queries, shape [..., q].
+    kv_position: Positions of the keys, shape [..., k].
+    kv_is_global: Whether every key is a global one, broadcastable to
+      kv_position. Non-global keys at global positions are not attended to,
+      as they duplicate a global key.
+    window: Number of most recent positions every query attends to.
+    num_global: Number of global positions.
+
+  Returns:
+    A boolean mask of shape [..., q, k].
+  """
+  q = query_position[..., :, None]
+  k = kv_position[..., None, :]
+  is_local = (k >= num_global) & (q - k < window)
+  return (k >= 0) & (k <= q) & (kv_is_global[..., None, :] | is_local)
+
+
+@functools.lru_cache(maxsize=16)
+def _rotary_tables(
+    embedding_dims: int,
+    min_timescale: float,
+    max_timescale: float,
+    max_position: int,
+    device: torch.device,
+) -> tuple[torch.Tensor, torch.Tensor]:
+  """Returns the sin and cos tables of positions [-max_position, max_position).
+
+  Both tables have shape [2 * max_position, embedding_dims // 2], with the
+  row of position `i` at index `i + max_position`. They are shared by every
+  layer with the same settings.
+  """
+  half_embedding_dim = embedding_dims // 2
+  fraction = (
+      2 * torch.arange(0, half_embedding_dim, device=device) / embedding_dims
+  )
+  timescale = min_timescale * (max_timescale / min_timescale) ** fraction
+  position = torch.arange(
+      -max_position, max_position, dtype=torch.float32, device=device
+  )
+  sinusoid_inp = position[:, None] / timescale[None, :]
+  return torch.sin(sinusoid_inp), torch.cos(sinusoid_inp)
+
+
 class RotaryPositionalEmbedding(nn.Module):
   """Rotary positional embedding."""
 
@@ -62,23 +133,56 @@ class RotaryPositionalEmbedding(nn.Module):
       embedding_dims: int,
       min_timescale: float = 1.0,
       max_timescale: float = 10000.0,
+      max_position: int = 0,
   ):
+    """Initializes the rotary positional embedding.
+
+    Args:
+      embedding_dims: The embedding dims, i.e. the head dims.
+      min_timescale: The minimum timescale.
+      max_timescale: The maximum timescale.
+      max_position: If positive, the sinusoids of calls whose positions are
+        known to lie in [-max_position, max_position) are gathered from
+        tables precomputed for this range instead of being recomputed. Other
+        calls still compute them.
+    """
     super().__init__()
     self.embedding_dims = embedding_dims
     self.min_timescale = min_timescale
     self.max_timescale = max_timescale
+    self.max_position = max_position
 
   def forward(
       self,
       inputs: torch.Tensor,
       position: torch.Tensor | None = None,
+      position_bound: int | None = None,
   ):
-    """Generates a JTensor of sinusoids with different frequencies."""
+    """Generates a JTensor of sinusoids with different frequencies.
+
+    Args:
+      inputs: Inputs of rank 3 or 4 to rotate.
+      position: Optional positions of the inputs, of shape inputs.shape[:2].
+      position_bound: Optional bound with all positions in [-position_bound,
+        position_bound). The precomputed tables are only used when it is
+        known and within max_position, since checking the positions
+        themselves would synchronize with the device.
+
+    Returns:
+      The rotated inputs.
+    """
     if self.embedding_dims != inputs.shape[-1]:
       raise ValueError(
           "The embedding dims of the rotary position embedding"
           "must match the hidden dimension of the inputs."
       )
+    if (
+        self.max_position > 0
+        and position is not None
+        and position_bound is not None
+        and position_bound <= self.max_position
+    ):
+      return self._apply_from_tables(inputs, position)
     half_embedding_dim = self.embedding_dims // 2
     fraction = (
         2
@@ -105,12 +209,41 @@ class RotaryPositionalEmbedding(nn.Module):
       raise ValueError("Inputs must be of rank 3 or 4.")
 
     sinusoid_inp = position / timescale
-    sin = torch.sin(sinusoid_inp)
-    cos = torch.cos(sinusoid_inp)
-    first_half, second_half = torch.chunk(inputs, 2, dim=-1)
-    first_part = first_half * cos - second_half * sin
-    second_part = second_half * cos + first_half * sin
-    return torch.cat([first_part, second_part], dim=-1)
+    sin = torch.sin(sinusoid_inp).to(inputs.dtype)
+    cos = torch.cos(sinusoid_inp).to(inputs.dtype)
+    return _rotate(inputs, sin, cos)
+
+  def _apply_from_tables(
+      self, inputs: torch.Tensor, position: torch.Tensor
+  ) -> torch.Tensor:
+    tables = _rotary_tables
+    if torch.compiler.is_compiling():
+      tables = tables.__wrapped__
+    sin_table, cos_table = tables(
+        self.embedding_dims,
+        self.min_timescale,
+        self.max_timescale,
+        self.max_position,
+        inputs.device,
+    )
+    index = position.to(torch.long) + self.max_position
+    sin = sin_table[index].to(inputs.dtype)
+    cos = cos_table[index].to(inputs.dtype)
+    if len(inputs.shape) == 4:
+      sin = sin[..., None, :]
+      cos = cos[..., None, :]
+    elif len(inputs.shape) != 3:
+      raise ValueError("Inputs must be of rank 3 or 4.")
+    return _rotate(inputs, sin, cos)
+
+
+def _rotate(
+    inputs: torch.Tensor, sin: torch.Tensor, cos: torch.Tensor
+) -> torch.Tensor:
+  first_half, second_half = torch.chunk(inputs, 2, dim=-1)
+  first_part = first_half * cos - second_half * sin
+  second_part = second_half * cos + first_half * sin
+  return torch.cat([first_part, second_part], dim=-1)
 
 
 def _dot_product_attention(
@@ -126,11 +259,79 @@ def _dot_product_attention(
         mask, attn_weights, -torch.finfo(attn_weights.dtype).max / 2
     )
 
-  attn_weights = F.softmax(attn_weights, dim=-1)
+  attn_weights = F.softmax(attn_weights, dim=-1, dtype=torch.float32).to(
+      value.dtype
+  )
 
   return torch.einsum("...hqk,...khd->...qhd", attn_weights, value)
 
 
+def make_attn_bias(mask: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+  """Turns a boolean attention mask into an additive one for SDPA.
+
+  Masked keys get the same large finite fill value as `_dot_product_attention`
+  so that fully masked rows do not produce NaNs.
+  """
+  bias = torch.zeros(mask.shape, dtype=dtype, device=mask.device)
+  return bias.masked_fill_(~mask, -torch.finfo(dtype).max / 2)
+
+
+def _fused_dot_product_attention(
+    query: torch.Tensor,
+    key: torch.Tensor,
+    value: torch.Tensor,
+    num_all_masked_kv: torch.Tensor | None,
+    query_index_offset: torch.Tensor | None = None,
+    mask: torch.Tensor | None = None,
+) -> torch.Tensor:
+  """Computes dot-product attention with PyTorch's fused SDPA kernels.
+
+  Queries are expected to be scaled already, as done by PerDimScale. Without
+  padding, a decode cache or an explicit mask the attention is purely causal
+  and no mask is built at all. Otherwise a per-row additive mask shared by all
+  heads is used, see make_attn_bias.
+
+  Args:
+    query: Queries of shape [b, q, h, d].
+    key: Keys of shape [b, k, h, d].
+    value: Values of shape [b, k, h, d].
+    num_all_masked_kv: Number of leading masked keys per row, shape [b], or
+      None if no row is padded. Unused if `mask` is given.
+    query_index_offset: Optional cache index of the first query, shape [b].
+    mask: Optional boolean mask of shape [b, 1, q, k], or the additive mask
+      made from it by make_attn_bias, to use instead of the causal mask built
+      from `num_all_masked_kv` and `query_index_offset`.
+
+  Returns:
+    The attention output of shape [b, q, h, d].
+  """
+  query = query.transpose(1, 2)
+  key = key.transpose(1, 2)
+  value = value.transpose(1, 2)
+  if mask is None and query_index_offset is None and num_all_masked_kv is None:
+    x = F.scaled_dot_product_attention(
+        query, key, value, is_causal=True, scale=1.0
+    )
+  else:
+    if mask is None:
+      if num_all_masked_kv is None:
+        num_all_masked_kv = torch.zeros(
+            query.shape[0], dtype=torch.int32, device=query.device
+        )
+      mask = make_attn_mask(
+          query_length=query.shape[2],
+          num_all_masked_kv=num_all_masked_kv,
+          query_index_offset=query_index_offset,
+          kv_length=key.shape[2],
+      )
+    if mask.dtype == torch.bool:
+      mask = make_attn_bias(mask, query.dtype)
+    x = F.scaled_dot_product_attention(
+        query, key, value, attn_mask=mask, scale=1.0
+    )
+  return x.transpose(1, 2)
+
+
 class PerDimScale(nn.Module):
   """Per-dimension scaling."""
 
@@ -138,12 +339,21 @@ class PerDimScale(nn.Module):
     super().__init__()
     self.num_dims = num_dims
     self.per_dim_scale = nn.Parameter(torch.zeros(num_dims))
+    self.register_buffer("frozen_scale_factor", None, persistent=False)
 
-  def forward(self, x: torch.Tensor) -> torch.Tensor:
-    scale_factor = (
+  def scale_factor(self) -> torch.Tensor:
+    if self.frozen_scale_factor is not None:
+      return self.frozen_scale_factor
+    return (
         1.442695041 / math.sqrt(self.num_dims) * F.softplus(self.per_dim_scale)
     )
-    return x * scale_factor
+
+  def freeze(self) -> None:
+    """Caches the scale factor as a constant for inference."""
+    self.frozen_scale_factor = self.scale_factor().detach().clone()
+
+  def forward(self, x: torch.Tensor) -> torch.Tensor:
+    return x * self.scale_factor()
 
 
 class MultiHeadAttention(nn.Module):
@@ -159,6 +369,8 @@ class MultiHeadAttention(nn.Module):
       use_bias: bool = False,
       attention_fn: Callable[..., torch.Tensor] = _dot_product_attention,
       qk_norm: str = "rms",
+      attention_backend: Literal["eager", "sdpa"] = "eager",
+      max_position: int = 0,
   ):
     super().__init__()
     self.num_heads = num_heads
@@ -167,16 +379,23 @@ class MultiHeadAttention(nn.Module):
     self.use_bias = use_bias
     self.attention_fn = attention_fn
     self.qk_norm = qk_norm
+    self.attention_backend = attention_backend
 
     if self.in_features % self.num_heads != 0:
       raise ValueError(
           f"Memory dimension ({self.in_features}) must be divisible by "
           f"'num_heads' heads ({self.num_heads})."
       )
+    if self.attention_backend not in ("eager", "sdpa"):
+      raise ValueError(
+          f"Attention backend: {self.attention_backend} not supported."
+      )
 
     self.query = nn.Linear(self.in_features, self.in_features, bias=use_bias)
     self.key = nn.Linear(self.in_features, self.in_features, bias=use_bias)
     self.value = nn.Linear(self.in_features, self.in_features, bias=use_bias)
+    # The fused query, key and value projection, set by fold_weights().
+    self.qkv: nn.Linear | None = None
     self.out = nn.Linear(self.in_features, self.in_features, bias=use_bias)
 
     if self.qk_norm == "rms":
@@ -190,51 +409,150 @@ class MultiHeadAttention(nn.Module):
     if self.use_rotary_position_embeddings:
       self.rotary_position_embedding = RotaryPositionalEmbedding(
           embedding_dims=self.head_dim,
+          max_position=max_position,
       )
 
     self.use_per_dim_scale = use_per_dim_scale
     if use_per_dim_scale:
       self.per_dim_scale = PerDimScale(num_dims=self.head_dim)
 
+    # Local attention, see set_attention_window().
+    self.attention_window = 0
+    self.num_global_patches = 0
+
+  def set_attention_window(self, window: int, num_global: int = 0) -> None:
+    """Restricts attention to a sliding window of recent patches.
+
+    With a window, every patch attends to the `window` most recent patches of
+    its series, itself included, and to its first `num_global` patches. The
+    cost of a call becomes linear in the number of patches, and decoding
+    requires a util.RingDecodeCache of fixed size.
+
+    Args:
+      window: Number of most recent patches to attend to, 0 for full causal
+        attention.
+      num_global: Number of leading patches every patch attends to.
+    """
+    if window < 0 or num_global < 0:
+      raise ValueError(f"Invalid attention window: {window}, {num_global}.")
+    self.attention_window = window
+    self.num_global_patches = num_global if window else 0
+
+  @torch.no_grad()
+  def fold_weights(self, input_scale: torch.Tensor | None = None) -> None:
+    """Fuses and folds the weights for inference.
+
+    The query, key and value projections are fused into a single projection,
+    with `input_scale`, the scale of a preceding RMSNorm, folded into its
+    input columns. The per-dimension query scale is folded into the scale of
+    the query norm when there is one, and cached as a constant otherwise.
+
+    Args:
+      input_scale: Optional per-feature scale applied to the inputs, of shape
+        [in_features].
+    """
+    if self.qkv is not None:
+      raise RuntimeError("The weights are already folded.")
+    projections = [self.query, self.key, self.value]
+    weight = torch.cat([x.weight for x in projections], dim=0)
+    if input_scale is not None:
+      weight = weight * input_scale[None, :]
+    qkv = nn.Linear(
+        self.in_features,
+        3 * self.in_features,
+        bias=self.use_bias,
+        device=weight.device,
+        dtype=weight.dtype,
+    )
+    qkv.weight.copy_(weight)
+    if self.use_bias:
+      qkv.bias.copy_(torch.cat([x.bias for x in projections], dim=0))
+    self.qkv = qkv
+    del self.query, self.key, self.value
+
+    if self.use_per_dim_scale:
+      if isinstance(self.query_ln, RMSNorm) and self.query_ln.scale is not None:
+        self.query_ln.scale.mul_(self.per_dim_scale.scale_factor())
+        self.use_per_dim_scale = False
+        del self.per_dim_scale
+      else:
+        self.per_dim_scale.freeze()
+
   def forward(
       self,
       inputs_q: torch.Tensor,
       *,
       decode_cache: DecodeCache | None = None,
       patch_mask: torch.Tensor | None = None,
+      attn_mask: torch.Tensor | None = None,
+      position: torch.Tensor | None = None,
+      is_causal: bool = False,
   ) -> tuple[torch.Tensor, DecodeCache | None]:
+    """Attends the inputs to themselves and to the decode cache.
+
+    By default, every row holds one left-padded series: queries attend
+    causally to all unpadded keys and positions count from the first unpadded
+    patch. `attn_mask` and `position` override both, e.g. for rows packing
+    several series.
+
+    Args:
+      inputs_q: Inputs of shape [b, n, in_features].
+      decode_cache: Optional decode cache to append the keys and values to and
+        to attend over.
+      patch_mask: Optional padding mask of shape [b, n], True for padding.
+      attn_mask: Optional boolean mask of shape [b, 1, n, k], True where a
+        query attends to a key, or with the sdpa backend the additive mask
+        made from it by make_attn_bias. k is the cache size with a decode
+        cache, n otherwise. See make_attn_mask.
+      position: Optional rotary positions of the inputs, of shape [b, n],
+        in [-k, k) where k is the cache size with a decode cache and n
+        otherwise.
+      is_causal: Whether no patch is padded and the decode cache, if any, is
+        empty, so that the sdpa backend attends causally without a mask.
+
+    Returns:
+      The outputs of shape [b, n, in_features] and the updated decode cache.
+    """
     b, n_patches, _ = inputs_q.shape
     if patch_mask is None:
       patch_mask = torch.zeros(
           b, n_patches, dtype=torch.bool, device=inputs_q.device
       )
 
-    query = self.query(inputs_q).view(
-        b, n_patches, self.num_heads, self.head_dim
-    )
-    key = self.key(inputs_q).view(b, n_patches, self.num_heads, self.head_dim)
-    value = self.value(inputs_q).view(
-        b, n_patches, self.num_heads, self.head_dim
-    )
-
-    if decode_cache is None:
-      num_masked = torch.sum(patch_mask.to(torch.int32), dim=-1)
-      next_index = torch.zeros_like(num_masked, dtype=torch.int32)
+    if self.qkv is not None:
+      query, key, value = self.qkv(inputs_q).view(
+          b, n_patches, 3, self.num_heads, self.head_dim
+      ).unbind(dim=2)
     else:
-      num_masked = (
-          torch.sum(patch_mask.to(torch.int32), dim=-1)
-          + decode_cache.num_masked
+      query = self.query(inputs_q).view(
+          b, n_patches, self.num_heads, self.head_dim
+      )
+      key = self.key(inputs_q).view(
+          b, n_patches, self.num_heads, self.head_dim
+      )
+      value = self.value(inputs_q).view(
+          b, n_patches, self.num_heads, self.head_dim
       )
-      next_index = decode_cache.next_index.clone()
 
-    if self.use_rotary_position_embeddings:
+    num_masked, next_index = self._cache_positions(patch_mask, decode_cache)
+
+    if position is None:
       position = (
           torch.arange(n_patches, device=inputs_q.device)[None, :]
           + next_index[:, None]
           - num_masked[:, None]
       )
-      query = self.rotary_position_embedding(query, position)
-      key = self.rotary_position_embedding(key, position)
+    if self.use_rotary_position_embeddings:
+      # Positions count patches of the cache, or of the inputs without one,
+      # except in ring caches where they grow with the whole series.
+      if decode_cache is None:
+        position_bound = n_patches
+      elif isinstance(decode_cache, util.RingDecodeCache):
+        position_bound = None
+      else:
+        position_bound = decode_cache.key.shape[1]
+      query = self.rotary_position_embedding(query, position, position_bound)
+      key = self.rotary_position_embedding(key, position, position_bound)
 
     query = self.query_ln(query)
     key = self.key_ln(key)
@@ -242,43 +560,251 @@ class MultiHeadAttention(nn.Module):
     if self.use_per_dim_scale:
       query = self.per_dim_scale(query)
 
+    if self.attention_window > 0:
+      x = self._local_attention(query, key, value, position, decode_cache)
+      x = x.reshape(b, n_patches, self.in_features)
+      return self.out(x), decode_cache
+    if isinstance(decode_cache, util.RingDecodeCache):
+      raise ValueError("Ring decode caches require an attention window.")
+
     if decode_cache is not None:
       _, decode_cache_size, _, _ = decode_cache.value.shape
-      for i in range(b):
-        start = decode_cache.next_index[i]
-        end = start + n_patches
-        decode_cache.key[i, start:end] = key[i].clone()
-        decode_cache.value[i, start:end] = value[i].clone()
-      key = decode_cache.key.clone()
-      value = decode_cache.value.clone()
+      # Scatter the new keys and values of all rows in one indexed write and
+      # attend over the cache, in place unless it stores a narrower dtype.
+      batch_index = torch.arange(b, device=inputs_q.device)[:, None]
+      cache_index = (
+          next_index.to(torch.long)[:, None]
+          + torch.arange(n_patches, device=inputs_q.device)[None, :]
+      )
+      decode_cache.store(batch_index, cache_index, key, value)
+      key, value = decode_cache.load(query.dtype)
       decode_cache.next_index += n_patches
       decode_cache.num_masked = num_masked
-      attn_mask = make_attn_mask(
-          query_length=n_patches,
+      query_index_offset = next_index
+    else:
+      decode_cache_size = 0
+      query_index_offset = None
+
+    if self.attention_backend == "sdpa" and is_causal:
+      x = _fused_dot_product_attention(
+          query,
+          key[:, :n_patches],
+          value[:, :n_patches],
+          num_all_masked_kv=None,
+      )
+    elif self.attention_backend == "sdpa":
+      x = _fused_dot_product_attention(
+          query,
+          key,
+          value,
           num_all_masked_kv=num_masked,
-          query_index_offset=next_index,
-          kv_length=decode_cache_size,
+          query_index_offset=query_index_offset,
+          mask=attn_mask,
       )
     else:
-      attn_mask = make_attn_mask(
-          query_length=n_patches, num_all_masked_kv=num_masked
+      if attn_mask is None:
+        attn_mask = make_attn_mask(
+            query_length=n_patches,
+            num_all_masked_kv=num_masked,
+            query_index_offset=query_index_offset,
+            kv_length=decode_cache_size,
+        )
+      x = self.attention_fn(
+          query,
+          key,
+          value,
+          mask=attn_mask,
       )
-
-    x = self.attention_fn(
-        query,
-        key,
-        value,
-        mask=attn_mask,
-    )
     x = x.reshape(b, n_patches, self.in_features)
     out = self.out(x)
     return out, decode_cache
 
+  def _cache_positions(
+      self,
+      patch_mask: torch.Tensor,
+      decode_cache: DecodeCache | util.RingDecodeCache | None,
+  ) -> tuple[torch.Tensor, torch.Tensor]:
+    """Returns the number of masked patches and the next index of all rows."""
+    num_masked = torch.sum(patch_mask.to(torch.int32), dim=-1)
+    if decode_cache is None:
+      next_index = torch.zeros_like(num_masked)
+    elif isinstance(decode_cache, util.RingDecodeCache):
+      next_index = decode_cache.next_position
+    else:
+      num_masked = num_masked + decode_cache.num_masked
+      next_index = decode_cache.next_index.clone()
+    return num_masked, next_index
+
+  def make_attn_mask(
+      self,
+      patch_mask: torch.Tensor,
+      decode_cache: DecodeCache | None = None,
+      dtype: torch.dtype = torch.float32,
+  ) -> torch.Tensor:
+    """Makes the causal mask that forward() builds without an `attn_mask`.
+
+    All the layers of a stack see the same padding and cache indices, so the
+    stack can build this mask once per call and pass it to every layer.
+
+    Args:
+      patch_mask: Padding mask of the inputs of shape [b, n], True for
+        padding.
+      decode_cache: Optional decode cache the inputs are appended to. It is
+        not updated.
+      dtype: The dtype of the queries, and of the additive mask made for the
+        sdpa backend.
+
+    Returns:
+      The `attn_mask` of shape [b, 1, n, k] of forward(): boolean with the
+      eager backend, additive with the sdpa one.
+    """
+    if self.attention_window > 0:
+      raise ValueError("Local attention builds its own masks.")
+    num_masked, next_index = self._cache_positions(patch_mask, decode_cache)
+    mask = make_attn_mask(
+        query_length=patch_mask.shape[1],
+        num_all_masked_kv=num_masked,
+        query_index_offset=None if decode_cache is None else next_index,
+        kv_length=0 if decode_cache is None else decode_cache.value.shape[1],
+    )
+    if self.attention_backend == "sdpa":
+      mask = make_attn_bias(mask, dtype)
+    return mask
+
+  def _masked_attention(
+      self,
+      query: torch.Tensor,
+      key: torch.Tensor,
+      value: torch.Tensor,
+      mask: torch.Tensor,
+  ) -> torch.Tensor:
+    if self.attention_backend == "sdpa":
+      return _fused_dot_product_attention(
+          query, key, value, num_all_masked_kv=None, mask=mask
+      )
+    return self.attention_fn(query, key, value, mask=mask)
+
+  def _local_attention(
+      self,
+      query: torch.Tensor,
+      key: torch.Tensor,
+      value: torch.Tensor,
+      position: torch.Tensor,
+      decode_cache: util.RingDecodeCache | None,
+  ) -> torch.Tensor:
+    """Computes sliding-window attention, see set_attention_window.
+
+    Calls on an empty or no cache attend in chunks of `window` queries, each
+    over the global keys and the keys of its own and of the previous chunk,
+    so their cost is linear in the number of patches. Later calls attend over
+    the fixed-size cache, so they may add at most `ring_size - window`
+    patches each.
+    """
+    window, num_global = self.attention_window, self.num_global_patches
+    if decode_cache is not None and not isinstance(
+        decode_cache, util.RingDecodeCache
+    ):
+      raise ValueError("Local attention requires a ring decode cache.")
+    if decode_cache is not None and not decode_cache.is_empty:
+      if query.shape[1] > decode_cache.ring_size - window:
+        raise ValueError(
+            f"A ring decode cache of {decode_cache.ring_size} patches takes at"
+            f" most {decode_cache.ring_size - window} patches per call with a"
+            f" window of {window}, got {query.shape[1]}."
+        )
+      decode_cache.write(key, value, position)
+      is_global = (
+          torch.arange(decode_cache.key.shape[1], device=query.device)
+          < num_global
+      )
+      mask = make_local_attn_mask(
+          position, decode_cache.position, is_global, window, num_global
+      )
+      return self._masked_attention(
+          query, decode_cache.key, decode_cache.value, mask[:, None]
+      )
+
+    b, n, h, d = query.shape
+    num_chunks = -(-n // window)
+    pad = num_chunks * window - n
+    chunked_query = F.pad(query, (0, 0, 0, 0, 0, pad)).view(
+        b * num_chunks, window, h, d
+    )
+    query_position = F.pad(position, (0, pad), value=-1).view(
+        b, num_chunks, window
+    )
+
+    # The first num_global unpadded patches of every row.
+    first = torch.sum(position < 0, dim=1, keepdim=True)
+    index = torch.clamp(
+        first + torch.arange(num_global, device=query.device), max=n - 1
+    )
+    global_position = torch.gather(position, 1, index)
+    global_position = torch.where(
+        global_position == torch.arange(num_global, device=query.device),
+        global_position,
+        -1,
+    )
+    batch_index = torch.arange(b, device=query.device)[:, None]
+
+    def chunked(x, x_global):
+      """Returns the global, previous and current chunk keys of all chunks.
+
+      Every chunk is written once, heads first, so that the attention kernels
+      read it without another transposed copy.
+      """
+      x = F.pad(x, (0, 0, 0, 0, window, pad)).view(
+          b, num_chunks + 1, window, h, d
+      )
+      out = x.new_empty(b, num_chunks, h, num_global + 2 * window, d)
+      out[..., :num_global, :] = x_global.transpose(1, 2)[:, None]
+      out[..., num_global : num_global + window, :] = x[:, :-1].transpose(
+          2, 3
+      )
+      out[..., num_global + window :, :] = x[:, 1:].transpose(2, 3)
+      return out.view(b * num_chunks, h, -1, d).transpose(1, 2)
+
+    chunked_key = chunked(key, key[batch_index, index])
+    chunked_value = chunked(value, value[batch_index, index])
+    local_position = F.pad(position, (window, pad), value=-1).unfold(
+        1, 2 * window, window
+    )
+    kv_position = torch.cat(
+        [
+            global_position[:, None].expand(b, num_chunks, num_global),
+            local_position,
+        ],
+        dim=2,
+    )
+    is_global = (
+        torch.arange(num_global + 2 * window, device=query.device)
+        < num_global
+    )
+    mask = make_local_attn_mask(
+        query_position, kv_position, is_global, window, num_global
+    )
+    x = self._masked_attention(
+        chunked_query,
+        chunked_key,
+        chunked_value,
+        mask.reshape(b * num_chunks, 1, window, -1),
+    )
+    if decode_cache is not None:
+      decode_cache.write(key, value, position)
+    return x.reshape(b, num_chunks * window, h, d)[:, :n]
+
 
 class Transformer(nn.Module):
   """Classic Transformer used in TimesFM."""
 
-  def __init__(self, config: configs.TransformerConfig):
+  def __init__(self, config: configs.TransformerConfig, max_position: int = 0):
+    """Initializes the transformer layer.
+
+    Args:
+      config: The transformer config.
+      max_position: If positive, rotary embeddings are gathered from tables
+        precomputed up to this position, see RotaryPositionalEmbedding.
+    """
     super().__init__()
     self.config = config
 
@@ -294,6 +820,7 @@ class Transformer(nn.Module):
         use_per_dim_scale=True,
         use_rotary_position_embeddings=config.use_rotary_position_embeddings,
         qk_norm=config.qk_norm,
+        max_position=max_position,
     )
 
     if config.feedforward_norm == "rms":
@@ -321,16 +848,38 @@ class Transformer(nn.Module):
     else:
       raise ValueError(f"Activation: {config.ff_activation} not supported.")
 
+  @torch.no_grad()
+  def fold_weights(self) -> None:
+    """Folds the weights of the layer for inference.
+
+    The scales of the pre-attention and pre-feedforward norms are folded into
+    the input columns of the projections that follow them, and the attention
+    projections are fused, see MultiHeadAttention.fold_weights. The scales of
+    the post norms stay since they feed the residual connections.
+    """
+    self.attn.fold_weights(input_scale=self.pre_attn_ln.scale)
+    self.pre_attn_ln.scale = None
+    self.ff0.weight.mul_(self.pre_ff_ln.scale[None, :])
+    self.pre_ff_ln.scale = None
+
   def forward(
       self,
       input_embeddings: torch.Tensor,
       patch_mask: torch.Tensor,
       decode_cache: DecodeCache | None = None,
+      *,
+      attn_mask: torch.Tensor | None = None,
+      position: torch.Tensor | None = None,
+      is_causal: bool = False,
   ) -> tuple[torch.Tensor, DecodeCache | None]:
+    """Runs the layer, see MultiHeadAttention.forward for the arguments."""
     attn_output, decode_cache = self.attn(
         inputs_q=self.pre_attn_ln(input_embeddings),
         decode_cache=decode_cache,
         patch_mask=patch_mask,
+        attn_mask=attn_mask,
+        position=position,
+        is_causal=is_causal,
     )
     attn_output = self.post_attn_ln(attn_output) + input_embeddings
     output_embeddings = (
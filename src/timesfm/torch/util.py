@@ -15,19 +15,308 @@
 """PyTorch utility functions for TimesFM layers."""
 
 import dataclasses
+import json
+import mmap
+import struct
+
 import torch
 
 _TOLERANCE = 1e-6
 
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def quantize_int8(x: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+  """Quantizes to int8 with one absmax scale per vector along the last dim.
+
+  Args:
+    x: Tensor of shape [..., d].
+
+  Returns:
+    The int8 values of shape [..., d] and the float32 scales of shape
+    [..., 1], such that x ~= values * scales.
+  """
+  scale = torch.amax(torch.abs(x.float()), dim=-1, keepdim=True) / 127.0
+  scale = torch.clamp(scale, min=_TOLERANCE)
+  values = torch.clamp(torch.round(x.float() / scale), -127, 127)
+  return values.to(torch.int8), scale
+
+
+def decode_cache_bytes(
+    *,
+    num_layers: int,
+    batch_size: int,
+    cache_size: int,
+    num_heads: int,
+    head_dim: int,
+    dtype: torch.dtype = torch.float32,
+) -> int:
+  """Bytes of the keys, values and scales of decode caches.
+
+  Args:
+    num_layers: Number of layers with a cache.
+    batch_size: Number of rows.
+    cache_size: Number of cached patches per row.
+    num_heads: Number of attention heads.
+    head_dim: Dimension of every head.
+    dtype: Storage dtype of the keys and values. int8 adds one float32 scale
+      per patch and head.
+
+  Returns:
+    The size in bytes, excluding the per-row indices.
+  """
+  per_head = head_dim * torch.empty((), dtype=dtype).element_size()
+  if dtype == torch.int8:
+    per_head += 4
+  return 2 * num_layers * batch_size * cache_size * num_heads * per_head
+
 
 @dataclasses.dataclass(frozen=False)
 class DecodeCache:
-  """Cache for decoding."""
+  """Cache for decoding.
+
+  Keys and values are stored in the dtype of `key` and `value`, which may be
+  narrower than the dtype of the activations. With int8 storage, `key_scale`
+  and `value_scale` hold one scale per patch and head, see `quantize_int8`.
+  Use `store` and `load` to write and read the cache in the activation dtype.
+  """
 
   next_index: torch.Tensor
   num_masked: torch.Tensor
   key: torch.Tensor
   value: torch.Tensor
+  key_scale: torch.Tensor | None = None
+  value_scale: torch.Tensor | None = None
+
+  def store(
+      self,
+      batch_index: torch.Tensor,
+      cache_index: torch.Tensor,
+      key: torch.Tensor,
+      value: torch.Tensor,
+  ) -> None:
+    """Writes keys and values of shape [b, n, h, d] at the given indices."""
+    if self.key_scale is None:
+      self.key[batch_index, cache_index] = key.to(self.key.dtype)
+      self.value[batch_index, cache_index] = value.to(self.value.dtype)
+      return
+    key, key_scale = quantize_int8(key)
+    value, value_scale = quantize_int8(value)
+    self.key[batch_index, cache_index] = key
+    self.value[batch_index, cache_index] = value
+    self.key_scale[batch_index, cache_index] = key_scale
+    self.value_scale[batch_index, cache_index] = value_scale
+
+  def load(self, dtype: torch.dtype) -> tuple[torch.Tensor, torch.Tensor]:
+    """Returns all keys and values, dequantized to `dtype`."""
+    if self.key_scale is None:
+      return self.key.to(dtype), self.value.to(dtype)
+    return (
+        (self.key * self.key_scale).to(dtype),
+        (self.value * self.value_scale).to(dtype),
+    )
+
+
+@dataclasses.dataclass(frozen=False)
+class RingDecodeCache:
+  """Fixed-size decode cache of local attention.
+
+  The first `num_global` slots hold the keys and values of the first
+  `num_global` patches of every series, which all patches attend to. The
+  remaining slots form a ring buffer holding the most recent patches, where
+  the patch at position t is stored in slot num_global + t % ring_size.
+
+  Attributes:
+    key: Keys of shape [b, num_global + ring_size, h, d].
+    value: Values of the same shape.
+    position: Position of the patch stored in every slot, or -1 for empty
+      slots, shape [b, num_global + ring_size].
+    next_position: Position of the next patch of every series, shape [b].
+    num_global: Number of global slots.
+    is_empty: Whether nothing has been written to the cache yet.
+  """
+
+  key: torch.Tensor
+  value: torch.Tensor
+  position: torch.Tensor
+  next_position: torch.Tensor
+  num_global: int
+  is_empty: bool = True
+
+  @classmethod
+  def create(
+      cls,
+      *,
+      batch_size: int,
+      num_global: int,
+      ring_size: int,
+      num_heads: int,
+      head_dim: int,
+      device: torch.device,
+      dtype: torch.dtype = torch.float32,
+  ) -> "RingDecodeCache":
+    """Returns an empty cache."""
+    shape = (batch_size, num_global + ring_size, num_heads, head_dim)
+    return cls(
+        key=torch.zeros(shape, dtype=dtype, device=device),
+        value=torch.zeros(shape, dtype=dtype, device=device),
+        position=torch.full(
+            shape[:2], -1, dtype=torch.long, device=device
+        ),
+        next_position=torch.zeros(
+            batch_size, dtype=torch.long, device=device
+        ),
+        num_global=num_global,
+    )
+
+  @property
+  def ring_size(self) -> int:
+    return self.key.shape[1] - self.num_global
+
+  def write(
+      self, key: torch.Tensor, value: torch.Tensor, position: torch.Tensor
+  ) -> None:
+    """Stores the global and the most recent patches among new ones.
+
+    Args:
+      key: New keys of shape [b, n, h, d].
+      value: New values of the same shape.
+      position: Positions of the new patches, negative for padding, shape
+        [b, n]. Positions are consecutive along n for the unpadded patches.
+    """
+    last = torch.max(position, dim=1, keepdim=True).values
+    is_ring = (position >= 0) & (position > last - self.ring_size)
+    is_global = (position >= 0) & (position < self.num_global)
+    ring_slot = self.num_global + torch.remainder(position, self.ring_size)
+    for keep, slot in [(is_ring, ring_slot), (is_global, position)]:
+      batch_index, index = torch.nonzero(keep, as_tuple=True)
+      slot = slot[batch_index, index]
+      self.key[batch_index, slot] = key[batch_index, index]
+      self.value[batch_index, slot] = value[batch_index, index]
+      self.position[batch_index, slot] = position[batch_index, index]
+    self.next_position = last[:, 0] + 1
+    self.is_empty = False
+
+
+class DecodeCacheArena:
+  """Preallocated storage for the decode caches of all layers.
+
+  The arena is allocated once and handed out as per-layer DecodeCache views by
+  `checkout`, so that consecutive decode calls with the same batch size do not
+  reallocate (and zero) the keys and values of every layer. Stale entries from
+  a previous call are never attended to, as they sit beyond the causal
+  horizon of the new call.
+  """
+
+  def __init__(
+      self,
+      *,
+      num_layers: int,
+      batch_size: int,
+      cache_size: int,
+      num_heads: int,
+      head_dim: int,
+      device: torch.device,
+      dtype: torch.dtype = torch.float32,
+  ):
+    """Allocates the arena.
+
+    Args:
+      num_layers: Number of layers.
+      batch_size: Number of rows.
+      cache_size: Maximum number of cached patches per row.
+      num_heads: Number of attention heads.
+      head_dim: Dimension of every head.
+      device: Device of the caches.
+      dtype: Storage dtype of the keys and values. With int8, the arena also
+        holds one float32 scale per patch and head.
+    """
+    shape = (num_layers, batch_size, cache_size, num_heads, head_dim)
+    self.key = torch.zeros(shape, dtype=dtype, device=device)
+    self.value = torch.zeros(shape, dtype=dtype, device=device)
+    if dtype == torch.int8:
+      self.key_scale = torch.zeros(
+          shape[:-1] + (1,), dtype=torch.float32, device=device
+      )
+      self.value_scale = torch.zeros_like(self.key_scale)
+    else:
+      self.key_scale = None
+      self.value_scale = None
+    self.next_index = torch.zeros(
+        num_layers, batch_size, dtype=torch.int32, device=device
+    )
+    self.num_masked = torch.zeros(
+        num_layers, batch_size, dtype=torch.int32, device=device
+    )
+
+  def fits(
+      self,
+      batch_size: int,
+      cache_size: int,
+      device: torch.device,
+      dtype: torch.dtype = torch.float32,
+  ) -> bool:
+    """Whether the arena can serve caches of the given size."""
+    return (
+        self.key.shape[1] == batch_size
+        and self.key.shape[2] >= cache_size
+        and self.key.device == torch.device(device)
+        and self.key.dtype == dtype
+    )
+
+  @property
+  def nbytes(self) -> int:
+    """Bytes of the keys, values and scales held by the arena."""
+    num_layers, batch_size, cache_size, num_heads, head_dim = self.key.shape
+    return decode_cache_bytes(
+        num_layers=num_layers,
+        batch_size=batch_size,
+        cache_size=cache_size,
+        num_heads=num_heads,
+        head_dim=head_dim,
+        dtype=self.key.dtype,
+    )
+
+  def layer(
+      self,
+      i: int,
+      index: slice | torch.Tensor = slice(None),
+      cache_size: int | None = None,
+  ) -> DecodeCache:
+    """Returns a DecodeCache view of layer `i` and rows `index`."""
+    size = slice(None, cache_size)
+    scales = (
+        (None, None)
+        if self.key_scale is None
+        else (self.key_scale[i, index, size], self.value_scale[i, index, size])
+    )
+    return DecodeCache(
+        next_index=self.next_index[i, index],
+        num_masked=self.num_masked[i, index],
+        key=self.key[i, index, size],
+        value=self.value[i, index, size],
+        key_scale=scales[0],
+        value_scale=scales[1],
+    )
+
+  def checkout(self, cache_size: int) -> list[DecodeCache]:
+    """Resets the arena and returns one DecodeCache view per layer."""
+    self.next_index.zero_()
+    self.num_masked.zero_()
+    return [
+        self.layer(i, cache_size=cache_size) for i in range(self.key.shape[0])
+    ]
 
 
 def update_running_stats(
@@ -74,6 +363,60 @@ def update_running_stats(
   return (w := (new_n, new_mu, new_sigma), w)
 
 
+def cumulative_running_stats(
+    n: torch.Tensor,
+    mu: torch.Tensor,
+    sigma: torch.Tensor,
+    x: torch.Tensor,
+    mask: torch.Tensor,
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+  """Computes the running stats after every patch in one vectorized pass.
+
+  This is equivalent to calling `update_running_stats` once per patch along
+  dim 1 and stacking the results, but uses prefix sums instead of a Python
+  loop. The sums are accumulated in float64 around a per-row reference mean to
+  avoid cancellation.
+
+  Args:
+    n: Number of points seen so far, shape [b].
+    mu: Mean of the points seen so far, shape [b].
+    sigma: Standard deviation of the points seen so far, shape [b].
+    x: Patched inputs of shape [b, num_patches, patch_len].
+    mask: Patched masks of shape [b, num_patches, patch_len].
+
+  Returns:
+    The running n, mu and sigma after each patch, each of shape
+    [b, num_patches].
+  """
+  dtype = x.dtype
+  n, mu, sigma = n.double(), mu.double(), sigma.double()
+  is_legit = torch.logical_not(mask)
+  x = torch.where(is_legit, x.double(), 0.0)
+
+  inc_n = torch.sum(is_legit.double(), dim=-1)
+  cum_n = n[:, None] + torch.cumsum(inc_n, dim=1)
+  total_n = cum_n[:, -1]
+  ref = (n * mu + torch.sum(x, dim=(-1, -2))) / torch.where(
+      total_n == 0, 1.0, total_n
+  )
+
+  centered = torch.where(is_legit, x - ref[:, None, None], 0.0)
+  offset = mu - ref
+  cum_sum = torch.cumsum(torch.sum(centered, dim=-1), dim=1)
+  cum_sum = cum_sum + (n * offset)[:, None]
+  cum_sq_sum = torch.cumsum(torch.sum(centered.square(), dim=-1), dim=1)
+  cum_sq_sum = cum_sq_sum + (n * (sigma.square() + offset.square()))[:, None]
+
+  cum_n_safe = torch.where(cum_n == 0, 1.0, cum_n)
+  centered_mu = cum_sum / cum_n_safe
+  new_mu = torch.where(cum_n == 0, 0.0, ref[:, None] + centered_mu)
+  new_var = torch.where(
+      cum_n == 0, 0.0, cum_sq_sum / cum_n_safe - centered_mu.square()
+  )
+  new_sigma = torch.sqrt(torch.clamp(new_var, min=0.0))
+  return cum_n.to(dtype), new_mu.to(dtype), new_sigma.to(dtype)
+
+
 def revin(
     x: torch.Tensor,
     mu: torch.Tensor,
@@ -92,3 +435,42 @@ def revin(
     return x * sigma + mu
   else:
     return (x - mu) / torch.where(sigma < _TOLERANCE, 1.0, sigma)
+
+
+def mmap_safetensors(
+    path: str,
+) -> tuple[dict[str, torch.Tensor], dict[str, str]]:
+  """Maps a safetensors file into CPU tensors without copying it.
+
+  The file is mapped copy-on-write: the tensors are backed by the page cache,
+  so processes mapping the same file, or forked after mapping it, share the
+  pages, and writes to a tensor stay private to the process.
+
+  Args:
+    path: Path to a safetensors file.
+
+  Returns:
+    The tensors by name, and the metadata of the file.
+  """
+  with open(path, "rb") as f:
+    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+  (header_size,) = struct.unpack("<Q", buffer[:8])
+  header = json.loads(buffer[8 : 8 + header_size])
+  metadata = header.pop("__metadata__", None) or {}
+  data_offset = 8 + header_size
+  tensors = {}
+  for name, info in header.items():
+    dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+    begin, end = info["data_offsets"]
+    itemsize = torch.empty((), dtype=dtype).element_size()
+    if end == begin:
+      tensor = torch.empty(0, dtype=dtype)
+    else:
+      tensor = torch.frombuffer(
+          buffer,
+          dtype=dtype,
+          count=(end - begin) // itemsize,
+          offset=data_offset + begin,
+      )
+    tensors[name] = tensor.reshape(info["shape"])
+  return tensors, metadata
@@ -0,0 +1,105 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared fixtures for the TimesFM 2.5 tests.
+
+The tests run against a randomly initialized, scaled-down copy of the 2.5
+architecture so that they do not need to download the checkpoint.
+"""
+
+import dataclasses
+
+import pytest
+import torch
+
+from timesfm import configs
+from timesfm.timesfm_2p5 import timesfm_2p5_base
+from timesfm.timesfm_2p5 import timesfm_2p5_onnx_export
+from timesfm.timesfm_2p5 import timesfm_2p5_torch
+
+_MODEL_DIMS = 64
+
+TINY_DEFINITION = dataclasses.replace(
+    timesfm_2p5_base.TimesFM_2p5_200M_Definition(),
+    tokenizer=configs.ResidualBlockConfig(
+        input_dims=64,
+        hidden_dims=_MODEL_DIMS,
+        output_dims=_MODEL_DIMS,
+        use_bias=True,
+        activation="swish",
+    ),
+    stacked_transformers=configs.StackedTransformersConfig(
+        num_layers=2,
+        transformer=configs.TransformerConfig(
+            model_dims=_MODEL_DIMS,
+            hidden_dims=_MODEL_DIMS,
+            num_heads=4,
+            attention_norm="rms",
+            feedforward_norm="rms",
+            qk_norm="rms",
+            use_bias=False,
+            use_rotary_position_embeddings=True,
+            ff_activation="swish",
+        ),
+    ),
+    output_projection_point=configs.ResidualBlockConfig(
+        input_dims=_MODEL_DIMS,
+        hidden_dims=_MODEL_DIMS,
+        output_dims=1280,
+        use_bias=False,
+        activation="swish",
+    ),
+    output_projection_quantiles=configs.ResidualBlockConfig(
+        input_dims=_MODEL_DIMS,
+        hidden_dims=_MODEL_DIMS,
+        output_dims=10240,
+        use_bias=False,
+        activation="swish",
+    ),
+)
+
+
+class TinyModule(timesfm_2p5_torch.TimesFM_2p5_200M_torch_module):
+  """The 2.5 module with a tiny transformer stack."""
+
+  config = TINY_DEFINITION
+
+
+def make_tiny_module(seed: int = 0) -> TinyModule:
+  torch.manual_seed(seed)
+  module = TinyModule()
+  with torch.no_grad():
+    for param in module.parameters():
+      param.normal_(0.0, 0.2)
+  return module.eval()
+
+
+@pytest.fixture
+def tiny_module():
+  return make_tiny_module()
+
+
+@pytest.fixture
+def tiny_model(tiny_module):
+  model = timesfm_2p5_torch.TimesFM_2p5_200M_torch()
+  model.model = tiny_module
+  return model
+
+
+@pytest.fixture(scope="session")
+def tiny_onnx_dir(tmp_path_factory):
+  """A directory with the ONNX graphs of `make_tiny_module()`."""
+  path = str(tmp_path_factory.mktemp("onnx"))
+  timesfm_2p5_onnx_export.export(make_tiny_module(), path)
+  return path
@@ -0,0 +1,337 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the TimesFM 2.5 forecasting API."""
+
+import numpy as np
+import pytest
+import safetensors.torch
+import torch
+
+import timesfm
+from timesfm.timesfm_2p5 import timesfm_2p5_base
+from timesfm.timesfm_2p5 import timesfm_2p5_packing
+
+
+def _make_inputs(seed: int = 0) -> list[np.ndarray]:
+  rng = np.random.default_rng(seed)
+  lengths = [40, 300, 17, 256, 90, 500, 64]
+  return [
+      np.sin(np.arange(n) / 7.0) * 5.0 + rng.normal(size=n) + 10.0
+      for n in lengths
+  ]
+
+
+@pytest.mark.parametrize("return_backcast", [False, True])
+def test_bucket_by_length_matches_padded(tiny_model, return_backcast):
+  inputs = _make_inputs()
+  outputs = []
+  for bucket_by_length in [False, True]:
+    tiny_model.compile(
+        timesfm.ForecastConfig(
+            max_context=512,
+            max_horizon=256,
+            per_core_batch_size=2,
+            return_backcast=return_backcast,
+            bucket_by_length=bucket_by_length,
+        )
+    )
+    outputs.append(tiny_model.forecast(horizon=24, inputs=inputs))
+
+  (point, quantiles), (bucketed_point, bucketed_quantiles) = outputs
+  assert bucketed_point.shape == point.shape
+  assert bucketed_quantiles.shape == quantiles.shape
+  if return_backcast:
+    # Backcasts over the padded region differ, so only compare the forecasts.
+    point, bucketed_point = point[:, -24:], bucketed_point[:, -24:]
+    quantiles = quantiles[:, -24:]
+    bucketed_quantiles = bucketed_quantiles[:, -24:]
+  np.testing.assert_allclose(bucketed_point, point, rtol=1e-4, atol=1e-4)
+  np.testing.assert_allclose(
+      bucketed_quantiles, quantiles, rtol=1e-4, atol=1e-4
+  )
+
+
+def _reference_preprocess(x: np.ndarray, max_context: int) -> np.ndarray:
+  value = timesfm_2p5_base.linear_interpolation(
+      timesfm_2p5_base.strip_leading_nans(np.array(x, dtype=np.float64))
+  )
+  return value[-max_context:]
+
+
+def test_preprocess_inputs_matches_per_series_path():
+  rng = np.random.default_rng(1)
+  inputs = [rng.normal(size=n) for n in [0, 1, 5, 37, 100, 260]]
+  inputs[2][:3] = np.nan
+  inputs[3][[0, 10, 11, 12, 36]] = np.nan
+  inputs[4][90:] = np.nan
+  inputs[5][::7] = np.nan
+  inputs.append(np.full(9, np.nan))
+  inputs.append(np.arange(10))
+
+  ragged = timesfm_2p5_base.preprocess_inputs(inputs, max_context=128)
+  assert len(ragged) == len(inputs)
+  assert ragged.lengths[0] == 0
+  for i, x in enumerate(inputs[1:], start=1):
+    expected = _reference_preprocess(x, 128)
+    got = ragged.values[ragged.offsets[i] : ragged.offsets[i + 1]]
+    np.testing.assert_allclose(got, expected.astype(np.float32), rtol=1e-6)
+
+  flat = np.concatenate(inputs[1:])
+  offsets = np.cumsum([0] + [len(x) for x in inputs[1:]])
+  flat_ragged = timesfm_2p5_base.preprocess_inputs(flat, 128, offsets)
+  np.testing.assert_array_equal(flat_ragged.values, ragged.values)
+
+
+def test_ragged_inputs_fill_left_pads():
+  ragged = timesfm_2p5_base.preprocess_inputs(
+      [np.arange(5.0), np.arange(12.0)], max_context=8
+  )
+  values = np.empty((3, 8), dtype=np.float32)
+  masks = np.empty((3, 8), dtype=bool)
+  ragged.fill([1, 0], values, masks)
+  np.testing.assert_array_equal(values[0], np.arange(4.0, 12.0))
+  np.testing.assert_array_equal(values[1], [0, 0, 0, 0, 1, 2, 3, 4])
+  np.testing.assert_array_equal(masks[0], [False] * 8)
+  np.testing.assert_array_equal(masks[1], [True] * 3 + [False] * 5)
+  np.testing.assert_array_equal(masks[2], [True] * 5 + [False] * 3)
+
+
+def test_flip_invariance_matches_two_passes(tiny_model):
+  inputs = _make_inputs()
+  config = dict(
+      max_context=512,
+      max_horizon=256,
+      per_core_batch_size=4,
+      infer_is_positive=False,
+  )
+  tiny_model.compile(
+      timesfm.ForecastConfig(force_flip_invariance=False, **config)
+  )
+  _, quantiles = tiny_model.forecast(horizon=200, inputs=inputs)
+  _, flipped_quantiles = tiny_model.forecast(
+      horizon=200, inputs=[-x for x in inputs]
+  )
+  flipped_quantiles = np.concatenate(
+      [flipped_quantiles[..., :1], flipped_quantiles[..., :0:-1]], axis=-1
+  )
+
+  tiny_model.compile(
+      timesfm.ForecastConfig(force_flip_invariance=True, **config)
+  )
+  _, invariant_quantiles = tiny_model.forecast(horizon=200, inputs=inputs)
+  np.testing.assert_allclose(
+      invariant_quantiles,
+      (quantiles - flipped_quantiles) / 2,
+      rtol=1e-4,
+      atol=1e-4,
+  )
+
+
+@pytest.mark.parametrize("bucket_by_length", [False, True])
+def test_forecast_iter_matches_forecast(tiny_model, bucket_by_length):
+  tiny_model.compile(
+      timesfm.ForecastConfig(
+          max_context=512,
+          max_horizon=128,
+          per_core_batch_size=3,
+          bucket_by_length=bucket_by_length,
+      )
+  )
+  inputs = _make_inputs()
+  point, quantiles = tiny_model.forecast(horizon=64, inputs=inputs)
+
+  batches = list(tiny_model.forecast_iter(64, (x for x in inputs)))
+  assert [len(indices) for indices, _, _ in batches] == [3, 3, 1]
+  indices = np.concatenate([b[0] for b in batches])
+  np.testing.assert_array_equal(indices, np.arange(len(inputs)))
+  np.testing.assert_allclose(
+      np.concatenate([b[1] for b in batches]), point, rtol=1e-4, atol=1e-4
+  )
+  np.testing.assert_allclose(
+      np.concatenate([b[2] for b in batches]), quantiles, rtol=1e-4, atol=1e-4
+  )
+
+
+def test_decode_head_selection_matches_all_heads(tiny_module):
+  rng = np.random.default_rng(0)
+  inputs = torch.as_tensor(rng.normal(size=(3, 256)), dtype=torch.float32)
+  masks = torch.zeros_like(inputs, dtype=torch.bool)
+  masks[0, :100] = True
+  outputs, spread, ar_outputs = tiny_module.decode(384, inputs, masks)
+
+  last_outputs, no_spread, selected_ar_outputs = tiny_module.decode(
+      384,
+      inputs,
+      masks,
+      return_all_patches=False,
+      return_quantile_spread=False,
+  )
+  assert last_outputs.shape == (3, 1, 128, 10)
+  assert no_spread is None
+  torch.testing.assert_close(last_outputs[:, 0], outputs[:, -1])
+  torch.testing.assert_close(selected_ar_outputs, ar_outputs)
+
+  _, last_spread, _ = tiny_module.decode(
+      384, inputs, masks, return_all_patches=False
+  )
+  torch.testing.assert_close(last_spread, spread)
+
+
+def test_decode_stops_at_horizon_bucket(tiny_model):
+  inputs = _make_inputs()
+  tiny_model.compile(
+      timesfm.ForecastConfig(
+          max_context=256,
+          max_horizon=512,
+          per_core_batch_size=8,
+          use_continuous_quantile_head=True,
+      )
+  )
+  _, expected_quantiles = tiny_model.forecast(horizon=140, inputs=inputs)
+
+  steps = []
+  autoregressive_decode = tiny_model.model.autoregressive_decode
+
+  def counting_decode(num_decode_steps, *args):
+    steps.append(num_decode_steps)
+    return autoregressive_decode(num_decode_steps, *args)
+
+  tiny_model.model.autoregressive_decode = counting_decode
+  assert tiny_model.horizon_bucket(12) == 128
+  assert tiny_model.horizon_bucket(140) == 256
+  tiny_model.forecast(horizon=12, inputs=inputs)
+  _, quantiles = tiny_model.forecast(horizon=140, inputs=inputs)
+  assert steps == [0, 1]
+  np.testing.assert_allclose(quantiles, expected_quantiles, rtol=1e-5)
+
+
+def test_partial_batches_decode_only_their_rows(tiny_model):
+  inputs = _make_inputs()
+  tiny_model.compile(
+      timesfm.ForecastConfig(
+          max_context=256, max_horizon=128, per_core_batch_size=8
+      )
+  )
+  expected_point, _ = tiny_model.forecast(horizon=100, inputs=inputs)
+
+  rows = []
+  compiled_decode = tiny_model.compiled_decode
+
+  def counting_decode(horizon, values, masks):
+    rows.append(len(values))
+    return compiled_decode(horizon, values, masks)
+
+  tiny_model.compiled_decode = counting_decode
+  assert [tiny_model.batch_rows(n) for n in [1, 2, 3, 5, 8]] == [1, 2, 4, 8, 8]
+  for i, series in enumerate(inputs[:3]):
+    point, _ = tiny_model.forecast(horizon=100, inputs=[series])
+    np.testing.assert_allclose(
+        point[0], expected_point[i], rtol=1e-5, atol=1e-5
+    )
+  tiny_model.forecast(horizon=100, inputs=inputs[:3])
+  assert rows == [1, 1, 1, 4]
+
+
+@pytest.mark.parametrize("precision", ["bfloat16", "float16"])
+def test_reduced_precision_tracks_float32(tiny_model, precision):
+  inputs = _make_inputs()
+  config = dict(max_context=512, max_horizon=256, per_core_batch_size=8)
+  tiny_model.compile(timesfm.ForecastConfig(**config))
+  expected_point, _ = tiny_model.forecast(horizon=200, inputs=inputs)
+
+  tiny_model.compile(timesfm.ForecastConfig(precision=precision, **config))
+  assert tiny_model.model.tokenizer.hidden_layer.weight.dtype == getattr(
+      torch, precision
+  )
+  point, quantiles = tiny_model.forecast(horizon=200, inputs=inputs)
+  assert point.dtype == np.float32
+  assert np.all(np.isfinite(quantiles))
+  scale = np.std(expected_point, axis=1, keepdims=True)
+  error = np.abs(point - expected_point) / scale
+  assert np.mean(error) < 0.02
+  assert np.max(error) < 0.25
+
+
+@pytest.mark.parametrize("kv_cache_precision", ["float16", "int8"])
+def test_compressed_kv_cache_tracks_float32(tiny_model, kv_cache_precision):
+  inputs = _make_inputs()
+  config = dict(max_context=512, max_horizon=256, per_core_batch_size=8)
+  tiny_model.compile(timesfm.ForecastConfig(**config))
+  expected_point, _ = tiny_model.forecast(horizon=200, inputs=inputs)
+  expected_bytes = tiny_model.decode_cache_bytes()
+
+  tiny_model.compile(
+      timesfm.ForecastConfig(kv_cache_precision=kv_cache_precision, **config)
+  )
+  point, _ = tiny_model.forecast(horizon=200, inputs=inputs)
+  scale = np.std(expected_point, axis=1, keepdims=True)
+  error = np.abs(point - expected_point) / scale
+  assert np.mean(error) < 0.02
+  assert np.max(error) < 0.25
+  arena = tiny_model.model._decode_cache_arena
+  assert arena.nbytes == tiny_model.decode_cache_bytes()
+  ratio = tiny_model.decode_cache_bytes() / expected_bytes
+  assert ratio == (0.5 if kv_cache_precision == "float16" else 0.3125)
+
+
+def test_load_checkpoint_materializes_meta_module(tiny_module, tmp_path):
+  path = str(tmp_path / "model.safetensors")
+  safetensors.torch.save_file(tiny_module.state_dict(), path)
+  with torch.device("meta"):
+    module = type(tiny_module)()
+  assert all(p.is_meta for p in module.parameters())
+
+  module.load_checkpoint(path)
+  assert not any(p.is_meta for p in module.parameters())
+  inputs = torch.randn(2, 256)
+  masks = torch.zeros(2, 256, dtype=torch.bool)
+  for a, b in zip(
+      tiny_module.decode(256, inputs, masks), module.decode(256, inputs, masks)
+  ):
+    torch.testing.assert_close(b, a, rtol=0, atol=0)
+
+
+@pytest.mark.parametrize("use_continuous_quantile_head", [False, True])
+def test_packed_inputs_match_padded(tiny_model, use_continuous_quantile_head):
+  inputs = _make_inputs() + [np.arange(5.0), np.ones(64)]
+  outputs = []
+  for pack_inputs in [False, True]:
+    tiny_model.compile(
+        timesfm.ForecastConfig(
+            max_context=512,
+            max_horizon=384,
+            per_core_batch_size=16,
+            use_continuous_quantile_head=use_continuous_quantile_head,
+            pack_inputs=pack_inputs,
+        )
+    )
+    outputs.append(tiny_model.forecast(horizon=300, inputs=inputs))
+
+  (point, quantiles), (packed_point, packed_quantiles) = outputs
+  np.testing.assert_allclose(packed_point, point, rtol=1e-4, atol=1e-4)
+  np.testing.assert_allclose(packed_quantiles, quantiles, rtol=1e-4, atol=1e-4)
+
+
+def test_packed_layout_fills_rows():
+  lengths = np.array([16, 2, 9, 5, 1, 7, 3])
+  patch_masks = np.arange(16)[None, :] < 16 - lengths[:, None]
+  layout = timesfm_2p5_packing.make_packed_layout(
+      patch_masks, 4, torch.device("cpu")
+  )
+  assert (layout.num_rows, layout.width) == (3, 16)
+  assert layout.source.shape == (lengths.sum(),)
+  segment = layout.segment.numpy()
+  for i, n in enumerate(lengths):
+    assert np.sum(segment == i) == n
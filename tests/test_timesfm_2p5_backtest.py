@@ -0,0 +1,95 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the one-pass rolling-origin backtests."""
+
+import numpy as np
+import pytest
+
+import timesfm
+
+
+def _series() -> list[np.ndarray]:
+  rng = np.random.default_rng(0)
+  return [
+      np.sin(np.arange(400) / 6.0) * 5.0 + rng.normal(size=400) + 10.0,
+      np.cumsum(rng.normal(size=230)) - 20.0,
+  ]
+
+
+@pytest.mark.parametrize("force_flip_invariance", [False, True])
+def test_backtest_matches_forecast_at_every_cutoff(
+    tiny_model, force_flip_invariance
+):
+  config = timesfm.ForecastConfig(
+      max_context=512,
+      max_horizon=128,
+      per_core_batch_size=4,
+      force_flip_invariance=force_flip_invariance,
+      fix_quantile_crossing=True,
+  )
+  tiny_model.compile(config)
+  series = _series()
+  # Cutoffs 100 and 164 share a prefill, 150 needs another patch grid.
+  results = timesfm.backtest(
+      tiny_model.model, series, 24, config, cutoffs=[100, 150, 164, -24]
+  )
+
+  assert [r.cutoffs.tolist() for r in results] == [
+      [100, 150, 164, 376],
+      [100, 150, 164, 206],
+  ]
+  for s, result in zip(series, results):
+    for i, c in enumerate(result.cutoffs):
+      point, quantiles = tiny_model.forecast(horizon=24, inputs=[s[:c]])
+      np.testing.assert_allclose(
+          result.quantile_forecast[i], quantiles[0], rtol=1e-4, atol=1e-4
+      )
+      np.testing.assert_allclose(
+          result.mae[i], np.mean(np.abs(point[0] - s[c : c + 24])), rtol=1e-4
+      )
+      naive = np.mean(np.abs(np.diff(s[:c])))
+      np.testing.assert_allclose(
+          result.mase[i], result.mae[i] / naive, rtol=1e-5
+      )
+  assert np.all(results[0].quantile_loss > 0)
+
+
+def test_backtest_defaults_and_long_series(tiny_model):
+  config = timesfm.ForecastConfig(
+      max_context=128, max_horizon=128, per_core_batch_size=2
+  )
+  series = _series()[0].copy()
+  series[:5] = np.nan
+  series[200] = np.nan
+  rows = []
+  prefill = tiny_model.model.prefill
+
+  def counting_prefill(inputs, *args, **kwargs):
+    rows.append(inputs.shape)
+    return prefill(inputs, *args, **kwargs)
+
+  tiny_model.model.prefill = counting_prefill
+  (result,) = timesfm.backtest(tiny_model.model, [series], 32, config)
+  assert rows == [(2, 384)]
+
+  np.testing.assert_array_equal(result.cutoffs, np.arange(16, 369, 32))
+  assert result.quantile_forecast.shape == (12, 32, 10)
+  assert np.all(np.isfinite(result.quantile_forecast))
+  assert np.all(np.isfinite(result.mae))
+  summary = result.summary()
+  assert set(summary) == {"mae", "mase", "quantile_loss"}
+
+  with pytest.raises(ValueError, match="horizons"):
+    timesfm.backtest(tiny_model.model, [series], 129, config)
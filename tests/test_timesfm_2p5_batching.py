@@ -0,0 +1,68 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the forecast micro-batcher."""
+
+from concurrent import futures
+
+import numpy as np
+import pytest
+
+import timesfm
+
+
+def test_batcher_matches_direct_forecast(tiny_model):
+  tiny_model.compile(
+      timesfm.ForecastConfig(
+          max_context=256, max_horizon=256, per_core_batch_size=4
+      )
+  )
+  rng = np.random.default_rng(0)
+  series = [rng.normal(size=n) + 5.0 for n in [30, 100, 64, 200, 7, 150]]
+  horizons = [12, 48, 12, 256, 30, 1]
+
+  calls = []
+  forecast = tiny_model.forecast
+
+  def counting_forecast(horizon, inputs):
+    calls.append(len(inputs))
+    return forecast(horizon=horizon, inputs=inputs)
+
+  tiny_model.forecast = counting_forecast
+  batcher = timesfm.ForecastBatcher(tiny_model, max_wait_ms=200.0)
+  with futures.ThreadPoolExecutor(max_workers=len(series)) as pool:
+    results = list(pool.map(batcher.forecast, series, horizons))
+  batcher.close()
+
+  assert sum(calls) == len(series)
+  assert len(calls) < len(series)
+  for x, h, (point, quantiles) in zip(series, horizons, results):
+    expected_point, expected_quantiles = forecast(horizon=h, inputs=[x])
+    # Batches of different sizes round differently.
+    np.testing.assert_allclose(
+        point, expected_point[0], rtol=1e-5, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        quantiles, expected_quantiles[0], rtol=1e-5, atol=1e-5
+    )
+
+
+def test_batcher_rejects_invalid_requests(tiny_model):
+  tiny_model.compile(timesfm.ForecastConfig(max_context=64, max_horizon=128))
+  batcher = timesfm.ForecastBatcher(tiny_model)
+  with pytest.raises(ValueError):
+    batcher.submit(np.ones(10), horizon=129)
+  batcher.close()
+  with pytest.raises(RuntimeError):
+    batcher.submit(np.ones(10), horizon=12)
@@ -0,0 +1,151 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the TimesFM 2.5 forecast result cache."""
+
+import os
+import time
+
+import numpy as np
+
+import timesfm
+
+
+def _make_inputs(seed: int = 0) -> list[np.ndarray]:
+  rng = np.random.default_rng(seed)
+  lengths = [40, 300, 17, 256, 90]
+  return [
+      np.sin(np.arange(n) / 7.0) * 5.0 + rng.normal(size=n) + 1.0
+      for n in lengths
+  ]
+
+
+def _compile(model, **kwargs):
+  model.compile(
+      timesfm.ForecastConfig(
+          max_context=512, max_horizon=256, per_core_batch_size=4, **kwargs
+      )
+  )
+
+
+def test_affine_duplicates_hit_and_match_model(tiny_model):
+  _compile(tiny_model, infer_is_positive=False)
+  inputs = _make_inputs()
+  shifted = [3.0 * x - 20.0 for x in inputs]
+  expected_point, expected_quantiles = tiny_model.forecast(64, shifted)
+
+  cache = timesfm.ForecastCache(decimals=3)
+  tiny_model.result_cache = cache
+  tiny_model.forecast(64, inputs)
+  assert (cache.stats.hits, cache.stats.misses) == (0, 5)
+  point, quantiles = tiny_model.forecast(64, shifted)
+  assert (cache.stats.hits, cache.stats.misses) == (5, 5)
+  np.testing.assert_allclose(point, expected_point, rtol=1e-3, atol=1e-3)
+  np.testing.assert_allclose(
+      quantiles, expected_quantiles, rtol=1e-3, atol=1e-3
+  )
+
+  # A different horizon or config does not share entries.
+  tiny_model.forecast(32, inputs)
+  _compile(tiny_model, infer_is_positive=False, fix_quantile_crossing=True)
+  tiny_model.forecast(64, inputs)
+  assert cache.stats.hits == 5
+  assert len(cache) == 15
+
+
+def test_nonnegative_series_only_share_scaled_entries(tiny_model):
+  _compile(tiny_model, infer_is_positive=True)
+  series = np.abs(_make_inputs()[1])
+  cache = timesfm.ForecastCache(decimals=3)
+  keys = [
+      cache.make_key(x, 64, tiny_model.forecast_config)
+      for x in [series, 2.0 * series, series + 1.0]
+  ]
+  assert keys[0].digest == keys[1].digest
+  assert keys[0].digest != keys[2].digest
+
+
+def test_lru_eviction_and_ttl():
+  config = timesfm.ForecastConfig(max_context=128)
+  cache = timesfm.ForecastCache(max_entries=2, ttl_seconds=0.05)
+  keys = [
+      cache.make_key(np.arange(10.0) ** (i + 1), 8, config) for i in range(3)
+  ]
+  for key in keys[:2]:
+    cache.put(key, np.zeros((8, 10)))
+  assert cache.get(keys[0]) is not None
+  cache.put(keys[2], np.zeros((8, 10)))
+  assert cache.stats.evictions == 1
+  assert cache.get(keys[1]) is None
+  assert cache.num_bytes == 2 * 8 * 10 * 4
+
+  time.sleep(0.1)
+  assert cache.get(keys[0]) is None
+  assert cache.stats.expirations == 1
+
+
+def test_disk_tier_is_shared(tmp_path):
+  config = timesfm.ForecastConfig(max_context=128)
+  series = np.linspace(5.0, 9.0, 50)
+  forecast = np.arange(80.0).reshape(8, 10)
+  writer = timesfm.ForecastCache(directory=str(tmp_path), decimals=3)
+  writer.put(writer.make_key(series, 8, config), forecast)
+
+  reader = timesfm.ForecastCache(directory=str(tmp_path), decimals=3)
+  key = reader.make_key(10.0 * series, 8, config)
+  np.testing.assert_allclose(reader.get(key), 10.0 * forecast, rtol=1e-5)
+  assert reader.stats.disk_hits == 1
+  reader.get(key)
+  assert reader.stats.disk_hits == 1
+  assert reader.stats.hits == 2
+
+
+def test_series_are_hashed_exactly_by_default():
+  config = timesfm.ForecastConfig(max_context=128)
+  series = np.linspace(5.0, 9.0, 50)
+  nearby = series + 1e-5 * np.sin(np.arange(50))
+  exact = timesfm.ForecastCache()
+  rounded = timesfm.ForecastCache(decimals=3)
+  assert exact.make_key(series, 8, config) == exact.make_key(series, 8, config)
+  assert (
+      exact.make_key(series, 8, config).digest
+      != exact.make_key(nearby, 8, config).digest
+  )
+  assert (
+      rounded.make_key(series, 8, config).digest
+      == rounded.make_key(nearby, 8, config).digest
+  )
+
+
+def test_disk_tier_is_bounded(tmp_path):
+  config = timesfm.ForecastConfig(max_context=128)
+  forecast = np.zeros((8, 10))
+  cache = timesfm.ForecastCache(directory=str(tmp_path))
+  key = cache.make_key(np.arange(10.0), 8, config)
+  cache.put(key, forecast)
+  file_size = os.path.getsize(cache._path(key.digest))
+
+  cache = timesfm.ForecastCache(
+      directory=str(tmp_path), max_disk_bytes=2 * file_size
+  )
+  keys = [key] + [
+      cache.make_key(np.arange(10.0) ** (i + 2), 8, config) for i in range(2)
+  ]
+  for i, key in enumerate(keys[1:]):
+    os.utime(cache._path(keys[i].digest), (i, i))
+    cache.put(key, forecast)
+  assert sorted(os.listdir(tmp_path)) == sorted(
+      k.digest + ".npy" for k in keys[1:]
+  )
+  assert cache.stats.disk_evictions == 1
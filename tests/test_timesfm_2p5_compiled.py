@@ -0,0 +1,97 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the compiled decode graph cache."""
+
+import logging
+
+import numpy as np
+import pytest
+
+import timesfm
+
+
+def _forecast(model, backend, **kwargs):
+  model.compile(
+      timesfm.ForecastConfig(
+          max_context=256, max_horizon=256, per_core_batch_size=4
+      ),
+      **({"backend": backend} if backend else {}),
+      **kwargs,
+  )
+  return model.forecast(horizon=200, inputs=_inputs())
+
+
+def _inputs():
+  rng = np.random.default_rng(0)
+  return [rng.normal(size=n) + 3.0 for n in [50, 256, 120]]
+
+
+def test_compiled_graphs_match_eager(tiny_model):
+  expected_point, expected_quantiles = _forecast(tiny_model, None)
+  assert tiny_model.compiled_graphs is None
+
+  point, quantiles = _forecast(tiny_model, "eager")
+  # Warmed up for both horizon buckets of every flip-invariant batch size.
+  assert [key[:3] for key in tiny_model.compiled_graphs.keys] == [
+      (batch_size, 256, num_decode_steps)
+      for batch_size in [2, 4, 8]
+      for num_decode_steps in [0, 1]
+  ]
+  np.testing.assert_allclose(point, expected_point, rtol=1e-5, atol=1e-5)
+  np.testing.assert_allclose(
+      quantiles, expected_quantiles, rtol=1e-5, atol=1e-5
+  )
+
+
+def test_failed_compilation_falls_back_to_eager(tiny_model, caplog):
+  expected_point, _ = _forecast(tiny_model, None)
+
+  def failing_backend(graph_module, example_inputs):
+    raise RuntimeError("Unsupported.")
+
+  point, _ = _forecast(tiny_model, failing_backend, warmup=False)
+  graphs = tiny_model.compiled_graphs
+  assert graphs.keys
+  assert graphs.eager_keys == graphs.keys
+  np.testing.assert_allclose(point, expected_point, rtol=1e-5, atol=1e-5)
+
+  # Shapes that fell back run eagerly once, without compiling again.
+  calls = []
+  run_decode = tiny_model.model.run_decode
+
+  def counted_run_decode(*args, **kwargs):
+    calls.append(args[:2])
+    return run_decode(*args, **kwargs)
+
+  tiny_model.model.run_decode = counted_run_decode
+  caplog.clear()
+  with caplog.at_level(logging.WARNING):
+    point, _ = tiny_model.forecast(horizon=200, inputs=_inputs())
+  assert not [r for r in caplog.records if r.levelno >= logging.WARNING]
+  assert len(calls) == 1
+  np.testing.assert_allclose(point, expected_point, rtol=1e-5, atol=1e-5)
+
+
+def test_runtime_errors_are_not_compile_failures(tiny_model):
+  def failing_at_runtime(graph_module, example_inputs):
+    def run(*args):
+      raise ValueError("Bad input.")
+
+    return run
+
+  with pytest.raises(ValueError, match="Bad input"):
+    _forecast(tiny_model, failing_at_runtime, warmup=False)
+  assert tiny_model.compiled_graphs.keys
+  assert not tiny_model.compiled_graphs.eager_keys
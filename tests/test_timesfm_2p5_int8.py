@@ -0,0 +1,90 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the int8 quantized model."""
+
+import numpy as np
+import pytest
+import torch
+from torch import nn
+
+import timesfm
+from timesfm.timesfm_2p5 import timesfm_2p5_int8
+from timesfm.torch import quantization
+
+
+def test_int8_linear_matches_float_linear():
+  torch.manual_seed(0)
+  linear = nn.Linear(64, 48)
+  layer = quantization.Int8Linear.from_linear(linear)
+  x = torch.randn(3, 5, 64)
+  expected = linear(x)
+  actual = layer(x)
+  assert actual.shape == expected.shape
+  error = torch.max(torch.abs(actual - expected))
+  assert error < 0.02 * torch.max(torch.abs(expected))
+
+
+def test_int8_linear_falls_back_without_int8_gemm(monkeypatch):
+  torch.manual_seed(0)
+  layer = quantization.Int8Linear.from_linear(nn.Linear(64, 48))
+  x = torch.randn(3, 5, 64)
+  expected = layer(x)
+  monkeypatch.setattr(quantization, "_HAS_INT_MM", False)
+  torch.testing.assert_close(layer(x), expected)
+
+
+def test_int8_model_rejects_lower_precision(tiny_module):
+  model = timesfm.TimesFM_2p5_200M_torch_int8()
+  model.model = tiny_module
+  timesfm_2p5_int8.quantize_module(model.model)
+  with pytest.raises(ValueError, match="float32"):
+    model.compile(
+        timesfm.ForecastConfig(
+            max_context=256, max_horizon=128, precision="bfloat16"
+        )
+    )
+  assert model.model.stacked_xf[0].ff0.weight_scale.dtype == torch.float32
+
+
+def test_int8_model_tracks_float_and_round_trips(tiny_module, tmp_path):
+  config = timesfm.ForecastConfig(
+      max_context=256, max_horizon=128, per_core_batch_size=4
+  )
+  rng = np.random.default_rng(0)
+  inputs = [
+      np.sin(np.arange(n) / 5.0) + rng.normal(size=n) * 0.1
+      for n in [100, 256, 40]
+  ]
+  model = timesfm.TimesFM_2p5_200M_torch_int8()
+  model.model = tiny_module
+  model.compile(config)
+  expected_point, _ = model.forecast(horizon=64, inputs=inputs)
+
+  timesfm_2p5_int8.quantize_module(model.model)
+  assert isinstance(model.model.stacked_xf[0].ff0, quantization.Int8Linear)
+  model.compile(config)
+  point, quantiles = model.forecast(horizon=64, inputs=inputs)
+  scale = np.std(expected_point, axis=1, keepdims=True)
+  assert np.mean(np.abs(point - expected_point) / scale) < 0.05
+
+  path = str(tmp_path / "model_int8.safetensors")
+  model.save_quantized(path)
+  loaded = timesfm.TimesFM_2p5_200M_torch_int8()
+  loaded.model = type(model.model)()
+  loaded.load_quantized(path)
+  loaded.compile(config)
+  loaded_point, loaded_quantiles = loaded.forecast(horizon=64, inputs=inputs)
+  np.testing.assert_array_equal(loaded_point, point)
+  np.testing.assert_array_equal(loaded_quantiles, quantiles)
@@ -0,0 +1,95 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parity tests of the onnxruntime backend against the torch backend."""
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnxscript")
+
+import timesfm  # pylint: disable=g-import-not-at-top
+
+
+def _make_inputs(seed: int = 0) -> list[np.ndarray]:
+  rng = np.random.default_rng(seed)
+  lengths = [40, 300, 17, 256, 90, 500, 64]
+  return [
+      np.sin(np.arange(n) / 7.0) * 5.0 + rng.normal(size=n) + 10.0
+      for n in lengths
+  ]
+
+
+def test_decode_matches_torch_module(tiny_onnx_dir, tiny_module):
+  model = timesfm.TimesFM_2p5_200M_onnx()
+  model.load_checkpoint(tiny_onnx_dir)
+  inputs = torch.randn(3, 384)
+  masks = torch.zeros(3, 384, dtype=torch.bool)
+  masks[1, :100] = True
+
+  expected = tiny_module.decode(400, inputs, masks)
+  actual = model.decode(400, inputs.numpy(), masks.numpy())
+  assert actual[2].shape == (3, 3, 128, 10)
+  for a, b in zip(expected, actual):
+    np.testing.assert_allclose(b, a.numpy(), rtol=1e-3, atol=1e-3)
+
+
+@pytest.mark.parametrize(
+    "flags",
+    [
+        dict(),
+        dict(force_flip_invariance=False, return_backcast=True),
+        dict(use_continuous_quantile_head=True, fix_quantile_crossing=True),
+    ],
+)
+def test_forecast_matches_torch_backend(tiny_onnx_dir, tiny_model, flags):
+  config = dict(
+      max_context=512,
+      max_horizon=256,
+      per_core_batch_size=4,
+      normalize_inputs=True,
+      **flags,
+  )
+  tiny_model.compile(timesfm.ForecastConfig(**config))
+  expected_point, expected_quantiles = tiny_model.forecast(
+      horizon=200, inputs=_make_inputs()
+  )
+
+  model = timesfm.TimesFM_2p5_200M_onnx()
+  model.load_checkpoint(tiny_onnx_dir)
+  model.compile(timesfm.ForecastConfig(**config))
+  point, quantiles = model.forecast(horizon=200, inputs=_make_inputs())
+  np.testing.assert_allclose(point, expected_point, rtol=1e-3, atol=1e-3)
+  np.testing.assert_allclose(
+      quantiles, expected_quantiles, rtol=1e-3, atol=1e-3
+  )
+
+
+@pytest.mark.parametrize(
+    "flags",
+    [
+        dict(attention_window=16),
+        dict(num_global_patches=2),
+        dict(kv_cache_precision="int8"),
+    ],
+)
+def test_compile_rejects_unsupported_flags(tiny_onnx_dir, flags):
+  model = timesfm.TimesFM_2p5_200M_onnx()
+  model.load_checkpoint(tiny_onnx_dir)
+  with pytest.raises(ValueError, match="ONNX graphs do not support"):
+    model.compile(
+        timesfm.ForecastConfig(max_context=512, max_horizon=256, **flags)
+    )
@@ -0,0 +1,82 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for data-parallel decoding."""
+
+import numpy as np
+import safetensors.torch
+
+import timesfm
+from timesfm.timesfm_2p5 import timesfm_2p5_parallel
+
+
+def test_cpu_workers_match_single_process(tiny_model):
+  config = timesfm.ForecastConfig(
+      max_context=256, max_horizon=256, per_core_batch_size=2
+  )
+  rng = np.random.default_rng(0)
+  series = [rng.normal(size=n) + 5.0 for n in [30, 100, 64, 200, 7]]
+
+  tiny_model.compile(config)
+  assert tiny_model.parallel_decoder is None
+  expected_point, expected_quantiles = tiny_model.forecast(
+      horizon=200, inputs=series
+  )
+
+  config.num_cpu_workers = 2
+  tiny_model.compile(config)
+  assert isinstance(
+      tiny_model.parallel_decoder, timesfm_2p5_parallel.CpuWorkerPoolDecoder
+  )
+  assert tiny_model.global_batch_size == 4
+  try:
+    point, quantiles = tiny_model.forecast(horizon=200, inputs=series)
+  finally:
+    tiny_model.parallel_decoder.close()
+
+  np.testing.assert_allclose(point, expected_point, rtol=1e-5, atol=1e-5)
+  np.testing.assert_allclose(
+      quantiles, expected_quantiles, rtol=1e-5, atol=1e-5
+  )
+
+
+def test_cpu_workers_map_the_checkpoint(tiny_model, tmp_path):
+  path = str(tmp_path / "model.safetensors")
+  safetensors.torch.save_file(tiny_model.model.state_dict(), path)
+  tiny_model.model.load_checkpoint(path)
+  mapped_path, names = tiny_model.model.mapped_checkpoint()
+  assert mapped_path == path
+  assert set(names) == set(tiny_model.model.state_dict())
+
+  config = timesfm.ForecastConfig(
+      max_context=256, max_horizon=256, per_core_batch_size=2
+  )
+  rng = np.random.default_rng(0)
+  series = [rng.normal(size=n) + 5.0 for n in [30, 100, 64, 200, 7]]
+  tiny_model.compile(config)
+  expected_point, _ = tiny_model.forecast(horizon=200, inputs=series)
+
+  config.num_cpu_workers = 2
+  tiny_model.compile(config)
+  try:
+    point, _ = tiny_model.forecast(horizon=200, inputs=series)
+  finally:
+    tiny_model.parallel_decoder.close()
+
+  # The mapped weights were neither copied to shared memory nor replaced.
+  assert tiny_model.model.mapped_checkpoint()[1] == names
+  assert not any(
+      tiny_model.model.state_dict()[name].is_shared() for name in names
+  )
+  np.testing.assert_allclose(point, expected_point, rtol=1e-5, atol=1e-5)
@@ -0,0 +1,131 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the forecast pipeline profiler."""
+
+import json
+
+import numpy as np
+import pytest
+import torch
+
+import timesfm
+from timesfm.timesfm_2p5 import timesfm_2p5_profiling
+
+
+def _forecast(model):
+  rng = np.random.default_rng(0)
+  return model.forecast(
+      horizon=200, inputs=[rng.normal(size=n) for n in (50, 300, 120)]
+  )
+
+
+@pytest.mark.parametrize("record_memory", [False, True])
+def test_profiler_records_stages_and_layers(
+    tiny_model, tmp_path, record_memory
+):
+  tiny_model.compile(
+      timesfm.ForecastConfig(
+          max_context=256, max_horizon=256, per_core_batch_size=4
+      )
+  )
+  expected = _forecast(tiny_model)
+  modules = tiny_model.model.profiled_modules()
+  with timesfm.Profiler(
+      modules=modules, record_memory=record_memory
+  ) as profiler:
+    actual = _forecast(tiny_model)
+
+  for a, b in zip(expected, actual):
+    np.testing.assert_array_equal(a, b)
+  assert all(not m._forward_hooks for m in modules.values())
+
+  events = {}
+  for event in profiler.events:
+    events.setdefault(event.name, event)
+  assert set(events) == {
+      "forecast",
+      "preprocess",
+      "fill",
+      "decode_batch",
+      "prepare_inputs",
+      "decode",
+      "prefill",
+      "running_stats",
+      "autoregressive_decode",
+      "postprocess",
+      # The quantile head only runs with use_continuous_quantile_head.
+      *(set(modules) - {"output_projection_quantiles"}),
+  }
+  assert events["forecast"].depth == 0
+  assert events["decode"].depth == 2
+  assert events["prefill"].depth == 3
+  assert events["stacked_xf.1"].depth == 4
+  prefill, layer = events["prefill"], events["stacked_xf.1"]
+  assert prefill.start_us <= layer.start_us
+  assert layer.start_us + layer.duration_us <= (
+      prefill.start_us + prefill.duration_us
+  )
+
+  summary = {s.name: s for s in profiler.summary()}
+  assert summary["forecast"] == profiler.summary()[0]
+  # One prefill and one autoregressive step per layer.
+  assert summary["stacked_xf.0"].count == 2
+  if record_memory:
+    assert summary["prefill"].num_tensors > summary["stacked_xf.0"].num_tensors
+    assert summary["prefill"].peak_bytes >= 3 * 256 * 4
+    assert summary["decode"].peak_bytes >= summary["prefill"].peak_bytes
+  else:
+    assert summary["prefill"].num_tensors is None
+  assert "| stacked_xf.0 | 2 |" in profiler.summary_table()
+
+  path = str(tmp_path / "trace.json")
+  profiler.save_chrome_trace(path)
+  with open(path) as f:
+    trace = json.load(f)
+  assert len(trace["traceEvents"]) == len(profiler.events)
+  assert {e["ph"] for e in trace["traceEvents"]} == {"X"}
+
+
+def test_stages_are_no_ops_without_a_profiler():
+  assert timesfm_2p5_profiling.stage("x") is timesfm_2p5_profiling.stage("y")
+  with timesfm.Profiler() as profiler:
+    with timesfm_2p5_profiling.stage("outer"):
+      with timesfm_2p5_profiling.stage("inner"):
+        pass
+    with pytest.raises(RuntimeError, match="already active"):
+      with timesfm.Profiler():
+        pass
+  with timesfm_2p5_profiling.stage("after"):
+    pass
+  assert [(e.name, e.depth) for e in profiler.events] == [
+      ("inner", 1),
+      ("outer", 0),
+  ]
+
+
+def test_profiler_synchronizes_cuda_at_stage_boundaries(monkeypatch):
+  calls = []
+  monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+  monkeypatch.setattr(torch.cuda, "synchronize", lambda: calls.append(1))
+  with timesfm.Profiler() as profiler:
+    with timesfm_2p5_profiling.stage("outer"):
+      with timesfm_2p5_profiling.stage("inner"):
+        pass
+  assert len(calls) == 4
+  with timesfm.Profiler(synchronize=False):
+    with timesfm_2p5_profiling.stage("outer"):
+      pass
+  assert len(calls) == 4
+  assert len(profiler.events) == 2
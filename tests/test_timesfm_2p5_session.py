@@ -0,0 +1,129 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the streaming forecast session."""
+
+import numpy as np
+import pytest
+
+import timesfm
+
+
+def _config(**kwargs) -> timesfm.ForecastConfig:
+  return timesfm.ForecastConfig(
+      max_context=256,
+      max_horizon=256,
+      use_continuous_quantile_head=True,
+      fix_quantile_crossing=True,
+      **kwargs,
+  )
+
+
+@pytest.mark.parametrize(
+    "force_flip_invariance, kv_cache_precision",
+    [(False, "auto"), (True, "auto"), (True, "int8")],
+)
+def test_session_matches_full_forecast(
+    tiny_model, force_flip_invariance, kv_cache_precision
+):
+  config = _config(
+      force_flip_invariance=force_flip_invariance,
+      kv_cache_precision=kv_cache_precision,
+  )
+  tiny_model.compile(config)
+  rng = np.random.default_rng(0)
+  streams = [
+      np.cumsum(rng.normal(size=600)) + 50.0,
+      np.sin(np.arange(600) / 5.0) + rng.normal(size=600) * 0.1,
+  ]
+  starts = [45, 100]
+
+  session = timesfm.ForecastSession(
+      tiny_model.model,
+      [s[:start] for s, start in zip(streams, starts)],
+      config,
+      eviction_patches=1,
+  )
+  ends = list(starts)
+  num_checked = 0
+  for step in [19, 13, 3, 29, 64, 192, 128]:
+    session.append([s[e : e + step] for s, e in zip(streams, ends)])
+    ends = [e + step for e in ends]
+    point, quantiles = session.forecast(horizon=150)
+    assert point.shape == (2, 150)
+    assert quantiles.shape == (2, 150, 10)
+    for i, (s, e) in enumerate(zip(streams, ends)):
+      if session.num_pending[i] == 0:
+        num_checked += 1
+        expected_point, expected_quantiles = tiny_model.forecast(
+            horizon=150, inputs=[s[:e]]
+        )
+        np.testing.assert_allclose(
+            point[i], expected_point[0], rtol=1e-4, atol=1e-4
+        )
+        np.testing.assert_allclose(
+            quantiles[i], expected_quantiles[0], rtol=1e-4, atol=1e-4
+        )
+  assert num_checked == 10
+  assert min(ends) > config.max_context + 200
+
+
+def test_session_forecast_skips_pending_points(tiny_model):
+  config = _config()
+  tiny_model.compile(config)
+  rng = np.random.default_rng(1)
+  streams = [rng.normal(size=200), rng.normal(size=200) + 3.0]
+  session = timesfm.ForecastSession(
+      tiny_model.model, [s[:64] for s in streams], config
+  )
+  _, before = session.forecast(horizon=64)
+  session.append([streams[0][64:74], streams[1][64:96]])
+  assert session.num_pending.tolist() == [10, 0]
+  point, quantiles = session.forecast(horizon=54)
+  np.testing.assert_allclose(quantiles[0], before[0, 10:], rtol=1e-6)
+
+  expected_point, _ = tiny_model.forecast(horizon=54, inputs=[streams[1][:96]])
+  np.testing.assert_allclose(point[1], expected_point[0], rtol=1e-4, atol=1e-4)
+
+
+def test_short_series_next_to_long_ones_append_one_patch(tiny_model):
+  config = _config()
+  tiny_model.compile(config)
+  rng = np.random.default_rng(2)
+  streams = [rng.normal(size=600) + 3.0, rng.normal(size=600) + 3.0]
+  # The short series is padded to the full window of the long one.
+  session = timesfm.ForecastSession(
+      tiny_model.model, [streams[0][:256], streams[1][:32]], config
+  )
+
+  prefilled = []
+  prefill_batch = session._prefill_batch
+
+  def counting_prefill_batch(series, contexts):
+    prefilled.append(series.tolist())
+    return prefill_batch(series, contexts)
+
+  session._prefill_batch = counting_prefill_batch
+  end = 32
+  for _ in range(5):
+    session.append([[], streams[1][end : end + 32]])
+    end += 32
+  # Only the first patch rebuilds the padded short series.
+  assert prefilled == [[1]]
+
+  point, _ = session.forecast(horizon=64)
+  expected_point, _ = tiny_model.forecast(
+      horizon=64, inputs=[streams[1][:end]]
+  )
+  np.testing.assert_allclose(point[1], expected_point[0], rtol=1e-4, atol=1e-4)
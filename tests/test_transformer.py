@@ -0,0 +1,262 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the TimesFM 2.5 torch layers."""
+
+import copy
+
+import pytest
+import torch
+
+from timesfm.torch import transformer
+from timesfm.torch import util
+
+
+def _make_attention(seed: int = 0) -> transformer.MultiHeadAttention:
+  torch.manual_seed(seed)
+  attention = transformer.MultiHeadAttention(num_heads=4, in_features=32)
+  with torch.no_grad():
+    for param in attention.parameters():
+      param.normal_(0.0, 0.3)
+  return attention.eval()
+
+
+def _make_cache(batch_size: int, cache_size: int) -> util.DecodeCache:
+  return util.DecodeCache(
+      next_index=torch.zeros(batch_size, dtype=torch.int32),
+      num_masked=torch.zeros(batch_size, dtype=torch.int32),
+      key=torch.zeros(batch_size, cache_size, 4, 8),
+      value=torch.zeros(batch_size, cache_size, 4, 8),
+  )
+
+
+def test_cached_attention_matches_full_attention():
+  attention = _make_attention()
+  inputs = torch.randn(3, 10, 32)
+  patch_mask = torch.zeros(3, 10, dtype=torch.bool)
+  patch_mask[1, :2] = True
+  patch_mask[2, :5] = True
+
+  with torch.no_grad():
+    expected, _ = attention(inputs, patch_mask=patch_mask)
+    cache = _make_cache(3, 12)
+    prefill, cache = attention(
+        inputs[:, :6], patch_mask=patch_mask[:, :6], decode_cache=cache
+    )
+    step, cache = attention(
+        inputs[:, 6:], patch_mask=patch_mask[:, 6:], decode_cache=cache
+    )
+
+  # Padded query positions attend to nothing, so only compare the others.
+  valid = ~patch_mask
+  torch.testing.assert_close(
+      torch.cat([prefill, step], dim=1)[valid], expected[valid]
+  )
+  assert cache.next_index.tolist() == [10, 10, 10]
+  assert cache.num_masked.tolist() == [0, 2, 5]
+
+
+def test_decode_cache_arena_is_reused(tiny_module):
+  inputs = torch.randn(2, 256)
+  masks = torch.zeros(2, 256, dtype=torch.bool)
+  masks[0, :100] = True
+
+  first = tiny_module.decode(512, inputs, masks)
+  arena = tiny_module._decode_cache_arena
+  shorter = tiny_module.decode(256, inputs, masks)
+  assert tiny_module._decode_cache_arena is arena
+  second = tiny_module.decode(512, inputs, masks)
+  assert tiny_module._decode_cache_arena is arena
+
+  for a, b in zip(first, second):
+    torch.testing.assert_close(a, b)
+  torch.testing.assert_close(shorter[0], first[0])
+  torch.testing.assert_close(shorter[2], first[2][:, :1])
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+@pytest.mark.parametrize("with_padding", [False, True])
+def test_sdpa_backend_matches_eager(use_cache, with_padding):
+  attention = _make_attention()
+  inputs = torch.randn(3, 12, 32)
+  patch_mask = torch.zeros(3, 12, dtype=torch.bool)
+  if with_padding:
+    patch_mask[1, :3] = True
+    patch_mask[2, :12] = True
+
+  outputs = {}
+  for backend in ["eager", "sdpa"]:
+    attention.attention_backend = backend
+    with torch.no_grad():
+      if use_cache:
+        cache = _make_cache(3, 16)
+        prefill, cache = attention(
+            inputs[:, :8], patch_mask=patch_mask[:, :8], decode_cache=cache
+        )
+        step, _ = attention(
+            inputs[:, 8:], patch_mask=patch_mask[:, 8:], decode_cache=cache
+        )
+        outputs[backend] = torch.cat([prefill, step], dim=1)
+      else:
+        outputs[backend], _ = attention(inputs, patch_mask=patch_mask)
+
+  torch.testing.assert_close(
+      outputs["sdpa"], outputs["eager"], rtol=1e-4, atol=1e-5
+  )
+
+
+def test_sdpa_backend_matches_eager_end_to_end(tiny_module):
+  inputs = torch.randn(2, 512)
+  masks = torch.zeros(2, 512, dtype=torch.bool)
+  masks[0, :200] = True
+
+  eager = tiny_module.decode(384, inputs, masks)
+  tiny_module.set_attention_backend("sdpa")
+  sdpa = tiny_module.decode(384, inputs, masks)
+  for a, b in zip(eager, sdpa):
+    torch.testing.assert_close(b, a, rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize("backend", ["eager", "sdpa"])
+def test_layers_share_one_attn_mask(tiny_module, monkeypatch, backend):
+  tiny_module.set_attention_backend(backend)
+  inputs = torch.randn(2, 512)
+  masks = torch.zeros(2, 512, dtype=torch.bool)
+  expected = tiny_module.decode(384, inputs, masks)
+
+  calls = []
+  make_attn_mask = transformer.make_attn_mask
+
+  def counting_make_attn_mask(*args, **kwargs):
+    calls.append(1)
+    return make_attn_mask(*args, **kwargs)
+
+  monkeypatch.setattr(transformer, "make_attn_mask", counting_make_attn_mask)
+  forwards = []
+  tiny_module.register_forward_hook(lambda *_: forwards.append(1))
+  actual = tiny_module.decode(384, inputs, masks)
+  for a, b in zip(expected, actual):
+    torch.testing.assert_close(b, a)
+  # Unpadded sdpa prefills attend causally without a mask.
+  assert len(calls) == len(forwards) - (backend == "sdpa")
+  assert len(forwards) > 1
+
+  calls.clear()
+  tiny_module(torch.randn(2, 8, 32), torch.ones(2, 8, 32, dtype=torch.bool))
+  assert len(calls) == 1
+
+
+def test_rotary_tables_match_computed_sinusoids():
+  computed = transformer.RotaryPositionalEmbedding(embedding_dims=16)
+  tabulated = transformer.RotaryPositionalEmbedding(
+      embedding_dims=16, max_position=64
+  )
+  inputs = torch.randn(3, 20, 4, 16)
+  position = torch.arange(20)[None, :] + torch.tensor([0, -7, 40])[:, None]
+  torch.testing.assert_close(
+      tabulated(inputs, position), computed(inputs, position)
+  )
+
+
+def test_folded_weights_match_original(tiny_module):
+  inputs = torch.randn(2, 512)
+  masks = torch.zeros(2, 512, dtype=torch.bool)
+  masks[0, :200] = True
+  expected = tiny_module.decode(384, inputs, masks)
+
+  tiny_module.fold_weights()
+  layer = tiny_module.stacked_xf[0]
+  assert layer.attn.qkv is not None
+  assert layer.pre_attn_ln.scale is None
+  assert not hasattr(layer.attn, "per_dim_scale")
+  actual = tiny_module.decode(384, inputs, masks)
+  for a, b in zip(expected, actual):
+    torch.testing.assert_close(b, a, rtol=1e-4, atol=1e-4)
+  with pytest.raises(RuntimeError):
+    tiny_module.load_checkpoint("unused.safetensors")
+
+
+@pytest.mark.parametrize("backend", ["eager", "sdpa"])
+@pytest.mark.parametrize("window, num_global", [(4, 0), (4, 2), (7, 3)])
+def test_local_attention_matches_masked_full_attention(
+    backend, window, num_global
+):
+  attention = _make_attention()
+  attention.attention_backend = backend
+  inputs = torch.randn(3, 30, 32)
+  patch_mask = torch.zeros(3, 30, dtype=torch.bool)
+  patch_mask[1, :7] = True
+  patch_mask[2, :28] = True
+  position = torch.arange(30)[None, :] - torch.sum(
+      patch_mask, dim=1, keepdim=True
+  )
+  mask = transformer.make_local_attn_mask(
+      position, position, position < num_global, window, num_global
+  )
+
+  with torch.no_grad():
+    expected, _ = attention(
+        inputs, patch_mask=patch_mask, attn_mask=mask[:, None]
+    )
+    attention.set_attention_window(window, num_global)
+    chunked, _ = attention(inputs, patch_mask=patch_mask)
+    cache = util.RingDecodeCache.create(
+        batch_size=3,
+        num_global=num_global,
+        ring_size=window + 4,
+        num_heads=4,
+        head_dim=8,
+        device=torch.device("cpu"),
+    )
+    outputs = []
+    for start, end in [(0, 18), (18, 22), (22, 26), (26, 30)]:
+      output, cache = attention(
+          inputs[:, start:end],
+          patch_mask=patch_mask[:, start:end],
+          decode_cache=cache,
+      )
+      outputs.append(output)
+    with pytest.raises(ValueError, match="at most 4 patches"):
+      attention(inputs[:, :5], decode_cache=cache)
+
+  valid = position >= 0
+  torch.testing.assert_close(chunked[valid], expected[valid])
+  torch.testing.assert_close(torch.cat(outputs, dim=1)[valid], expected[valid])
+  assert cache.key.shape[1] == num_global + window + 4
+
+
+def test_attention_window_covering_context_matches_full(tiny_module):
+  inputs = torch.randn(2, 512)
+  masks = torch.zeros(2, 512, dtype=torch.bool)
+  masks[0, :200] = True
+  expected = tiny_module.decode(384, inputs, masks)
+
+  tiny_module.set_attention_window(16 + 8)
+  actual = tiny_module.decode(384, inputs, masks)
+  for a, b in zip(expected, actual):
+    torch.testing.assert_close(b, a, rtol=1e-4, atol=1e-4)
+
+
+def test_rotary_tables_fall_back_beyond_context_limit(tiny_module):
+  computed = copy.deepcopy(tiny_module)
+  for layer in computed.stacked_xf:
+    layer.attn.rotary_position_embedding.max_position = 0
+  inputs = torch.randn(1, 16384)
+  masks = torch.zeros(1, 16384, dtype=torch.bool)
+  # The decoded patches go past the context limit of the tables.
+  for a, b in zip(
+      computed.decode(256, inputs, masks),
+      tiny_module.decode(256, inputs, masks),
+  ):
+    torch.testing.assert_close(b, a)
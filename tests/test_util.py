@@ -0,0 +1,110 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the TimesFM torch utilities."""
+
+import pytest
+import safetensors.torch
+import torch
+
+from timesfm.torch import util
+
+
+@pytest.mark.parametrize("with_initial_stats", [False, True])
+def test_cumulative_running_stats_matches_sequential(with_initial_stats):
+  torch.manual_seed(0)
+  b, num_patches, p = 4, 9, 32
+  x = torch.randn(b, num_patches, p) * 3.0
+  x = x + torch.linspace(0, 50, b)[:, None, None]
+  x[1] = x[1] * 1e-3 + 120.0
+  mask = torch.zeros(b, num_patches, p, dtype=torch.bool)
+  mask[0, :3] = True
+  mask[0, 3, :10] = True
+  mask[2] = True
+  mask[3, :, ::5] = True
+
+  if with_initial_stats:
+    n = torch.tensor([0.0, 64.0, 5.0, 100.0])
+    mu = torch.tensor([0.0, 119.0, -2.0, 4.0])
+    sigma = torch.tensor([0.0, 0.5, 1.0, 3.0])
+  else:
+    n = mu = sigma = torch.zeros(b)
+
+  expected = [], [], []
+  state = n, mu, sigma
+  for i in range(num_patches):
+    state, _ = util.update_running_stats(*state, x[:, i], mask[:, i])
+    for values, stat in zip(expected, state):
+      values.append(stat)
+
+  got = util.cumulative_running_stats(n, mu, sigma, x, mask)
+  for g, e in zip(got, expected):
+    torch.testing.assert_close(g, torch.stack(e, dim=1), rtol=1e-5, atol=1e-5)
+
+
+def test_mmap_safetensors_matches_safetensors(tmp_path):
+  tensors = {
+      "a": torch.randn(3, 4),
+      "b": torch.randn(5).to(torch.bfloat16),
+      "c": torch.arange(-3, 3, dtype=torch.int8),
+      "empty": torch.zeros(0, 2),
+  }
+  path = str(tmp_path / "tensors.safetensors")
+  safetensors.torch.save_file(tensors, path, metadata={"format": "test"})
+
+  mapped, metadata = util.mmap_safetensors(path)
+  assert metadata == {"format": "test"}
+  assert mapped.keys() == tensors.keys()
+  for name, tensor in tensors.items():
+    assert mapped[name].dtype == tensor.dtype
+    torch.testing.assert_close(mapped[name], tensor, rtol=0, atol=0)
+
+
+def test_quantize_int8_round_trips_within_half_a_step():
+  x = torch.randn(3, 5, 4, 16) * torch.tensor([1e-3, 1.0, 1e3, 0.0])[:, None]
+  values, scale = util.quantize_int8(x)
+  assert values.dtype == torch.int8
+  assert scale.shape == (3, 5, 4, 1)
+  error = torch.abs(values * scale - x)
+  assert torch.all(error <= scale / 2 + 1e-6 * torch.abs(x))
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float16, torch.int8])
+def test_decode_cache_arena_accounts_for_its_memory(dtype):
+  arena = util.DecodeCacheArena(
+      num_layers=3,
+      batch_size=2,
+      cache_size=7,
+      num_heads=4,
+      head_dim=16,
+      device=torch.device("cpu"),
+      dtype=dtype,
+  )
+  tensors = [arena.key, arena.value, arena.key_scale, arena.value_scale]
+  assert arena.nbytes == sum(
+      t.numel() * t.element_size() for t in tensors if t is not None
+  )
+
+  cache = arena.checkout(5)[1]
+  key, value = torch.randn(2, 2, 2, 4, 16).unbind(0)
+  cache.store(
+      torch.arange(2)[:, None], torch.tensor([[0, 1], [3, 4]]), key, value
+  )
+  loaded_key, loaded_value = cache.load(torch.float32)
+  assert loaded_key.shape == (2, 5, 4, 16)
+  tolerance = {torch.float32: 0, torch.float16: 2e-3, torch.int8: 2e-2}[dtype]
+  torch.testing.assert_close(
+      loaded_value[1, 3:5], value[1], rtol=0, atol=tolerance
+  )
+  assert torch.any(arena.value[1, 1, 3:5] != 0)
@@ -365,6 +365,7 @@ def fetch_data(symbol: str, period: str, adjust: str, only_today: bool, logs: li
 _MODEL = None
 _CFG = None
 _LOCK = None
+_BATCHER = None
 
 _FONT_READY = False
 
@@ -409,7 +410,7 @@ def _ensure_cn_font():
 _ensure_cn_font()
 
 def _ensure_model_loaded():
-    global _MODEL, _CFG, _LOCK
+    global _MODEL, _CFG, _LOCK, _BATCHER
     if _LOCK is None:
         import threading
         _LOCK = threading.Lock()
@@ -426,15 +427,16 @@ def _ensure_model_loaded():
                     force_flip_invariance=True,
                     infer_is_positive=True,
                     fix_quantile_crossing=True,
+                    per_core_batch_size=8,  # 并发请求合并为一个批次
                 )
                 _MODEL.compile(_CFG)
+                # 后台微批处理：收集数毫秒内的并发请求，合并为一次 forecast 调用
+                _BATCHER = timesfm.ForecastBatcher(_MODEL, max_wait_ms=5.0)
 
 def run_forecast(series: np.ndarray, horizon: int):
     _ensure_model_loaded()
-    # 预测时序列化访问，避免并发造成资源冲突
-    with _LOCK:
-        point, quant = _MODEL.forecast(horizon=horizon, inputs=[series])
-    return point[0], quant[0]
+    # 并发请求由微批处理器合并执行，模型只在其后台线程中被调用
+    return _BATCHER.forecast(series, horizon)
 
 def plot_chart(history: np.ndarray, pred: np.ndarray, q: np.ndarray):
     _ensure_cn_font()
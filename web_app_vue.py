@@ -399,6 +399,7 @@ def normalize_symbol(symbol: str, market: str = 'auto') -> str:
 _MODEL = None
 _CFG = None
 _LOCK = None
+_BATCHER = None
 _FONT_READY = False
 
 # 强制使用 CPU
@@ -420,7 +421,7 @@ def _ensure_cn_font():
 _ensure_cn_font()
 
 def _ensure_model_loaded():
-    global _MODEL, _CFG, _LOCK
+    global _MODEL, _CFG, _LOCK, _BATCHER
     if _LOCK is None:
         import threading
         _LOCK = threading.Lock()
@@ -449,9 +450,12 @@ def _ensure_model_loaded():
                         force_flip_invariance=False,  # 股票数据有方向性，不强制翻转不变性
                         infer_is_positive=True,  # 股价通常为正值
                         fix_quantile_crossing=True,  # 修复分位数交叉问题
+                        per_core_batch_size=8,  # 并发请求合并为一个批次
                     )
                     print("正在编译模型...")
                     _MODEL.compile(_CFG)
+                    # 后台微批处理：收集数毫秒内的并发请求，合并为一次 forecast 调用
+                    _BATCHER = timesfm.ForecastBatcher(_MODEL, max_wait_ms=5.0)
                     print("✅ TimesFM 模型加载完成")
                 except Exception as e:
                     print(f"❌ 模型加载失败: {e}")
@@ -462,11 +466,10 @@ def _ensure_model_loaded():
 def run_forecast(series: np.ndarray, horizon: int):
     _ensure_model_loaded()
     try:
-        with _LOCK:
-            if _MODEL is None or _MODEL.compiled_decode is None:
-                raise RuntimeError("模型未正确加载或编译")
-            point, quant = _MODEL.forecast(horizon=horizon, inputs=[series])
-        return point[0], quant[0]
+        if _MODEL is None or _MODEL.compiled_decode is None:
+            raise RuntimeError("模型未正确加载或编译")
+        # 并发请求由微批处理器合并执行，模型只在其后台线程中被调用
+        return _BATCHER.forecast(series, horizon)
     except Exception as e:
         print(f"预测过程中出错: {e}")
         import traceback